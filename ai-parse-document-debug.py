@@ -8,6 +8,31 @@
 # MAGIC
 # MAGIC 変更履歴:
 # MAGIC - `input_file` が未設定の場合、入力ディレクトリ内の全ファイルを処理します。
+# MAGIC - ページ→要素のインデックスを一度だけ構築し、ページごとの描画コストをそのページの要素数のみに依存させました。
+# MAGIC - ページ画像を表示幅に縮小し、JPEG/WebP/PNGで再エンコードして埋め込むようにしました（`image_format`、`image_quality`、`retina` オプション）。
+# MAGIC - インタラクティブビューアでレンダリング済みページのHTMLをLRUキャッシュし、表示済みページへの移動を即時化しました。
+# MAGIC - ナビゲーション操作ごとにレンダリングが1回だけ行われるようにしました（ウィジェット間の変更通知ループの抑制、スライダー操作のデバウンス）。
+# MAGIC - 表示中のページの前後と次のドキュメントの最初のページをバックグラウンドで事前レンダリングするようにしました。
+# MAGIC - `ingestion_mode` に `stream` を追加し、解析結果を1ドキュメントずつ取り込みながら表示できるようにしました。
+# MAGIC - 解析結果を生のJSONのまま保持し、ドキュメントセレクタで選択されたときにだけデコードするようにしました。
+# MAGIC - `query_mode` に `pages` を追加し、選択ページの絞り込みをSparkクエリ内で行えるようにしました。
+# MAGIC - `parse_cache_path` を追加し、新規または変更されたファイルのみを解析するようにしました。
+# MAGIC - `export_batch_html` を追加し、バッチ内の全ドキュメントを静的HTMLファイルとして並列に書き出せるようにしました。
+# MAGIC - ページ画像をファイルに書き出してURLで参照する `image_mode="external"` を追加しました。ブラウザは `/Volumes/...` のようなファイルパスを取得できないため、外部参照は `image_base_url` にHTTPのURL（静的HTMLの書き出しでは相対パス）を明示した場合のみ有効です。既定はノートブックのビューアで確実に表示できる埋め込みモードのままです。
+# MAGIC - バウンディングボックスを1つのSVGで描画し、ツールチップを1つのノードで共有するオーバーレイ（`overlay_mode="svg"`）を追加しました。ツールチップの表示にスクリプトを使うため、既定はスクリプトなしで動作する従来のCSSホバー（`overlay_mode="css"`）のままです。
+# MAGIC - ページ切り替えをブラウザ側で行い、カーネルを経由しない `render_ai_parse_output_client` を追加しました。ページ画像は `image_workers` のスレッドプールで並行して読み込み、ペイロードには `page_byte_budget`・`output_byte_budget` と同じ劣化段階を適用して、収まらないページは省略して報告します。
+# MAGIC - テーブル要素は先頭 `table_preview_rows` 行のプレビューと残りの行数を表示するようにしました。テーブル全体はセル出力に含めず、外部参照モード（`image_mode="external"`、バッチのHTML書き出しなど）では別ファイルに書き出して要素リストからリンクします。
+# MAGIC - 要素リストを仮想化し、先頭の `element_list_window` 件のみを描画して残りをスクロールで読み込めるようにしました（要素タイプのフィルタチップ付き）。スクリプトの実行が必要なためオプトインで、既定では全件を描画します。
+# MAGIC - 要素のツールチップとリストの内容をドキュメントごとに1回だけレンダリングして再利用するようにしました（比較用の `benchmark_element_rendering` を追加）。
+# MAGIC - 合成ドキュメントでレンダラーを計測する `run_renderer_benchmarks` を追加しました（結果はJSONで保存し、`compare_benchmark_results` でバージョン間を比較できます）。
+# MAGIC - 解析SQL、収集、デコード、画像I/O、エンコード、オーバーレイ、要素リスト、表示の所要時間をドキュメント・ページごとに計測し、要約パネルとビューアに表示するようにしました（`pipeline_timings.write_jsonl(path)` で記録を書き出せます）。
+# MAGIC - ページごと（`page_byte_budget`）とセルごと（`output_byte_budget`、既定16MB）の出力サイズの上限を追加しました。上限を超えるページは画像の品質・解像度、ツールチップ、要素リストの順に劣化させ、それでも収まらないページは省略して報告します。
+# MAGIC - bboxをドキュメントごとに一度だけ列指向のNumPy配列（`BoxTable`）に正規化し、ページ単位の選択・スケーリング・無効なbboxの除外・ラベル位置の計算をベクトル化しました。
+# MAGIC - ページ選択をソート済みの区間リストにコンパイルし（`PageSelection`）、"10-"（最後まで）、"-3"（最後の3ページ）と、`type=table`・`has:figure`・`text:...` の要素の述語に対応しました。インタラクティブビューアに「絞り込み」欄（`page_filter`）を追加し、一致するページだけを移動できるようにしました。
+# MAGIC - 全ドキュメントの要素の `content` と `description` に対するCJK対応のバイグラム転置インデックス（`DocumentSearchIndex`）を追加しました。`render_ai_parse_search(parsed_results, "請求金額")` でドキュメント・ページ・要素ID・bboxのヒットを一覧し、選択したヒットをbboxを強調表示した状態でビューアで開けます（`collect` モードの結果、リスト、`DocumentRegistry`、`stream` モードで可視化のセルが作成したレジストリを渡せます）。
+# MAGIC - ドキュメントあたりのページ数、ページあたりの要素数、要素タイプの分布、テーブル・図の数、メッセージ別のエラー、要素のないページをSparkで集計するバッチ統計ダッシュボードを追加しました（`batch_statistics`）。ドライバには集計結果のみを取得するため、数万ドキュメントのディレクトリでも利用できます。
+# MAGIC - 複数ページのレンダリングで、ページ画像の読み込み・縮小・エンコードをスレッドプール（`image_workers`、既定4）で表示順に先読みするようにしました。ページは準備ができた順ではなく表示順に1ページずつ表示され、高レイテンシのボリュームでもファイルごとの待ち時間が重なります。
+# MAGIC - ページ画像の寸法の取得と読み込みを1回のファイル読み込みにまとめました（`_read_page_image`）。寸法は画素データをデコードせずにヘッダーから取得してパスと更新日時ごとに記憶し、読み込んだ内容は縮小・エンコード、埋め込み、書き出し、出力予算による再エンコードで共有します。
 # MAGIC
 # MAGIC ## 概要
 # MAGIC このノートブックは、Databricksの `ai_parse_document` 関数の出力を分析する**ビジュアルデバッグインターフェース**を提供します。解析されたドキュメントをインタラクティブなバウンディングボックス付きで表示し、各領域から抽出された内容を確認できます。
@@ -41,6 +66,31 @@
 # MAGIC - "1-5": ページ範囲（両端含む、1始まり）
 # MAGIC - "1,3,5": 特定ページのリスト（1始まり）
 # MAGIC - "1-3,7,10-12": 範囲と個別ページの混在
+# MAGIC - "10-": 指定ページから最後まで、"-3": 最後の3ページ
+# MAGIC - "type=table" / "has:figure": その要素タイプを含むページ（"type=table|figure" でいずれか）、"text:合計": その文字列を含む要素があるページ。範囲と組み合わせると範囲内で絞り込みます（例: "1-20,type=table"）
+# MAGIC - 要素の述語は `query_mode` が `pages` の場合もSpark側では評価せず、ページ範囲のみを絞り込みます。インタラクティブビューアでは「絞り込み」欄で同じ形式の指定を使い、一致するページだけを移動できます
+# MAGIC
+# MAGIC ### 4. `ingestion_mode`
+# MAGIC - **説明**: 解析結果をドライバに取り込む方法
+# MAGIC - `collect`（デフォルト）: 全ドキュメントの結果を一括で取得してから表示します
+# MAGIC - `stream`: 結果を1ドキュメントずつ取得し、最初のドキュメントが届いた時点で表示を開始します。残りはバックグラウンドで読み込まれ、ドキュメントセレクタに順次追加されます。取得した結果は生のJSONのまま圧縮してレジストリに保持され（同時にデコードするのは数ドキュメントのみ）、後続のセル（検索や書き出し）ではこのレジストリ（`parsed_results`）を再利用できます。ディレクトリ全体を処理する場合など、結果がドライバのメモリに収まらない場合に使用してください
+# MAGIC
+# MAGIC ### 5. `query_mode`
+# MAGIC - **説明**: 解析結果をSparkからどの範囲で取得するか
+# MAGIC - `document`（デフォルト）: ドキュメント全体を取得します
+# MAGIC - `pages`: `page_selection` で選択したページの `pages` と、そのページ上のバウンディングボックスを持つ要素のみをSpark側で抽出して取得します。大きなドキュメントの特定ページだけをデバッグする場合に転送量を大幅に削減できます
+# MAGIC
+# MAGIC ### 6. `parse_cache_path`
+# MAGIC - **説明**: 解析結果を永続化するDeltaテーブルのパス（空の場合はキャッシュを使用しません）
+# MAGIC - **例**: `/Volumes/catalog/schema/volume/parse_cache/`
+# MAGIC - **備考**: ファイルのパス、サイズ、更新日時と解析オプションが一致する場合はキャッシュ済みの結果を再利用し、新規または変更されたファイルのみ `ai_parse_document` で解析します
+# MAGIC
+# MAGIC ### 7. `batch_statistics`
+# MAGIC - **説明**: 解析結果全体のバッチ統計ダッシュボードを表示するかどうか
+# MAGIC - `auto`（デフォルト）: `parse_cache_path` を指定した場合のみ、キャッシュテーブルを対象に集計します（`ai_parse_document` を再実行しません）
+# MAGIC - `on`: 常に集計します。キャッシュを使用しない場合は集計のために `ai_parse_document` がもう一度実行されます
+# MAGIC - `off`: 集計しません
+# MAGIC - **備考**: 集計はSparkで行い、`page_selection` と `query_mode` に関係なく全ドキュメント・全ページが対象です
 # MAGIC
 # MAGIC ## 利用手順
 # MAGIC
@@ -73,12 +123,20 @@ dbutils.widgets.text("schema", "")
 dbutils.widgets.text("volume", "")
 dbutils.widgets.text("input_file", "")
 dbutils.widgets.text("page_selection", "all")
+dbutils.widgets.dropdown("ingestion_mode", "collect", ["collect", "stream"])
+dbutils.widgets.dropdown("query_mode", "document", ["document", "pages"])
+dbutils.widgets.text("parse_cache_path", "")
+dbutils.widgets.dropdown("batch_statistics", "auto", ["auto", "on", "off"])
 
 catalog = dbutils.widgets.get("catalog")
 schema = dbutils.widgets.get("schema")
 volume = dbutils.widgets.get("volume")
 input_file = dbutils.widgets.get("input_file")
 page_selection = dbutils.widgets.get("page_selection")
+ingestion_mode = dbutils.widgets.get("ingestion_mode")
+query_mode = dbutils.widgets.get("query_mode")
+parse_cache_path = dbutils.widgets.get("parse_cache_path")
+batch_statistics = dbutils.widgets.get("batch_statistics")
 
 # COMMAND ----------
 
@@ -95,53 +153,1185 @@ image_output_path = f"/Volumes/{catalog}/{schema}/{volume}/output/"
 # - "1-5": ページ範囲（両端含む、1始まり）
 # - "1,3,5": 特定ページのリスト（1始まり）
 # - "1-3,7,10-12": 範囲と個別ページの混在
+# - "10-" / "-3": 指定ページから最後まで / 最後の3ページ
+# - "type=table"、"has:figure"、"text:合計": 要素タイプや内容を含むページ（範囲と組み合わせ可能）
 page_selection = f"{page_selection}"
 
+# COMMAND ----------
+
+# DBTITLE 1,解析ヘルパー関数のロード
+# 解析クエリを組み立てるヘルパー関数の読み込み
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# ai_parse_document v2.0 の出力のうち、デバッガが使用するフィールドのみのスキーマ（要素の射影）
+PARSED_DOCUMENT_SCHEMA = (
+    "STRUCT<document: STRUCT<"
+    "pages: ARRAY<STRUCT<id: INT, image_uri: STRING>>, "
+    "elements: ARRAY<STRUCT<id: INT, type: STRING, content: STRING, description: STRING, "
+    "bbox: ARRAY<STRUCT<coord: ARRAY<DOUBLE>, page_id: INT>>>>>>"
+)
+
+
+class PageSelection:
+    """ページ選択文字列をページ範囲と要素の述語にコンパイルしたもの。
+
+    カンマ区切りで以下の指定を組み合わせられます:
+        - "3"、"1-5": ページ番号とページ範囲（1始まり、両端含む）
+        - "10-": ページ10から最後まで
+        - "-3": 最後の3ページ
+        - "type=table"、"has:figure": その要素タイプを含むページ（"type=table|figure" でいずれか）
+        - "text:合計": 内容または説明にその文字列を含む要素があるページ（大文字小文字を区別しない）
+
+    ページ範囲どうしは和集合になり（範囲の指定がない場合はすべてのページ）、
+    述語はそのすべてを満たすページに絞り込みます。
+
+    引数:
+        page_selection: ページ選択文字列。None または "all" ですべてのページ
+    """
+
+    # "type=table"、"has:figure"、"text:合計" 形式の述語
+    predicate_pattern = re.compile(r"^([A-Za-z]+)\s*[=:]\s*(.*)$", re.DOTALL)
+
+    def __init__(self, page_selection: Optional[str]):
+        self.text = page_selection
+        # (開始, 終了) の1始まりの範囲。開始が負の場合は最後から数えたページ数、終了が None の場合は最後まで
+        self.ranges: List[Tuple[int, Optional[int]]] = []
+        # 述語ごとの要素タイプの候補（いずれかを含むページに一致）
+        self.types: List[Set[str]] = []
+        # 小文字にした検索文字列
+        self.texts: List[str] = []
+
+        if page_selection is None or page_selection.strip().lower() in ("", "all"):
+            return
+
+        for part in page_selection.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            # ページ番号で始まる指定は述語の判定を省く
+            predicate = None if part[0].isdigit() or part[0] == "-" else self.predicate_pattern.match(part)
+            key, value = (predicate.group(1).lower(), predicate.group(2)) if predicate else ("", "")
+            if key in ("type", "has"):
+                types = {t.strip().lower() for t in value.split("|") if t.strip()}
+                if types:
+                    self.types.append(types)
+                else:
+                    print(f"警告: ページ選択の述語 '{part}' に要素タイプがありません")
+                continue
+            if key == "text":
+                if value.strip():
+                    self.texts.append(value.strip().lower())
+                continue
+            try:
+                if part.startswith("-"):
+                    # 最後のNページ（Nは1以上）
+                    count = int(part[1:])
+                    if count < 1:
+                        raise ValueError(part)
+                    self.ranges.append((-count, None))
+                elif "-" in part:
+                    start, end = (value.strip() for value in part.split("-", 1))
+                    self.ranges.append((int(start), int(end) if end else None))
+                else:
+                    self.ranges.append((int(part), int(part)))
+            except ValueError:
+                print(f"警告: ページ選択 '{part}' が無効です")
+
+    @property
+    def has_predicates(self) -> bool:
+        """要素タイプや内容の述語を含むかどうか。"""
+        return bool(self.types or self.texts)
+
+    def intervals(self, total_pages: int) -> List[Tuple[int, int]]:
+        """ページ範囲を0始まりの半開区間 [開始, 終了) のソート済みリストに変換します。
+
+        範囲は total_pages に収まるよう切り詰め、重なりや隣接する区間は結合します。
+        ページ範囲の指定がない場合はすべてのページを1つの区間で返します。
+        """
+        if not self.ranges:
+            return [(0, total_pages)] if total_pages > 0 else []
+
+        bounds = []
+        for start, end in self.ranges:
+            first = total_pages + start if start < 0 else start - 1
+            stop = total_pages if end is None or end > total_pages else end
+            if first < 0:
+                first = 0
+            if first < stop:
+                bounds.append((first, stop))
+
+        merged: List[Tuple[int, int]] = []
+        for first, stop in sorted(bounds):
+            if merged and first <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+            else:
+                merged.append((first, stop))
+        return merged
+
+    def matches(self, page_entry: Dict[str, Any]) -> bool:
+        """ページインデックスの1ページ分のエントリが述語をすべて満たすかどうかを返します。
+
+        要素タイプはページごとの事前計算済みのタイプ別カウントで判定し、
+        内容の述語はタイプの条件を満たしたページの要素だけを調べます。
+        """
+        type_counts = page_entry["type_counts"]
+        page_types = {elem_type.lower() for elem_type in type_counts}
+        if not all(types & page_types for types in self.types):
+            return False
+        for text in self.texts:
+            if not any(
+                text in str(entry["element"].get(field) or "").lower()
+                for entry in page_entry["entries"]
+                for field in ("content", "description")
+            ):
+                return False
+        return True
+
+    def to_sql_predicate(self, column: str) -> Optional[str]:
+        """ページ範囲を0始まりのページIDに対するSQL述語に変換します。
+
+        最後から数える範囲や終端のない範囲は size(document.pages) を使って表します。
+        要素の述語はSQLに変換しないため、ドライバ側で絞り込みます。
+
+        戻り値:
+            SQL述語の文字列。すべてのページを選択する場合はNone
+        """
+        conditions: List[str] = []
+        for start, end in self.ranges:
+            # 1ベースから0ベースに変換
+            first = f"size(document.pages) - {-start}" if start < 0 else str(start - 1)
+            if end is None:
+                conditions.append(f"({column} >= {first})")
+            elif start == end:
+                conditions.append(f"({column} = {first})")
+            else:
+                conditions.append(f"({column} BETWEEN {first} AND {end - 1})")
+
+        if not conditions:
+            return None
+        return " OR ".join(conditions)
+
+
+def page_selection_to_sql_predicate(page_selection: Optional[str], column: str) -> Optional[str]:
+    """ページ選択文字列を0始まりのページIDに対するSQL述語に変換します。
+
+    引数:
+        page_selection: ページ選択文字列（"all"、"3"、"1-5"、"10-"、"-3"、"1-3,7,type=table" など）
+        column: ページIDを表すSQL式（例: "p.id"）
+
+    戻り値:
+        SQL述語の文字列。すべてのページを選択する場合やページ範囲の指定がない場合はNone
+    """
+    return PageSelection(page_selection).to_sql_predicate(column)
+
+
+def build_page_pushdown_sql(source_sql: str, page_selection: Optional[str]) -> str:
+    """解析クエリの結果を選択ページのみに絞り込むSQLを組み立てます。
+
+    source_sql は path と parsed_json 列を返すクエリである必要があります。選択されたページの
+    pages と、選択ページ上のbboxのみを残した elements をSpark側で抽出するため、
+    ドライバに転送されるのは必要な部分だけになります。ページはIDを保持したまま絞り込み、
+    元のページ数を document.page_count に残します（ビューアはページIDで選択し直します）。
+    エラー結果はそのまま返されます。
+
+    引数:
+        source_sql: path, parsed_json を返すSQL
+        page_selection: ページ選択文字列
+
+    戻り値:
+        path, parsed_json を返すSQL。すべてのページを選択する場合は source_sql をそのまま返します
+    """
+    page_predicate = page_selection_to_sql_predicate(page_selection, "p.id")
+    if page_predicate is None:
+        return source_sql
+    bbox_predicate = page_selection_to_sql_predicate(page_selection, "b.page_id")
+
+    return f'''
+with source_results AS (
+{source_sql}
+),
+typed_results AS (
+  SELECT
+    path,
+    parsed_json,
+    from_json(parsed_json, '{PARSED_DOCUMENT_SCHEMA}').document AS document
+  FROM source_results
+)
+select
+  path,
+  CASE
+    WHEN document IS NULL THEN parsed_json
+    ELSE concat(
+      '{{"document":',
+      to_json(named_struct(
+        'pages', filter(document.pages, p -> {page_predicate}),
+        'elements', filter(
+          transform(document.elements, e -> named_struct(
+            'id', e.id,
+            'type', e.type,
+            'content', e.content,
+            'description', e.description,
+            'bbox', filter(e.bbox, b -> {bbox_predicate})
+          )),
+          e -> size(e.bbox) > 0
+        ),
+        'page_count', CASE WHEN document.pages IS NULL THEN 0 ELSE size(document.pages) END
+      )),
+      ',"metadata":', coalesce(get_json_object(parsed_json, '$.metadata'), '{{}}'),
+      ',"error_status":', coalesce(get_json_object(parsed_json, '$.error_status'), '[]'),
+      '}}'
+    )
+  END as parsed_json
+from typed_results
+'''
+
+
+# バッチ統計のヒストグラムの区間（両端含む。上限が None の区間は上限なし）
+BATCH_PAGE_BUCKETS = [(0, 0), (1, 1), (2, 5), (6, 20), (21, 100), (101, None)]
+BATCH_ELEMENT_BUCKETS = [(0, 0), (1, 5), (6, 20), (21, 50), (51, 100), (101, None)]
+
+# ai_parse_document のページ単位のエラー
+ERROR_STATUS_SCHEMA = "ARRAY<STRUCT<error_message: STRING, page_id: INT>>"
+
+
+def _bucket_counts_sql(column: str, buckets: List[Tuple[int, Optional[int]]], condition: str = "true") -> str:
+    """区間ごとの行数を配列として集計するSQL式を返します。"""
+    counts = []
+    for low, high in buckets:
+        bound = f"{column} >= {low}" if high is None else f"{column} BETWEEN {low} AND {high}"
+        counts.append(f"count_if({condition} AND {bound})")
+    return f"array({', '.join(counts)})"
+
+
+def build_batch_statistics_sql(
+    source_sql: str, max_error_groups: int = 20, max_empty_pages: int = 20
+) -> Dict[str, str]:
+    """解析結果のバッチ統計を集計するSQLを組み立てます。
+
+    ドキュメントはSpark側で型付きの構造体に変換して集計し、ドライバに返るのは
+    集計結果（数行）のみです。各クエリは source_sql を評価するため、キャッシュ済みの
+    解析結果（parse_cache_path のテーブルなど）を参照するSQLを渡してください。
+
+    引数:
+        source_sql: path, parsed_json を返すSQL
+        max_error_groups: 返すエラーメッセージのグループの最大数（件数の多い順）
+        max_empty_pages: 返す要素のないページの例の最大数
+
+    戻り値:
+        集計名（"documents"、"pages"、"types"、"errors"）をキーとするSQLの辞書
+    """
+    common = f'''
+with source_results AS (
+{source_sql}
+),
+typed_results AS (
+  SELECT
+    path,
+    parsed_json,
+    from_json(parsed_json, '{PARSED_DOCUMENT_SCHEMA}').document AS document,
+    get_json_object(parsed_json, '$.type') AS result_type
+  FROM source_results
+),
+documents AS (
+  SELECT
+    path,
+    document,
+    coalesce(result_type = 'error', false) OR document IS NULL AS is_error,
+    CASE WHEN document.pages IS NULL THEN 0 ELSE size(document.pages) END AS page_count,
+    CASE WHEN document.elements IS NULL THEN 0 ELSE size(document.elements) END AS element_count
+  FROM typed_results
+)'''
+
+    page_percentiles = "percentile_approx(page_count, array(0.5, 0.9)) FILTER (WHERE NOT is_error)"
+    documents_sql = f'''{common}
+select
+  count(*) AS documents,
+  count_if(is_error) AS error_documents,
+  coalesce(sum(page_count), 0) AS pages,
+  coalesce(sum(element_count), 0) AS elements,
+  count_if(NOT is_error AND element_count = 0) AS documents_without_elements,
+  min(page_count) FILTER (WHERE NOT is_error) AS min_pages,
+  avg(page_count) FILTER (WHERE NOT is_error) AS avg_pages,
+  {page_percentiles} AS page_percentiles,
+  max(page_count) FILTER (WHERE NOT is_error) AS max_pages,
+  {_bucket_counts_sql("page_count", BATCH_PAGE_BUCKETS, "NOT is_error")} AS page_histogram
+from documents
+'''
+
+    # ページごとの要素数（bboxがそのページにある要素の数。要素のないページは0）
+    pages_sql = f'''{common},
+pages AS (
+  SELECT d.path, page.id AS page_id
+  FROM documents d
+  LATERAL VIEW explode(d.document.pages) p AS page
+  WHERE NOT d.is_error
+),
+page_elements AS (
+  SELECT d.path, box.page_id AS page_id, count(DISTINCT elem_idx) AS element_count
+  FROM documents d
+  LATERAL VIEW posexplode(d.document.elements) e AS elem_idx, elem
+  LATERAL VIEW explode(elem.bbox) b AS box
+  WHERE NOT d.is_error
+  GROUP BY d.path, box.page_id
+),
+page_counts AS (
+  SELECT p.path, p.page_id, coalesce(pe.element_count, 0) AS element_count
+  FROM pages p
+  LEFT JOIN page_elements pe ON pe.path <=> p.path AND pe.page_id = p.page_id
+)
+select
+  count(*) AS pages,
+  count_if(element_count = 0) AS empty_pages,
+  min(element_count) AS min_elements,
+  avg(element_count) AS avg_elements,
+  percentile_approx(element_count, array(0.5, 0.9)) AS element_percentiles,
+  max(element_count) AS max_elements,
+  {_bucket_counts_sql("element_count", BATCH_ELEMENT_BUCKETS)} AS element_histogram,
+  slice(
+    collect_list(CASE WHEN element_count = 0 THEN named_struct('path', path, 'page', page_id + 1) END),
+    1, {max_empty_pages}
+  ) AS empty_page_samples
+from page_counts
+'''
+
+    types_sql = f'''{common}
+select
+  coalesce(elem.type, 'unknown') AS type,
+  count(*) AS elements,
+  count(DISTINCT d.path) AS documents
+from documents d
+LATERAL VIEW explode(d.document.elements) e AS elem
+WHERE NOT d.is_error
+GROUP BY coalesce(elem.type, 'unknown')
+ORDER BY elements DESC
+'''
+
+    # ドキュメント単位のエラー（解析失敗）と、ai_parse_document のページ単位のエラーをメッセージごとにまとめる
+    errors_sql = f'''{common},
+errors AS (
+  SELECT
+    path,
+    'document' AS scope,
+    coalesce(
+      get_json_object(parsed_json, '$.message'),
+      get_json_object(parsed_json, '$.error'),
+      CASE WHEN parsed_json IS NULL THEN '解析結果がありません' ELSE 'ドキュメントを解析できません' END
+    ) AS message
+  FROM typed_results
+  WHERE coalesce(result_type = 'error', false) OR document IS NULL
+  UNION ALL
+  SELECT path, 'page' AS scope, coalesce(status.error_message, '未知のエラー') AS message
+  FROM typed_results
+  LATERAL VIEW explode(
+    from_json(get_json_object(parsed_json, '$.error_status'), '{ERROR_STATUS_SCHEMA}')
+  ) s AS status
+)
+select
+  scope,
+  message,
+  count(*) AS occurrences,
+  count(DISTINCT path) AS documents,
+  slice(collect_set(path), 1, 3) AS sample_paths
+from errors
+GROUP BY scope, message
+ORDER BY occurrences DESC
+LIMIT {max_error_groups}
+'''
+
+    return {"documents": documents_sql, "pages": pages_sql, "types": types_sql, "errors": errors_sql}
+
+
+def compute_batch_statistics(
+    spark, source_sql: str, max_error_groups: int = 20, max_empty_pages: int = 20
+) -> Dict[str, Any]:
+    """解析結果のバッチ統計をSparkで集計し、集計結果のみをドライバに取得します。
+
+    引数:
+        spark: SparkSession
+        source_sql: path, parsed_json を返すSQL（build_batch_statistics_sql を参照）
+        max_error_groups: 返すエラーメッセージのグループの最大数
+        max_empty_pages: 返す要素のないページの例の最大数
+
+    戻り値:
+        "documents"（ドキュメント単位の集計）、"pages"（ページ単位の集計）、"types"（要素タイプ別の
+        集計のリスト）、"errors"（エラーメッセージ別の集計のリスト）、"page_buckets"、
+        "element_buckets"（ヒストグラムの区間）、"seconds"（集計にかかった時間）を持つ辞書
+    """
+    start = time.perf_counter()
+    queries = build_batch_statistics_sql(source_sql, max_error_groups, max_empty_pages)
+    rows = {
+        name: [row.asDict(recursive=True) for row in spark.sql(query).collect()]
+        for name, query in queries.items()
+    }
+    return {
+        "documents": rows["documents"][0],
+        "pages": rows["pages"][0],
+        "types": rows["types"],
+        "errors": rows["errors"],
+        "page_buckets": BATCH_PAGE_BUCKETS,
+        "element_buckets": BATCH_ELEMENT_BUCKETS,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# 解析結果キャッシュのキー（ファイルが変更されていなければ同じ解析結果を再利用）
+PARSE_CACHE_KEYS = ["path", "length", "modificationTime", "parser_options"]
+
+
+def sql_string_literal(value: Any) -> str:
+    """値をSpark SQLの文字列リテラルに変換します（バックスラッシュと単一引用符をエスケープ）。"""
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def build_parser_options_sql(parser_options: Dict[str, str]) -> str:
+    """ai_parse_document のオプション辞書をSQLの map(...) 式に変換します。"""
+    entries = ", ".join(
+        f"{sql_string_literal(key)}, {sql_string_literal(value)}" for key, value in parser_options.items()
+    )
+    return f"map({entries})"
+
+
+def default_parse_fn(parser_options: Dict[str, str]) -> Callable:
+    """binaryFile のDataFrameに ai_parse_document を適用する関数を返します。"""
+
+    def parse(files_df):
+        return files_df.selectExpr(
+            "path",
+            "length",
+            "modificationTime",
+            f"to_json(ai_parse_document(content, {build_parser_options_sql(parser_options)})) AS parsed_json",
+        )
+
+    return parse
+
+
+def incremental_parse(
+    spark,
+    source_files: str,
+    cache_path: str,
+    parser_options: Dict[str, str],
+    parse_fn: Optional[Callable] = None,
+    cache_format: str = "delta",
+):
+    """新規または変更されたファイルのみを解析し、キャッシュ済みの結果と合わせて返します。
+
+    解析結果は path、length、modificationTime と解析オプションをキーとして cache_path に
+    永続化されます。キーが一致するファイルは ai_parse_document を再実行せずにキャッシュから返します。
+
+    引数:
+        spark: SparkSession
+        source_files: 入力ファイルのパス（globパターン可）
+        cache_path: 解析結果キャッシュのディレクトリ（DeltaまたはParquet）
+        parser_options: ai_parse_document に渡すオプション
+        parse_fn: binaryFile のDataFrame（path, length, modificationTime, content）を受け取り、
+            path, length, modificationTime, parsed_json を返す関数。
+            ローカルでのテスト時はスタブに置き換えられます
+        cache_format: キャッシュの保存形式（"delta" または "parquet"）
+
+    戻り値:
+        path, parsed_json 列を持つDataFrame
+    """
+    from pyspark.sql import functions as F
+
+    if parse_fn is None:
+        parse_fn = default_parse_fn(parser_options)
+    options_key = json.dumps(parser_options, sort_keys=True)
+
+    # 現在の入力ファイル一覧（content 列は選択しないため読み込まれない）
+    listing = (
+        spark.read.format("binaryFile")
+        .load(source_files)
+        .select("path", "length", "modificationTime")
+        .withColumn("parser_options", F.lit(options_key))
+    )
+
+    def load_cache():
+        try:
+            return spark.read.format(cache_format).load(cache_path)
+        except Exception:
+            # キャッシュがまだ存在しない
+            return None
+
+    cached = load_cache()
+    to_parse = (
+        listing
+        if cached is None
+        else listing.join(cached.select(*PARSE_CACHE_KEYS), on=PARSE_CACHE_KEYS, how="left_anti")
+    )
+    paths_to_parse = [row.path for row in to_parse.select("path").distinct().collect()]
+
+    if paths_to_parse:
+        print(f"解析対象: {len(paths_to_parse)} ファイル（キャッシュ済みのファイルはスキップします）")
+        # 対象ファイルのみを読み込んで解析し、キャッシュに追記
+        parsed = parse_fn(spark.read.format("binaryFile").load(paths_to_parse)).withColumn(
+            "parser_options", F.lit(options_key)
+        )
+        parsed.select(*PARSE_CACHE_KEYS, "parsed_json").write.format(cache_format).mode(
+            "append"
+        ).save(cache_path)
+        cached = load_cache()
+    else:
+        print("すべてのファイルがキャッシュ済みです。ai_parse_document は実行されません。")
+
+    # 現在の入力ファイルと一致するキャッシュ済み結果のみを返す（変更・削除されたファイルの古い結果は除外）
+    return (
+        cached.join(listing, on=PARSE_CACHE_KEYS, how="inner")
+        .dropDuplicates(PARSE_CACHE_KEYS)
+        .select("path", "parsed_json")
+    )
+
+
+class StageTimings:
+    """処理ステージ（解析SQL、収集、デコード、画像I/Oなど）の所要時間をドキュメント・ページごとに記録します。
+
+    stage() で計測した時間は、明示的に指定しない限り scope() で設定したドキュメントとページ
+    （スレッドごと）に帰属します。ドキュメントを持たない記録（document=None）はバッチ全体の
+    ステージとして扱われます。記録は to_records() または write_jsonl() で構造化された
+    レコードとして取り出せるため、複数回の実行にわたって収集・比較できます。
+
+    引数:
+        run_id: 記録に付与する実行ID（Noneの場合は開始時刻のUTCタイムスタンプ）
+    """
+
+    # 表示順のステージ名と表示ラベル
+    stage_labels = {
+        "parse_sql": "解析SQL",
+        "collect": "収集",
+        "statistics": "バッチ統計",
+        "decode": "デコード",
+        "image_io": "画像I/O",
+        "encode": "エンコード",
+        "overlay": "オーバーレイ",
+        "list": "要素リスト",
+        "display": "表示",
+    }
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._scope = threading.local()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    @contextmanager
+    def scope(self, document: Any = None, page: Optional[int] = None):
+        """ブロック内で計測したステージを、このスレッドでは指定したドキュメントとページに帰属させます。"""
+        previous = getattr(self._scope, "current", (None, None))
+        self._scope.current = (document, page)
+        try:
+            yield
+        finally:
+            self._scope.current = previous
+
+    @contextmanager
+    def stage(self, name: str, document: Any = None, page: Optional[int] = None):
+        """ブロックの所要時間をステージ name として記録します。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, document, page)
+
+    def record(self, name: str, seconds: float, document: Any = None, page: Optional[int] = None) -> None:
+        """計測済みの所要時間を記録します。document と page を省略した場合は現在のスコープを使用します。"""
+        if document is None and page is None:
+            document, page = getattr(self._scope, "current", (None, None))
+        with self._lock:
+            self._records.append(
+                {
+                    "run_id": self.run_id,
+                    "document": document,
+                    "page": page,
+                    "stage": name,
+                    "seconds": seconds,
+                    "timestamp": time.time(),
+                }
+            )
+
+    def iter_timed(self, iterable: Iterable, name: str) -> Iterator:
+        """各要素の取得にかかった時間を、要素の順番（0始まり）をドキュメントとして記録しながら返します。"""
+        iterator = iter(iterable)
+        index = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.record(name, time.perf_counter() - start, document=index)
+            index += 1
+            yield item
+
+    def totals(self, document: Any = None, page: Optional[int] = None, since: int = 0) -> Dict[str, float]:
+        """ステージごとの合計時間（秒）を表示順で返します。
+
+        引数:
+            document: 対象のドキュメント（バッチ全体のステージは常に含まれます）
+            page: 対象のページ（Noneの場合はドキュメントの全ページ）
+            since: この位置（len() の値）以降に記録されたドキュメントの記録のみを集計
+        """
+        with self._lock:
+            records = list(enumerate(self._records))
+
+        totals: Dict[str, float] = {}
+        for position, rec in records:
+            if rec["document"] is not None:
+                if rec["document"] != document or position < since:
+                    continue
+                if page is not None and rec["page"] not in (None, page):
+                    continue
+            totals[rec["stage"]] = totals.get(rec["stage"], 0.0) + rec["seconds"]
+
+        ordered = {name: totals.pop(name) for name in self.stage_labels if name in totals}
+        ordered.update(totals)
+        return ordered
+
+    def format_row(self, document: Any = None, page: Optional[int] = None, since: int = 0) -> str:
+        """ステージごとの合計時間をコンパクトな1行のHTMLとして返します。"""
+        totals = self.totals(document, page, since)
+        if not totals:
+            return "⏱️ 計測データはありません"
+        items = " | ".join(
+            f"{self.stage_labels.get(name, name)} <strong>{seconds:.2f}s</strong>"
+            for name, seconds in totals.items()
+        )
+        return f"⏱️ {items}"
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """記録をJSONに変換できる辞書のリストとして返します。"""
+        with self._lock:
+            return [dict(rec) for rec in self._records]
+
+    def write_jsonl(self, path: str) -> int:
+        """記録をJSON Lines形式でファイルに追記し、書き込んだレコード数を返します。"""
+        records = self.to_records()
+        with open(path, "a", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+        return len(records)
+
+
 # COMMAND ----------
 
 # DBTITLE 1,ドキュメントパースコードの実行 (少し時間かかります)
 # ドキュメント解析実行コード（時間がかかる場合があります）
 import json
 
+# ai_parse_document() のオプション
+parser_options = {
+    "version": "2.0",
+    "imageOutputPath": image_output_path,
+    "descriptionElementTypes": "*",
+}
+
 # ai_parse_document() を使ったSQL文
 if not input_file:
     source_files = f"/Volumes/{catalog}/{schema}/{volume}/input/*"
-sql = f'''
+
+# 解析SQL・収集から表示までのステージ別所要時間（ビューアの要約パネルに表示）
+pipeline_timings = StageTimings()
+
+if parse_cache_path:
+    # 新規または変更されたファイルのみを解析し、キャッシュ済みの結果と合わせる
+    with pipeline_timings.stage("parse_sql"):
+        incremental_parse(
+            spark, source_files, parse_cache_path, parser_options
+        ).createOrReplaceTempView("parsed_documents_cached")
+    sql = "select path, parsed_json from parsed_documents_cached"
+else:
+    sql = f'''
 with parsed_documents AS (
   SELECT
     path,
-    ai_parse_document(content
-     ,
-    map(
-     'version', '2.0',
-     'imageOutputPath', '{image_output_path}',
-     'descriptionElementTypes', '*'
-    )
-  ) as parsed
+    ai_parse_document(content, {build_parser_options_sql(parser_options)}) as parsed
   FROM
-    read_files('{source_files}', format => 'binaryFile')
+    read_files({sql_string_literal(source_files)}, format => 'binaryFile')
 )
 select path, to_json(parsed) as parsed_json from parsed_documents
 '''
 
-parsed_results = [json.loads(row.parsed_json) for row in spark.sql(sql).collect()]
+# バッチ統計は選択ページに関係なく解析結果全体を対象に集計
+batch_source_sql = sql
+
+if query_mode == "pages":
+    # 選択ページの絞り込みと要素の射影をSpark側で行い、必要な部分だけをドライバに転送
+    sql = build_page_pushdown_sql(sql, page_selection)
+
+with pipeline_timings.stage("parse_sql"):
+    parsed_df = spark.sql(sql)
+
+if ingestion_mode == "stream":
+    # 結果をドライバに一括で集めず、1ドキュメントずつ取得するイテレータ
+    # （ビューアは最初のドキュメントが届いた時点で表示を開始します。取得時間はドキュメントごとに記録）。
+    # 可視化のセルで DocumentRegistry に登録しながら読み込み、後続のセルはそのレジストリを再利用する
+    parsed_results = pipeline_timings.iter_timed(parsed_df.toLocalIterator(), "collect")
+else:
+    # 各行（path, parsed_json）を生のJSONのまま保持し、デコードはビューアで選択時に行う
+    with pipeline_timings.stage("collect"):
+        parsed_results = parsed_df.collect()
 
 # COMMAND ----------
 
 # DBTITLE 1,デバッガー関数のロード
 # デバッガ関数の読み込み
 import base64
+import bisect
+import copy
+import hashlib
+import html as html_lib
 import io
 import json
+import multiprocessing
 import os
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
-
+import pickle
+import re
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
 from IPython.display import HTML, display
 from PIL import Image
 
 
+class BoxTable:
+    """ドキュメントの全bboxを列指向のNumPy配列として保持します。
+
+    各行は1つのbboxで、page_id、x1、y1、x2、y2、element（要素インデックス）、
+    type_code（types のインデックス）、valid（座標が4つ以上あるか）の列を持ちます。
+    行はページ順、同じページ内ではドキュメント順に並ぶため、1ページ分の行や
+    1ページ内の1要素分の行は連続した範囲になります。
+
+    引数:
+        elements: ドキュメントの要素リスト
+    """
+
+    def __init__(self, elements: List[Dict]):
+        page_ids: List[int] = []
+        coords: List[float] = []
+        owners: List[int] = []
+        type_codes: List[int] = []
+        type_slots: Dict[str, int] = {}
+        invalid = [float("nan")] * 4
+
+        # 要素とbboxを一度だけ走査して列に展開（座標は1本の平坦なリストに積む）
+        for elem_idx, elem in enumerate(elements):
+            bboxes = elem.get("bbox") or []
+            if not bboxes:
+                continue
+            type_code = type_slots.setdefault(elem.get("type", "unknown"), len(type_slots))
+            for bbox in bboxes:
+                coord = bbox.get("coord", [])
+                page_ids.append(bbox.get("page_id", 0))
+                coords.extend(coord[:4] if len(coord) >= 4 else invalid)
+            owners.extend([elem_idx] * len(bboxes))
+            type_codes.extend([type_code] * len(bboxes))
+
+        # ページ順に並べ替え（安定ソートのためページ内はドキュメント順のまま）
+        page_id = np.asarray(page_ids, dtype=np.int32)
+        order = np.argsort(page_id, kind="stable")
+        coord_array = np.asarray(coords, dtype=np.float64).reshape(-1, 4)[order]
+        self.types: List[str] = list(type_slots)
+        self.page_id = page_id[order]
+        self.x1 = np.ascontiguousarray(coord_array[:, 0])
+        self.y1 = np.ascontiguousarray(coord_array[:, 1])
+        self.x2 = np.ascontiguousarray(coord_array[:, 2])
+        self.y2 = np.ascontiguousarray(coord_array[:, 3])
+        self.element = np.asarray(owners, dtype=np.int32)[order]
+        self.type_code = np.asarray(type_codes, dtype=np.int16)[order]
+        self.valid = ~np.isnan(self.x1)
+
+    def __len__(self) -> int:
+        return len(self.page_id)
+
+    @property
+    def nbytes(self) -> int:
+        """列の配列が使用するバイト数。"""
+        return sum(
+            column.nbytes
+            for column in (self.page_id, self.x1, self.y1, self.x2, self.y2, self.element, self.type_code, self.valid)
+        )
+
+    def runs(self) -> Iterator[Tuple[int, int, int, int, int, int]]:
+        """同じページの同じ要素が続く行の範囲ごとに
+        (page_id, 要素インデックス, type_code, 開始行, 終了行, 有効なbboxの数) を返します。
+        """
+        if not len(self):
+            return
+        changed = (np.diff(self.page_id) != 0) | (np.diff(self.element) != 0)
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        stops = np.append(starts[1:], len(self))
+        valid_counts = np.add.reduceat(self.valid.astype(np.int32), starts)
+        yield from zip(
+            self.page_id[starts].tolist(),
+            self.element[starts].tolist(),
+            self.type_code[starts].tolist(),
+            starts.tolist(),
+            stops.tolist(),
+            valid_counts.tolist(),
+        )
+
+    def coords(self, start: int, stop: int) -> np.ndarray:
+        """行の範囲内の有効なbboxの座標を (n, 4) の配列で返します。"""
+        valid = self.valid[start:stop]
+        return np.column_stack(
+            (self.x1[start:stop][valid], self.y1[start:stop][valid], self.x2[start:stop][valid], self.y2[start:stop][valid])
+        )
+
+    def scaled(self, start: int, stop: int, scale_factor: float) -> Dict[str, np.ndarray]:
+        """行の範囲内のbboxを表示座標にスケーリングし、描画できるものだけを返します。
+
+        戻り値:
+            "row"（行番号）、"x"、"y"、"width"、"height"、"label_y"（ボックスの上、
+            上端に近い場合は内側に配置するラベルのベースライン）を持つ辞書
+        """
+        x = self.x1[start:stop] * scale_factor
+        y = self.y1[start:stop] * scale_factor
+        width = (self.x2[start:stop] - self.x1[start:stop]) * scale_factor
+        height = (self.y2[start:stop] - self.y1[start:stop]) * scale_factor
+
+        # 座標が不足しているボックスと、幅または高さが0以下のボックスを除外
+        keep = self.valid[start:stop] & (width > 0) & (height > 0)
+        x, y, width, height = x[keep], y[keep], width[keep], height[keep]
+        return {
+            "row": np.flatnonzero(keep) + start,
+            "x": x,
+            "y": y,
+            "width": width,
+            "height": height,
+            "label_y": np.where(y >= 14, y - 4, y + 11),
+        }
+
+
+class _TablePreviewParser(HTMLParser):
+    """テーブルHTMLを1回だけ走査し、列数・行数と先頭 max_rows 行のプレビューHTMLを取り出します。
+
+    プレビューは元のタグ文字列をそのまま連結して組み立てるため、先頭の行は元のHTMLと
+    同一になります。入れ子のテーブルの行は外側のセルの一部として扱います。
+    """
+
+    def __init__(self, max_rows: int):
+        super().__init__(convert_charrefs=False)
+        self.max_rows = max_rows
+        self.row_count = 0
+        self.column_count = 0
+        self.parts: List[str] = []
+        self._table_depth = 0
+        self._in_row = False
+        self._keep_row = True
+
+    def feed_tail(self, data: str, table_depth: int) -> None:
+        """解析を打ち切った行の後ろに続くHTML（閉じタグなど）を、深さ table_depth の行の外として解析します。"""
+        self.reset()
+        self._in_row = False
+        self._table_depth = table_depth
+        self.feed(data)
+
+    def _emit(self, text: str) -> None:
+        # 行の外（table/thead/tbodyのタグや行間の空白）は常に、行の中は先頭 max_rows 行のみ出力
+        if not self._in_row or self._keep_row:
+            self.parts.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._table_depth += 1
+        elif tag == "tr" and self._table_depth <= 1:
+            self.row_count += 1
+            self._in_row = True
+            self._keep_row = self.row_count <= self.max_rows
+        elif tag in ("th", "td") and self._table_depth <= 1 and self.row_count == 1:
+            self.column_count += 1
+        self._emit(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        self._emit(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        self._emit(f"</{tag}>")
+        if tag == "table":
+            self._table_depth -= 1
+        elif tag == "tr" and self._table_depth <= 1:
+            self._in_row = False
+
+    def handle_data(self, data):
+        self._emit(data)
+
+    def handle_entityref(self, name):
+        self._emit(f"&{name};")
+
+    def handle_charref(self, name):
+        self._emit(f"&#{name};")
+
+
+class ImageSizeCache:
+    """(画像パス, 更新日時) から画像寸法へのスレッドセーフなLRUキャッシュ。
+
+    プロセスプールのワーカーに渡す場合（pickle）は、ロックと内容を持たない空のキャッシュになります。
+
+    引数:
+        limit: 保持する寸法の最大数
+    """
+
+    def __init__(self, limit: int = 4096):
+        self.limit = limit
+        self._sizes: "OrderedDict[Tuple[str, float], Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, float]) -> Optional[Tuple[int, int]]:
+        with self._lock:
+            size = self._sizes.get(key)
+            if size is not None:
+                self._sizes.move_to_end(key)
+            return size
+
+    def put(self, key: Tuple[str, float], size: Tuple[int, int]) -> None:
+        with self._lock:
+            self._sizes[key] = size
+            while len(self._sizes) > self.limit:
+                self._sizes.popitem(last=False)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"limit": self.limit}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["limit"])
+
+
+class PageImageLoader:
+    """選択ページの画像を表示順に先読みし、スレッドプールで並行して準備します。
+
+    先読みは window ページ分に制限され、get() でページを受け取るたびに次のページのジョブを
+    追加します。表示側はページを順番に受け取るため、準備済みのページから順に表示しつつ、
+    ファイルごとの待ち時間は後続のページの読み込みと重なります。
+
+    引数:
+        load_fn: (ページキー, 画像URI) を受け取り、準備した画像を返す関数
+        targets: 表示順の (ページキー, 画像URI) のリスト
+        max_workers: スレッド数
+        window: 先読みする最大ページ数（Noneの場合は max_workers の2倍）
+    """
+
+    def __init__(
+        self,
+        load_fn: Callable[[Any, str], Dict[str, Any]],
+        targets: List[Tuple[Any, str]],
+        max_workers: int = 4,
+        window: Optional[int] = None,
+    ):
+        self.load_fn = load_fn
+        self._pending = deque(targets)
+        self._window = window or max_workers * 2
+        self._futures: Dict[Any, Future] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="page-image"
+        )
+        self._fill()
+
+    def _fill(self) -> None:
+        while self._pending and len(self._futures) < self._window:
+            key, image_uri = self._pending.popleft()
+            self._futures[key] = self._executor.submit(self.load_fn, key, image_uri)
+
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        """ページの準備の完了を待って結果を返します。先読みしていないページや失敗した場合はNoneを返します。"""
+        future = self._futures.pop(key, None)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+        finally:
+            self._fill()
+
+    def shutdown(self) -> None:
+        """未着手のジョブをキャンセルし、スレッドプールを停止します。"""
+        self._pending.clear()
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False)
+
+
+class SummaryFragment(str):
+    """ステージ別所要時間の行を後から埋め込める、要約とレジェンドのHTMLフラグメント。
+
+    文字列としては所要時間の行が空の要約です。レンダリングの完了後に with_timings() で
+    所要時間の行を含む静的なHTMLを作り直せます（render_document は同じ display_id の出力を置き換えます）。
+
+    引数:
+        html: 所要時間の行の位置に placeholder を含むHTML
+        document_key: 所要時間を集計するドキュメントのキー
+    """
+
+    placeholder = "<!--stage-timings-->"
+
+    def __new__(cls, html: str, document_key: Any = None):
+        fragment = super().__new__(cls, html)
+        fragment.document_key = document_key
+        return fragment
+
+    def with_timings(self, timing_row: str) -> str:
+        """所要時間の行を埋め込んだHTMLを返します。"""
+        return str(self).replace(self.placeholder, timing_row, 1)
+
+
 class DocumentRenderer:
-    def __init__(self):
+    # Pillowの保存フォーマットごとのMIMEタイプ
+    image_mime_types = {
+        "JPEG": "image/jpeg",
+        "PNG": "image/png",
+        "WEBP": "image/webp",
+    }
+
+    # HTML属性用エスケープの変換表（str.translate で1回の走査で置換）
+    attribute_escape_table = str.maketrans(
+        {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;", "\n": "<br>"}
+    )
+
+    # スタイルを適用するテーブルタグ（1回の走査で全タグを置換）
+    table_tag_pattern = re.compile(r"<(?:table|thead|th|td)>")
+
+    # 解析を打ち切った後の行数を数えるための<table>と<tr>の開始・終了タグ（入れ子の深さを追跡する）
+    table_structure_pattern = re.compile(r"<(/?)(table|tr)\b[^>]*>", re.IGNORECASE)
+
+    # ツールチップ用（True）と要素リスト用（False）のテーブルタグの置換先
+    table_tag_styles = {
+        # ツールチップ用のコンパクトスタイリング（ツールチップテーブルのために利用可能な全幅を使用）
+        True: {
+            "<table>": '<table style="width: 100%; border-collapse: collapse; margin: 5px 0; font-size: 10px;">',
+            "<th>": '<th style="border: 1px solid #ddd; padding: 4px; background: #f8f9fa; color: #333; font-weight: bold; text-align: left; font-size: 10px;">',
+            "<td>": '<td style="border: 1px solid #ddd; padding: 4px; color: #333; font-size: 10px;">',
+            "<thead>": '<thead style="background: #e9ecef;">',
+        },
+        # 要素リスト用のフルスタイリング
+        False: {
+            "<table>": '<table style="width: 100%; border-collapse: collapse; margin: 10px 0; font-size: 13px;">',
+            "<th>": '<th style="border: 1px solid #ddd; padding: 8px; background: #f5f5f5; font-weight: bold; text-align: left;">',
+            "<td>": '<td style="border: 1px solid #ddd; padding: 8px;">',
+            "<thead>": '<thead style="background: #f0f0f0;">',
+        },
+    }
+
+    # 出力が予算を超えたときに順に（累積して）適用する劣化段階: (上書きする属性, レポートに表示する説明)。
+    # 数値の属性は現在の値より小さい場合のみ上書きします
+    degradation_levels = [
+        ({"image_quality": 60}, "画像品質を60に下げました"),
+        ({"retina": False, "image_quality": 40}, "画像を等倍・品質40にしました"),
+        ({"image_scale": 0.6}, "画像の解像度を60%に下げました"),
+        ({"tooltip_max_chars": 150, "table_preview_rows": 3}, "ツールチップとテーブルのプレビューを切り詰めました"),
+        ({"collapse_element_list": True}, "要素リストを折りたたみました"),
+    ]
+
+    # (画像パス, 更新日時) -> 画像寸法。寸法はレンダリングオプションに依存しないため、
+    # すべてのレンダラー（劣化させた設定のコピーを含む）で共有し、同じファイルのヘッダーの解析は一度だけ
+    _image_sizes = ImageSizeCache(limit=4096)
+
+    def __init__(
+        self,
+        image_format: str = "JPEG",
+        image_quality: int = 85,
+        retina: bool = False,
+        max_display_width: int = 1024,
+        image_mode: str = "inline",
+        image_export_dir: Optional[str] = None,
+        image_base_url: Optional[str] = None,
+        overlay_mode: str = "css",
+        element_list_window: Optional[int] = None,
+        table_preview_rows: Optional[int] = 10,
+        timings: Optional[StageTimings] = None,
+        page_byte_budget: Optional[int] = None,
+        output_byte_budget: Optional[int] = 16 * 1024 * 1024,
+        highlight_elements: Optional[Dict[Any, Iterable[int]]] = None,
+        image_workers: int = 4,
+    ):
+        """
+        引数:
+            image_format: ページ画像の出力フォーマット（"JPEG"、"WEBP"、"PNG"、
+                または元のファイルをそのまま埋め込む "original"）
+            image_quality: JPEG/WebPのエンコード品質（1-100）
+            retina: Trueの場合、表示幅の2倍の解像度で画像を出力（高DPIディスプレイ向け）
+            max_display_width: 注釈付き画像の最大表示幅（px）
+            image_mode: "inline"（base64のdata URIとして埋め込む。既定）または
+                "external"（image_export_dir に一度だけ書き出し、image_base_url のURLで参照する）
+            image_export_dir: 外部参照モードで画像を書き出すディレクトリ
+            image_base_url: 外部参照モードで画像を参照するURLのプレフィックス。image_export_dir を
+                配信するHTTPのURL（静的HTMLの書き出しではHTMLからの相対パス）を指定する。ブラウザは
+                /Volumes/... のようなファイルパスを取得できないため、指定しない場合は埋め込みモードを使用
+            overlay_mode: "css"（bboxごとにツールチップを持つdivを生成し、純粋なCSSのホバーで表示。
+                Databricksの出力で確実に動作する既定の方式）または "svg"（1つのSVGとスクリプトで
+                表示する共有ツールチップ。出力は小さいがスクリプトの実行が必要）
+            element_list_window: 要素リストでHTMLとして一度に描画する要素数。残りは
+                スクロールまたは「さらに表示」で同じ件数ずつ読み込み、要素タイプのフィルタチップを表示する。
+                残りの要素とフィルタはスクリプトの実行が必要なため、既定（Noneまたは0）では全件を描画
+            table_preview_rows: テーブル要素のツールチップと要素リストに表示する先頭の行数。
+                外部参照モードでは要素リストからテーブル全体のファイルにリンクする（Noneまたは0の場合はテーブル全体を表示）
+            timings: ステージ別の所要時間を記録する StageTimings（Noneの場合は新しく作成）
+            page_byte_budget: 1ページ分（注釈付き画像と要素リスト）の出力バイト数の上限。
+                超える場合は degradation_levels の順に画像や要素リストを劣化させる（Noneの場合は無制限）
+            output_byte_budget: 1回のレンダリング（1セル）の出力バイト数の上限。Databricksは大きな
+                セル出力を切り詰めるため、残りの予算に収まらないページは劣化させ、それでも収まらない
+                ページは省略する（Noneの場合は無制限）
+            highlight_elements: ドキュメントのキー（iter_render_fragments の document_key）から
+                強調表示する要素インデックスへの辞書。検索ヒットをビューアで開く場合などに使用
+            image_workers: 複数ページのレンダリングで、ページ画像の読み込み・縮小・エンコードを
+                HTMLの組み立てより先に並行して行うスレッド数（1以下の場合は1ページずつ順に処理）
+        """
+        self.image_format = image_format.upper()
+        self.image_quality = image_quality
+        self.retina = retina
+        self.max_display_width = max_display_width
+        self.image_mode = image_mode
+        self.image_export_dir = image_export_dir
+        self.image_base_url = image_base_url
+        if image_mode == "external" and (not image_export_dir or image_base_url is None):
+            print(
+                'image_mode="external" には image_export_dir と、ブラウザから画像を取得できる '
+                "image_base_url の指定が必要です。埋め込みモードを使用します"
+            )
+            self.image_mode = "inline"
+        self.overlay_mode = overlay_mode
+        self.element_list_window = element_list_window
+        self.table_preview_rows = table_preview_rows
+        self.timings = timings if timings is not None else StageTimings()
+        self.page_byte_budget = page_byte_budget
+        self.output_byte_budget = output_byte_budget
+        self.highlight_elements: Dict[Any, frozenset] = {
+            key: frozenset(indices) for key, indices in (highlight_elements or {}).items()
+        }
+        self.image_workers = image_workers
+        # 出力予算による劣化段階で変更される設定（通常は劣化なし）
+        self.tooltip_max_chars = 500
+        self.image_scale = 1.0
+        self.collapse_element_list = False
+        # 劣化段階 -> 劣化させた設定のレンダラー
+        self._degraded_renderers: Dict[int, "DocumentRenderer"] = {}
+        # テーブルHTML -> プレビュー情報（ツールチップ・リスト・幅計算で1回の解析結果を共有）
+        self._table_previews: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._table_preview_cache_size = 256
+        # 要素リスト -> ページインデックス（要素ごとのフラグメントストアを含む）。
+        # 同じドキュメントのページ移動や再レンダリングでは構築済みのインデックスとフラグメントを再利用
+        self._page_indexes: "OrderedDict[Tuple, Tuple[List[Dict], Dict[int, Dict[str, Any]]]]" = OrderedDict()
+        self._page_index_cache_size = 4
+        self._page_index_lock = threading.Lock()
+
         # 異なる要素タイプの色のマッピング
         self.element_colors = {
             "section_header": "#FF6B6B",
@@ -156,110 +1346,289 @@ class DocumentRenderer:
         }
 
     def _parse_page_selection(
-        self, page_selection: Union[str, None], total_pages: int
-    ) -> Set[int]:
-        """ページ選択文字列を解析し、表示するページインデックスのセットを返します。
+        self,
+        page_selection: Union[str, None],
+        total_pages: int,
+        pages: Optional[List[Dict]] = None,
+        page_index: Optional[Dict[int, Dict[str, Any]]] = None,
+    ) -> List[int]:
+        """ページ選択文字列を解析し、表示するページインデックスのソート済みリストを返します。
+
+        ページ範囲はソート済みの区間リストにコンパイルし、ページリストを渡した場合はページIDが
+        区間に含まれるページを選択します（query_mode="pages" で絞り込んだ結果はリストの位置と
+        ページIDが一致しないため）。要素タイプや内容の述語は、区間内のページをページインデックスと
+        突き合わせて判定します（要素のないページは調べません）。
 
         引数:
-            page_selection: 選択文字列またはNone
-            total_pages: 利用可能なページの総数
+            page_selection: 選択文字列（PageSelection の形式）またはNone
+            total_pages: ドキュメントの元のページ数（_total_page_count を参照）
+            pages: ドキュメントのページリスト。Noneの場合は位置とページIDが一致するものとして選択
+            page_index: _get_page_index のページインデックス。Noneの場合は述語を無視します
 
         戻り値:
-            表示する0ベースのページインデックスのセット
+            表示する0ベースのページ位置（pages のインデックス）のソート済みリスト
         """
-        # Noneまたは"all"を処理 - すべてのページを返す
-        if page_selection is None or page_selection.lower() == "all":
-            return set(range(total_pages))
-
-        selected_pages = set()
-
-        # 入力をクリーンアップ
-        page_selection = page_selection.strip()
-
-        # 複数選択のためにカンマで分割
-        parts = page_selection.split(",")
-
-        for part in parts:
-            part = part.strip()
-
-            # 範囲かどうかを確認（ハイフンを含む）
-            if "-" in part:
-                try:
-                    # 範囲を分割し、整数に変換
-                    range_parts = part.split("-")
-                    if len(range_parts) == 2:
-                        start = int(range_parts[0].strip())
-                        end = int(range_parts[1].strip())
-
-                        # 1ベースから0ベースに変換
-                        start_idx = start - 1
-                        end_idx = end - 1
-
-                        # 範囲内のすべてのページを追加（含む）
-                        for i in range(start_idx, end_idx + 1):
-                            if 0 <= i < total_pages:
-                                selected_pages.add(i)
-                except ValueError:
-                    print(f"警告: ページ選択の範囲 '{part}' が無効です")
-            else:
-                # 単一ページ番号
-                try:
-                    page_num = int(part.strip())
-                    # 1ベースから0ベースに変換
-                    page_idx = page_num - 1
-                    if 0 <= page_idx < total_pages:
-                        selected_pages.add(page_idx)
-                    else:
-                        print(
-                            f"警告: ページ {page_num} は範囲外です (1-{total_pages})"
-                        )
-                except ValueError:
-                    print(f"警告: ページ選択の番号 '{part}' が無効です")
+        selection = PageSelection(page_selection)
+        intervals = selection.intervals(total_pages)
+
+        # 区間に含まれる (ページ位置, ページID)
+        if pages is None:
+            candidates = [(page_idx, page_idx) for start, stop in intervals for page_idx in range(start, stop)]
+        elif not selection.ranges:
+            # ページ範囲の指定がない場合はすべてのページ
+            candidates = [(page_idx, page.get("id", page_idx)) for page_idx, page in enumerate(pages)]
+        else:
+            starts = [start for start, _ in intervals]
+            candidates = []
+            for page_idx, page in enumerate(pages):
+                page_id = page.get("id", page_idx)
+                slot = bisect.bisect_right(starts, page_id) - 1
+                if slot >= 0 and page_id < intervals[slot][1]:
+                    candidates.append((page_idx, page_id))
+
+        if selection.has_predicates and page_index is not None:
+            selected_pages = []
+            for page_idx, page_id in candidates:
+                page_entry = page_index.get(page_id)
+                if page_entry is not None and selection.matches(page_entry):
+                    selected_pages.append(page_idx)
+            if not selected_pages:
+                print(f"警告: 選択 '{page_selection}' に一致するページがありません。")
+            return selected_pages
+
+        selected_pages = [page_idx for page_idx, _ in candidates]
 
         # 有効なページが選択されていない場合、すべてのページにデフォルト
         if not selected_pages:
             print(
                 f"警告: 選択 '{page_selection}' に有効なページがありません。すべてのページを表示します。"
             )
-            return set(range(total_pages))
+            return list(range(len(pages) if pages is not None else total_pages))
 
         return selected_pages
 
+    @staticmethod
+    def _total_page_count(document: Dict) -> int:
+        """ドキュメントの元のページ数を返します（query_mode="pages" で絞り込んだ結果は pages の数より多い）。"""
+        return document.get("page_count", len(document.get("pages", [])))
+
     def _get_element_color(self, element_type: str) -> str:
         """要素タイプの色を取得します。"""
         return self.element_colors.get(
             element_type.lower(), self.element_colors["default"]
         )
 
-    def _get_image_dimensions(self, image_path: str) -> Optional[Tuple[int, int]]:
-        """画像ファイルの寸法を取得します。"""
+    def _build_page_index(self, elements: List[Dict]) -> Dict[int, Dict[str, Any]]:
+        """要素リストを一度だけ列指向の BoxTable に正規化し、ページIDごとの空間インデックスを構築します。
+
+        引数:
+            elements: ドキュメントの要素リスト
+
+        戻り値:
+            page_id をキーとする辞書。各値は以下を含みます:
+                - "entries": そのページに存在する要素のリスト（ドキュメント順）。
+                  各エントリは "index"（要素インデックス）、"element"、
+                  "boxes"（ドキュメントの BoxTable）、"rows"（このページのこの要素のbboxの行範囲）、
+                  "valid_count"（座標が4つ以上のbboxの数）、
+                  "fragments"（要素のレンダリング済みコンテンツ。同じ要素の全ページのエントリで共有）を持ちます
+                - "type_counts": このページの要素タイプ別カウント
+        """
+        table = BoxTable(elements)
+        page_index: Dict[int, Dict[str, Any]] = {}
+        # 要素インデックス -> フラグメントストア。複数ページに現れる要素で共有
+        fragment_stores: Dict[int, Dict[str, str]] = {}
+
+        for page_id, elem_idx, type_code, start, stop, valid_count in table.runs():
+            page = page_index.get(page_id)
+            if page is None:
+                page = page_index[page_id] = {"entries": [], "type_counts": {}}
+            fragments = fragment_stores.get(elem_idx)
+            if fragments is None:
+                fragments = fragment_stores[elem_idx] = {}
+            page["entries"].append(
+                {
+                    "index": elem_idx,
+                    "element": elements[elem_idx],
+                    "boxes": table,
+                    "rows": (start, stop),
+                    "valid_count": valid_count,
+                    "fragments": fragments,
+                }
+            )
+            elem_type = table.types[type_code]
+            page["type_counts"][elem_type] = page["type_counts"].get(elem_type, 0) + 1
+
+        return page_index
+
+    def _get_page_index(self, elements: List[Dict]) -> Dict[int, Dict[str, Any]]:
+        """ドキュメントのページインデックスを返します。同じドキュメントでは構築済みのものを再利用します。
+
+        インデックスの要素リストへの参照を保持するため、キーに使う id() が
+        別のドキュメントに再利用されることはありません。
+        """
+        key = (id(elements), self.render_options_key())
+        with self._page_index_lock:
+            cached = self._page_indexes.get(key)
+            if cached is not None:
+                self._page_indexes.move_to_end(key)
+                return cached[1]
+
+        page_index = self._build_page_index(elements)
+
+        with self._page_index_lock:
+            self._page_indexes[key] = (elements, page_index)
+            while len(self._page_indexes) > self._page_index_cache_size:
+                self._page_indexes.popitem(last=False)
+        return page_index
+
+    def _read_page_image(self, image_path: str) -> Optional[Dict[str, Any]]:
+        """画像ファイルを一度だけ開いて読み込み、寸法とともに返します。
+
+        寸法は画素データをデコードせずにヘッダーから取得し、パスと更新日時ごとに記憶するため、
+        同じファイルを再びレンダリングする場合は取得を省略します。読み込んだ内容は縮小・エンコード、
+        埋め込み、外部ファイルへの書き出しでコピーせずに共有します。
+
+        戻り値:
+            "path"、"data"（ファイルの内容）、"bytes"、"mtime"、"size"（(幅、高さ)。取得できない場合はNone）
+            を持つ辞書。ファイルが存在しない、または読み込めない場合はNone
+        """
         try:
-            if os.path.exists(image_path):
-                with Image.open(image_path) as img:
-                    return img.size  # (幅、高さ)を返します
+            with self.timings.stage("image_io"), open(image_path, "rb") as img_file:
+                mtime = os.fstat(img_file.fileno()).st_mtime
+                data = img_file.read()
+        except FileNotFoundError:
             return None
         except Exception as e:
-            print(f"{image_path} の画像寸法を取得中にエラーが発生しました: {e}")
+            print(f"{image_path} の画像を読み込む中にエラーが発生しました: {e}")
             return None
 
-    def _load_image_as_base64(self, image_path: str) -> Optional[str]:
-        """ファイルパスから画像を読み込み、base64に変換します。"""
-        try:
-            if os.path.exists(image_path):
-                with open(image_path, "rb") as img_file:
-                    img_data = img_file.read()
-                    img_base64 = base64.b64encode(img_data).decode("utf-8")
-                    ext = os.path.splitext(image_path)[1].lower()
-                    if ext in [".jpg", ".jpeg"]:
-                        return f"data:image/jpeg;base64,{img_base64}"
-                    elif ext in [".png"]:
-                        return f"data:image/png;base64,{img_base64}"
-                    else:
-                        return f"data:image/jpeg;base64,{img_base64}"
+        key = (image_path, mtime)
+        size = self._image_sizes.get(key)
+        if size is None:
+            try:
+                # Image.open はヘッダーのみを読み、画素データは load() されるまでデコードしない
+                with self.timings.stage("image_io"), Image.open(io.BytesIO(data)) as img:
+                    size = img.size  # (幅、高さ)
+            except Exception as e:
+                print(f"{image_path} の画像寸法を取得中にエラーが発生しました: {e}")
+            else:
+                self._image_sizes.put(key, size)
+
+        return {"path": image_path, "data": data, "bytes": len(data), "mtime": mtime, "size": size}
+
+    def _encode_page_image(
+        self, source: Optional[Dict[str, Any]], display_width: int, display_height: int
+    ) -> Optional[Dict[str, Any]]:
+        """ページ画像を表示サイズに縮小し、設定されたフォーマットで再エンコードします。
+
+        縮小後も表示サイズは変わらないため、バウンディングボックスの座標は
+        既存のスケールファクターをそのまま使用できます。
+
+        引数:
+            source: _read_page_image で読み込んだ画像
+            display_width: 表示幅（px）
+            display_height: 表示高さ（px）
+
+        戻り値:
+            "src"（data URIまたは外部参照URL）、"original_bytes"、"emitted_bytes"、
+            "format"、"external" を含む辞書。画像を読み込めない場合はNone
+        """
+        if source is None:
             return None
+
+        if self.image_format == "ORIGINAL":
+            return self._emit_page_image(source, source["data"], "original")
+
+        image_format = self.image_format
+        if image_format not in self.image_mime_types:
+            print(f"警告: 未対応の画像フォーマット '{image_format}' です。JPEGを使用します。")
+            image_format = "JPEG"
+
+        # Retinaの場合は表示サイズの2倍で出力（出力予算で劣化させた場合は image_scale 倍に縮小）
+        pixel_ratio = (2 if self.retina else 1) * self.image_scale
+        target_size = (
+            max(1, int(display_width * pixel_ratio)),
+            max(1, int(display_height * pixel_ratio)),
+        )
+
+        try:
+            # 画素データの読み込み（デコード）は縮小・保存と不可分のため、エンコードとして計測
+            with self.timings.stage("encode"), Image.open(io.BytesIO(source["data"])) as img:
+                # 元画像より大きくは拡大しない
+                if img.width > target_size[0]:
+                    img = img.resize(target_size, Image.LANCZOS)
+
+                if image_format == "JPEG" and img.mode != "RGB":
+                    # JPEGはアルファチャンネルを持てないため白背景に合成
+                    rgba = img.convert("RGBA")
+                    img = Image.new("RGB", rgba.size, (255, 255, 255))
+                    img.paste(rgba, mask=rgba.split()[3])
+
+                buffer = io.BytesIO()
+                save_options = {"optimize": True}
+                if image_format in ("JPEG", "WEBP"):
+                    save_options["quality"] = self.image_quality
+                img.save(buffer, format=image_format, **save_options)
         except Exception as e:
-            print(f"{image_path} の画像を読み込む中にエラーが発生しました: {e}")
-            return None
+            print(f"{source['path']} の画像を再エンコード中にエラーが発生しました: {e}")
+            # フォールバック: 元の画像をそのまま使用
+            return self._emit_page_image(source, source["data"], "original")
+
+        return self._emit_page_image(source, buffer.getvalue(), image_format)
+
+    def _emit_page_image(
+        self, source: Dict[str, Any], image_bytes: bytes, image_format: str
+    ) -> Optional[Dict[str, Any]]:
+        """エンコード済みの画像を data URI として埋め込むか、外部ファイルとして書き出します。
+
+        引数:
+            source: _read_page_image で読み込んだ元の画像
+            image_bytes: 出力する画像（"original" の場合は元のファイルの内容）
+            image_format: Pillowの保存フォーマット、または "original"
+        """
+        image_path = source["path"]
+        if image_format == "original":
+            ext = os.path.splitext(image_path)[1].lower()
+            mime_type = "image/png" if ext == ".png" else "image/jpeg"
+        else:
+            ext = "." + image_format.lower().replace("jpeg", "jpg")
+            mime_type = self.image_mime_types[image_format]
+
+        if self.image_mode == "external" and self.image_export_dir:
+            try:
+                # 元画像・更新日時・レンダリングオプションが同じなら同じファイル名（一度だけ書き出す）
+                cache_key = f"{image_path}|{source['mtime']}|{self.render_options_key()}"
+                file_name = hashlib.sha1(cache_key.encode("utf-8")).hexdigest()[:20] + ext
+                export_path = os.path.join(self.image_export_dir, file_name)
+                with self.timings.stage("image_io"):
+                    if not os.path.exists(export_path):
+                        os.makedirs(self.image_export_dir, exist_ok=True)
+                        with open(export_path, "wb") as out_file:
+                            out_file.write(image_bytes)
+
+                return {
+                    "src": (
+                        f"{self.image_base_url.rstrip('/')}/{file_name}" if self.image_base_url else file_name
+                    ),
+                    "original_bytes": source["bytes"],
+                    "emitted_bytes": len(image_bytes),
+                    "format": image_format,
+                    "external": True,
+                }
+            except Exception as e:
+                print(f"{image_path} の画像を書き出し中にエラーが発生しました（埋め込みに切り替えます）: {e}")
+
+        # フォールバックを含む埋め込みモード: base64 の data URI
+        with self.timings.stage("encode"):
+            img_base64 = base64.b64encode(image_bytes).decode("utf-8")
+        data_uri = f"data:{mime_type};base64,{img_base64}"
+        return {
+            "src": data_uri,
+            "original_bytes": source["bytes"],
+            "emitted_bytes": len(data_uri),
+            "format": image_format,
+            "external": False,
+        }
 
     def _render_element_content(self, element: Dict, for_tooltip: bool = False) -> str:
         """ツールチップと要素リスト表示のために適切なフォーマットで要素コンテンツをレンダリングします。
@@ -274,46 +1643,49 @@ class DocumentRenderer:
 
         display_content = ""
 
-        if content:
+        # 空白だけのコンテンツや説明は空のカードになるため、コンテンツなしとして扱う
+        if content and not str(content).isspace():
             if element_type == "table":
-                # スタイリングを適用したHTMLテーブルをレンダリング
-                table_html = content
+                # 先頭の行のみのプレビューにスタイリングを適用してレンダリング
+                # （プレビューを無効にしている場合はテーブルを解析せずに全体を使用）
+                preview = (
+                    self._get_table_preview(content)
+                    if self.table_preview_rows
+                    else {"truncated": False, "preview": content}
+                )
+                table_html = self._style_table_html(preview["preview"], for_tooltip)
 
-                # コンテキストに基づいて異なるスタイリングを適用
-                if for_tooltip:
-                    # ツールチップ用のコンパクトスタイリング
-                    # ツールチップテーブルのために利用可能な全幅を使用
-                    table_style = f'''style="width: 100%; border-collapse: collapse; margin: 5px 0; font-size: 10px;"'''
-                    th_style = 'style="border: 1px solid #ddd; padding: 4px; background: #f8f9fa; color: #333; font-weight: bold; text-align: left; font-size: 10px;"'
-                    td_style = 'style="border: 1px solid #ddd; padding: 4px; color: #333; font-size: 10px;"'
-                    thead_style = 'style="background: #e9ecef;"'
-                else:
-                    # 要素リスト用のフルスタイリング
-                    table_style = '''style="width: 100%; border-collapse: collapse; margin: 10px 0; font-size: 13px;"'''
-                    th_style = 'style="border: 1px solid #ddd; padding: 8px; background: #f5f5f5; font-weight: bold; text-align: left;"'
-                    td_style = 'style="border: 1px solid #ddd; padding: 8px;"'
-                    thead_style = 'style="background: #f0f0f0;"'
-
-                # スタイリング変換を適用
-                if "<table>" in table_html:
-                    table_html = table_html.replace("<table>", f"<table {table_style}>")
-                if "<th>" in table_html:
-                    table_html = table_html.replace("<th>", f"<th {th_style}>")
-                if "<td>" in table_html:
-                    table_html = table_html.replace("<td>", f"<td {td_style}>")
-                if "<thead>" in table_html:
-                    table_html = table_html.replace("<thead>", f"<thead {thead_style}>")
+                if preview["truncated"]:
+                    remaining_rows = preview["row_count"] - self.table_preview_rows
+                    summary = (
+                        f"… 他 {remaining_rows} 行"
+                        f"（全 {preview['row_count']} 行 × {preview['column_count']} 列）"
+                    )
 
                 if for_tooltip:
                     display_content = table_html
+                    if preview["truncated"]:
+                        display_content += f"<div style='font-size: 10px; color: #666;'>{summary}</div>"
                 else:
                     display_content = f"<div style='overflow-x: auto; margin: 10px 0;'>{table_html}</div>"
+                    if preview["truncated"]:
+                        # テーブル全体はセル出力に含めない。外部参照モードでは別ファイルに書き出してリンクする
+                        full_table_url = self._export_full_table(content, preview["row_count"])
+                        if full_table_url:
+                            summary += (
+                                f' <a href="{full_table_url}" target="_blank" rel="noopener">'
+                                f"全 {preview['row_count']} 行を表示</a>"
+                            )
+                        else:
+                            summary += "。全行は table_preview_rows=None で表示できます"
+                        display_content += f'<div style="font-size: 12px; color: #666;">{summary}</div>'
+
             else:
                 # 通常のコンテンツ処理
-                if for_tooltip and len(content) > 500:
+                if for_tooltip and len(content) > self.tooltip_max_chars:
                     # ツールチップ表示用に切り詰め、HTMLを安全にエスケープ
                     display_content = self._escape_for_html_attribute(
-                        content[:500] + "..."
+                        content[:self.tooltip_max_chars] + "..."
                     )
                 else:
                     display_content = (
@@ -321,10 +1693,10 @@ class DocumentRenderer:
                         if for_tooltip
                         else content
                     )
-        elif description:
+        elif description and not str(description).isspace():
             desc_content = description
-            if for_tooltip and len(desc_content) > 500:
-                desc_content = desc_content[:500] + "..."
+            if for_tooltip and len(desc_content) > self.tooltip_max_chars:
+                desc_content = desc_content[:self.tooltip_max_chars] + "..."
 
             if for_tooltip:
                 display_content = self._escape_for_html_attribute(
@@ -339,70 +1711,137 @@ class DocumentRenderer:
 
         return display_content
 
+    def _render_entry_content(self, entry: Dict, for_tooltip: bool = False) -> str:
+        """ページインデックスのエントリのコンテンツを返します。各要素につき各表示先で1回だけレンダリングします。
+
+        レンダリング結果はエントリの "fragments" に、内容に影響する設定（ツールチップの文字数と
+        テーブルのプレビュー行数）ごとに格納され、同じ要素が現れる他のページや同じドキュメントの
+        再レンダリングで再利用されます。出力予算で劣化させた設定のレンダラーは別の結果を使用します。
+        """
+        fragments = entry["fragments"]
+        key = ("tooltip" if for_tooltip else "list", self.tooltip_max_chars, self.table_preview_rows)
+        fragment = fragments.get(key)
+        if fragment is None:
+            fragment = fragments[key] = self._render_element_content(
+                entry["element"], for_tooltip=for_tooltip
+            )
+        return fragment
+
+    def _style_table_html(self, table_html: str, for_tooltip: bool) -> str:
+        """テーブルHTMLのタグにツールチップ用または要素リスト用のインラインスタイルを1回の走査で適用します。"""
+        tag_styles = self.table_tag_styles[for_tooltip]
+        return self.table_tag_pattern.sub(lambda match: tag_styles[match.group(0)], table_html)
+
+    def _get_table_preview(self, content: str) -> Dict[str, Any]:
+        """テーブルHTMLの列数・行数と、先頭 table_preview_rows 行のプレビューHTMLを返します。
+
+        解析は1回の走査で行い、結果は同じテーブルのツールチップ・要素リスト・幅計算の間で共有します。
+        プレビューの行を読み終えた時点でHTMLの解析を打ち切り、残りの行は最上位のテーブルの<tr>タグの
+        数だけを数えます（入れ子のテーブルの行は数えません）。
+        """
+        preview = self._table_previews.get(content)
+        if preview is not None:
+            self._table_previews.move_to_end(content)
+            return preview
+
+        max_rows = self.table_preview_rows or sys.maxsize
+        parser = _TablePreviewParser(max_rows)
+        try:
+            # プレビューに含まれない行が始まるまで、チャンク単位で解析
+            chunk_size = 16 * 1024
+            position = 0
+            while position < len(content) and parser.row_count <= max_rows:
+                parser.feed(content[position:position + chunk_size])
+                position += chunk_size
+
+            unparsed_start = position - len(parser.rawdata)
+            tail_start = None
+            if position < len(content):
+                # 残りの行は数えるだけにし、最上位の最後の行より後ろの閉じタグ（</tbody></table> など）のみ解析
+                depth = parser._table_depth
+                skipped_rows = 0
+                for match in self.table_structure_pattern.finditer(content, unparsed_start):
+                    closing, tag = match.group(1), match.group(2).lower()
+                    if tag == "table":
+                        depth += -1 if closing else 1
+                    elif depth <= 1 and not closing:
+                        skipped_rows += 1
+                    elif depth <= 1:
+                        tail_start, tail_depth, tail_rows = match.end(), depth, skipped_rows
+            if tail_start is not None:
+                parser.row_count += tail_rows
+                parser.feed_tail(content[tail_start:], tail_depth)
+            else:
+                parser.feed(content[position:])
+            parser.close()
+            truncated = parser.row_count > max_rows
+            preview = {
+                "column_count": parser.column_count,
+                "row_count": parser.row_count,
+                "truncated": truncated,
+                "preview": "".join(parser.parts) if truncated else content,
+            }
+        except Exception:
+            # 解析できないHTMLはそのまま表示
+            preview = {"column_count": 0, "row_count": 0, "truncated": False, "preview": content}
+
+        self._table_previews[content] = preview
+        if len(self._table_previews) > self._table_preview_cache_size:
+            self._table_previews.popitem(last=False)
+        return preview
+
+    def _export_full_table(self, content: str, row_count: int) -> Optional[str]:
+        """外部参照モードで、テーブル全体を image_export_dir のHTMLファイルに一度だけ書き出し、そのURLを返します。
+
+        埋め込みモードの場合、または書き出せない場合はNoneを返します。
+        """
+        if self.image_mode != "external":
+            return None
+        try:
+            file_name = hashlib.sha1(content.encode("utf-8")).hexdigest()[:20] + ".html"
+            export_path = os.path.join(self.image_export_dir, file_name)
+            if not os.path.exists(export_path):
+                os.makedirs(self.image_export_dir, exist_ok=True)
+                with open(export_path, "w", encoding="utf-8") as out_file:
+                    out_file.write(
+                        f"<!DOCTYPE html>\n<html lang=\"ja\">\n<head><meta charset=\"utf-8\">"
+                        f"<title>テーブル（全 {row_count} 行）</title></head>\n"
+                        f"<body style=\"font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif;\">\n"
+                        f"{self._style_table_html(content, for_tooltip=False)}\n</body>\n</html>\n"
+                    )
+        except Exception as e:
+            print(f"テーブル全体を書き出し中にエラーが発生しました: {e}")
+            return None
+        return f"{self.image_base_url.rstrip('/')}/{file_name}" if self.image_base_url else file_name
+
     def _escape_for_html_attribute(self, text: str) -> str:
         """HTML属性で安全に使用するためにテキストをエスケープします."""
-        return (
-            text.replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-            .replace('"', "&quot;")
-            .replace("'", "&#39;")
-            .replace("\n", "<br>")
-        )
+        return text.translate(self.attribute_escape_table)
 
     def _calculate_tooltip_width(self, element: Dict, image_width: int) -> int:
         """テーブルコンテンツに基づいて動的なツールチップの幅を計算します。"""
         element_type = element.get("type", "unknown")
         content = element.get("content", "")
 
-        if element_type == "table" and content:
-            # 最初の行で<th>または<td>タグを探して列をカウント
-            import re
-
-            # 最初の行を見つける（theadまたはtbodyのいずれか）
-            first_row_match = re.search(
-                r"<tr[^>]*>(.*?)</tr>", content, re.DOTALL | re.IGNORECASE
-            )
-            if first_row_match:
-                first_row = first_row_match.group(1)
-                # thまたはtdタグをカウント
-                th_count = len(re.findall(r"<th[^>]*>", first_row, re.IGNORECASE))
-                td_count = len(re.findall(r"<td[^>]*>", first_row, re.IGNORECASE))
-                column_count = max(th_count, td_count)
-
-                if column_count > 0:
-                    # 基本幅 + 列ごとの追加幅
-                    base_width = 300
-                    width_per_column = 80
-                    calculated_width = base_width + (column_count * width_per_column)
-
-                    # 画像幅の4/5に制限
-                    max_width = int(image_width * 0.8)
-                    return min(calculated_width, max_width)
-
-        # テーブル以外または計算が失敗した場合のデフォルト幅
-        return 400
+        if element_type == "table" and content:
+            # 列数はプレビュー作成時の走査で最初の行の<th>/<td>から数えたものを使用
+            column_count = self._get_table_preview(content)["column_count"]
 
-    def _create_annotated_image(self, page: Dict, elements: List[Dict]) -> str:
-        """1024px幅に収まるようにスケーリングされた注釈付き画像を作成します。"""
-        image_uri = page.get("image_uri", "")
-        page_id = page.get("id", 0)
+            if column_count > 0:
+                # 基本幅 + 列ごとの追加幅
+                base_width = 300
+                width_per_column = 80
+                calculated_width = base_width + (column_count * width_per_column)
 
-        if not image_uri:
-            return "<p style='color: red;'>このページの画像URIが見つかりません</p>"
+                # 画像幅の4/5に制限
+                max_width = int(image_width * 0.8)
+                return min(calculated_width, max_width)
 
-        # 画像を読み込む
-        img_data_uri = self._load_image_as_base64(image_uri)
-        if not img_data_uri:
-            return f"""
-            <div style="background: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; padding: 15px; border-radius: 5px;">
-                <strong>画像を読み込めませんでした:</strong> {image_uri}<br>
-                <small>ファイルが存在し、アクセス可能であることを確認してください。</small>
-            </div>
-            """
+        # テーブル以外または計算が失敗した場合のデフォルト幅
+        return 400
 
-        # 元の画像寸法を取得
-        original_dimensions = self._get_image_dimensions(image_uri)
+    def _compute_display_geometry(self, original_dimensions: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+        """元の画像寸法から、最大表示幅に収まる表示サイズとスケーリングファクターを計算します。"""
         if not original_dimensions:
             # フォールバック: 明示的なスケーリングなしで表示
             original_width, original_height = 1024, 768  # デフォルトフォールバック
@@ -410,7 +1849,7 @@ class DocumentRenderer:
             original_width, original_height = original_dimensions
 
         # 1024px幅に収まるようにスケーリングファクターを計算
-        max_display_width = 1024
+        max_display_width = self.max_display_width
         scale_factor = 1.0
         display_width = original_width
         display_height = original_height
@@ -420,29 +1859,95 @@ class DocumentRenderer:
             display_width = max_display_width
             display_height = int(original_height * scale_factor)
 
-        # このページの要素をフィルタリングし、バウンディングボックスを収集
-        page_elements = []
+        return {
+            "original_width": original_width,
+            "original_height": original_height,
+            "display_width": display_width,
+            "display_height": display_height,
+            "scale_factor": scale_factor,
+        }
+
+    def _prepare_page_image(
+        self, image_uri: str, source: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """ページ画像を一度だけ読み込み、寸法の取得と表示サイズへの縮小・エンコードを行います。
 
-        for elem in elements:
-            elem_bboxes = []
-            for bbox in elem.get("bbox", []):
-                if bbox.get("page_id", 0) == page_id:
-                    coord = bbox.get("coord", [])
-                    if len(coord) >= 4:
-                        elem_bboxes.append(bbox)
+        オーバーレイや要素リストに依存しないため、PageImageLoader のスレッドで実行できます。
 
-            if elem_bboxes:
-                page_elements.append({"element": elem, "bboxes": elem_bboxes})
+        引数:
+            image_uri: 画像ファイルのパス
+            source: 読み込み済みの画像（_read_page_image の戻り値）。劣化させた設定での再エンコードなど、
+                同じファイルを読み直さない場合に指定
+
+        戻り値:
+            "geometry"（_compute_display_geometry の戻り値）、"encoded"（_encode_page_image の戻り値）、
+            "source"（読み込んだ画像）を持つ辞書
+        """
+        if source is None and image_uri:
+            source = self._read_page_image(image_uri)
+        geometry = self._compute_display_geometry(source["size"] if source else None)
+        encoded = self._encode_page_image(
+            source, geometry["display_width"], geometry["display_height"]
+        )
+        return {"geometry": geometry, "encoded": encoded, "source": source}
+
+    def _create_annotated_image(
+        self,
+        page: Dict,
+        page_entries: List[Dict],
+        highlight: frozenset = frozenset(),
+        prepared_image: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """1024px幅に収まるようにスケーリングされた注釈付き画像を作成します。
+
+        引数:
+            page: ページ辞書
+            page_entries: ページインデックスから取得したこのページの要素エントリ
+            highlight: 強調表示する要素インデックス
+            prepared_image: 先読み済みの画像（_prepare_page_image の戻り値）。Noneの場合はここで読み込む
+        """
+        image_uri = page.get("image_uri", "")
+        page_id = page.get("id", 0)
+
+        if not image_uri:
+            return "<p style='color: red;'>このページの画像URIが見つかりません</p>"
+
+        # インデックス済みのエントリから有効なバウンディングボックスを持つ要素を取得
+        page_elements = [entry for entry in page_entries if entry["valid_count"]]
 
         if not page_elements:
             return f"<p>ページ {page_id} に要素が見つかりません</p>"
 
+        # 画像を一度だけ読み込み、元の画像寸法と1024px幅に収まる表示サイズ・スケーリングファクターを計算して、
+        # 表示サイズに縮小・再エンコード
+        if prepared_image is None:
+            prepared_image = self._prepare_page_image(image_uri)
+        geometry = prepared_image["geometry"]
+        original_width = geometry["original_width"]
+        original_height = geometry["original_height"]
+        display_width = geometry["display_width"]
+        display_height = geometry["display_height"]
+        scale_factor = geometry["scale_factor"]
+
+        encoded_image = prepared_image["encoded"]
+        if not encoded_image:
+            return f"""
+            <div style="background: #f8d7da; border: 1px solid #f5c6cb; color: #721c24; padding: 15px; border-radius: 5px;">
+                <strong>画像を読み込めませんでした:</strong> {image_uri}<br>
+                <small>ファイルが存在し、アクセス可能であることを確認してください。</small>
+            </div>
+            """
+        img_src = encoded_image["src"]
+        image_delivery = "外部参照" if encoded_image["external"] else "埋め込み"
+
         header_info = f"""
         <div style="background: #e3f2fd; border: 1px solid #2196f3; border-radius: 8px; padding: 15px; margin: 10px 0;">
             <strong>ページ {page_id + 1}: {len(page_elements)} 要素</strong><br>
             <strong>元のサイズ:</strong> {original_width}×{original_height}px | 
             <strong>表示サイズ:</strong> {display_width}×{display_height}px | 
             <strong>スケールファクター:</strong> {scale_factor:.3f}<br>
+            <strong>画像バイト数:</strong> 元 {encoded_image["original_bytes"] / 1024:.1f} KB → 
+            出力 {encoded_image["emitted_bytes"] / 1024:.1f} KB ({encoded_image["format"]}, {image_delivery})
         </div>
         """
 
@@ -450,6 +1955,41 @@ class DocumentRenderer:
         container_id = f"page_container_{page_id}_{id(self)}"
 
         # スケーリングされた座標を使用してバウンディングボックスオーバーレイを作成し、ホバー機能を追加
+        with self.timings.stage("overlay"):
+            if self.overlay_mode == "css":
+                styles, overlay_html = self._create_css_overlay(
+                    page_elements, container_id, page_id, scale_factor, display_width, highlight
+                )
+            else:
+                styles, overlay_html = self._create_svg_overlay(
+                    page_elements, container_id, scale_factor, display_width, display_height, highlight
+                )
+
+        return f"""
+        {header_info}
+        {styles}
+        <div id="{container_id}" style="position: relative; display: inline-block; border: 2px solid #333; border-radius: 8px; overflow: visible; background: white;">
+            <img src="{img_src}" 
+                 style="display: block; width: {display_width}px; height: {display_height}px;" 
+                 alt="ページ {page_id + 1}">
+            {overlay_html}
+        </div>
+        """
+
+    def _create_css_overlay(
+        self,
+        page_elements: List[Dict],
+        container_id: str,
+        page_id: int,
+        scale_factor: float,
+        display_width: int,
+        highlight: frozenset = frozenset(),
+    ) -> Tuple[str, str]:
+        """bboxごとにツールチップを含むdivを生成する従来のオーバーレイ（純粋なCSSホバー）。
+
+        戻り値:
+            (スタイルHTML, オーバーレイHTML) のタプル
+        """
         overlays = []
 
         for idx, item in enumerate(page_elements):
@@ -457,95 +1997,84 @@ class DocumentRenderer:
             element_id = element.get("id", "N/A")
             element_type = element.get("type", "unknown")
             color = self._get_element_color(element_type)
+            # 強調表示する要素は太い赤枠で描画
+            border = "4px solid #ff1744" if item["index"] in highlight else f"2px solid {color}"
 
             # ツールチップ用に共有コンテンツレンダラーを使用
-            tooltip_content = self._render_element_content(element, for_tooltip=True)
+            tooltip_content = self._render_entry_content(item, for_tooltip=True)
 
             # 動的ツールチップ幅を計算
             tooltip_width = self._calculate_tooltip_width(element, display_width)
 
             # テーブルはHTMLとしてレンダリングし、他のコンテンツはエスケープする必要があります
 
-            for bbox_idx, bbox in enumerate(item["bboxes"]):
-                coord = bbox.get("coord", [])
-                if len(coord) >= 4:
-                    x1, y1, x2, y2 = coord
-
-                    # 座標にスケーリングを適用
-                    scaled_x1 = x1 * scale_factor
-                    scaled_y1 = y1 * scale_factor
-                    scaled_x2 = x2 * scale_factor
-                    scaled_y2 = y2 * scale_factor
-
-                    width = scaled_x2 - scaled_x1
-                    height = scaled_y2 - scaled_y1
-
-                    # 無効なボックスをスキップ
-                    if width <= 0 or height <= 0:
-                        continue
-
-                    # 可能な場合はボックスの上にラベルを配置
-                    label_top = -18 if scaled_y1 >= 18 else 2
-
-                    # このバウンディングボックスのユニークID
-                    box_id = f"bbox_{page_id}_{idx}_{bbox_idx}"
-
-                    # ツールチップの位置を計算（右側を優先するが、必要に応じて左に切り替える）
-                    tooltip_left = 10
-
-                    overlay = f"""
-                    <div id="{box_id}" 
-                         class="bbox-overlay bbox-{container_id}"
-                         style="position: absolute; 
-                               left: {scaled_x1:.1f}px; top: {scaled_y1:.1f}px; 
-                               width: {width:.1f}px; height: {height:.1f}px;
-                               border: 2px solid {color};
-                               background: {color}25;
-                               box-sizing: border-box;
-                               cursor: pointer;
-                               transition: all 0.2s ease;">
-                        <div style="background: {color}; color: white; 
-                                   padding: 1px 4px; font-size: 9px; font-weight: bold;
-                                   position: absolute; top: {label_top}px; left: 0;
-                                   white-space: nowrap; border-radius: 2px;
-                                   box-shadow: 0 1px 2px rgba(0,0,0,0.3);
-                                   pointer-events: none;
-                                   max-width: {max(50, width-4):.0f}px;
-                                   overflow: hidden;
-                                   z-index: 1000;">
-                            {element_type.upper()[:6]}#{element_id}
+            # 表示座標へのスケーリングと無効なボックスの除外はまとめて行う
+            boxes = item["boxes"].scaled(*item["rows"], scale_factor)
+            for bbox_idx, (scaled_x1, scaled_y1, width, height) in enumerate(
+                zip(boxes["x"].tolist(), boxes["y"].tolist(), boxes["width"].tolist(), boxes["height"].tolist())
+            ):
+                # 可能な場合はボックスの上にラベルを配置
+                label_top = -18 if scaled_y1 >= 18 else 2
+
+                # このバウンディングボックスのユニークID
+                box_id = f"bbox_{page_id}_{idx}_{bbox_idx}"
+
+                # ツールチップの位置を計算（右側を優先するが、必要に応じて左に切り替える）
+                tooltip_left = 10
+
+                overlay = f"""
+                <div id="{box_id}" 
+                     class="bbox-overlay bbox-{container_id}"
+                     style="position: absolute; 
+                           left: {scaled_x1:.1f}px; top: {scaled_y1:.1f}px; 
+                           width: {width:.1f}px; height: {height:.1f}px;
+                           border: {border};
+                           background: {color}25;
+                           box-sizing: border-box;
+                           cursor: pointer;
+                           transition: all 0.2s ease;">
+                    <div style="background: {color}; color: white; 
+                               padding: 1px 4px; font-size: 9px; font-weight: bold;
+                               position: absolute; top: {label_top}px; left: 0;
+                               white-space: nowrap; border-radius: 2px;
+                               box-shadow: 0 1px 2px rgba(0,0,0,0.3);
+                               pointer-events: none;
+                               max-width: {max(50, width-4):.0f}px;
+                               overflow: hidden;
+                               z-index: 1000;">
+                        {element_type.upper()[:6]}#{element_id}
+                    </div>
+                    <!-- ツールチップを子要素として（CSSホバーアプローチ） -->
+                    <div class="bbox-tooltip" style="
+                        position: absolute;
+                        left: {tooltip_left}px;
+                        top: {height};
+                        background: rgba(255, 255, 255, 0.98);
+                        color: #333;
+                        border: 2px solid #ccc;
+                        padding: 12px;
+                        border-radius: 6px;
+                        font-size: 12px;
+                        width: {tooltip_width}px;
+                        max-width: {tooltip_width}px;
+                        word-wrap: break-word;
+                        z-index: 10000;
+                        pointer-events: none;
+                        box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
+                        display: none;
+                        line-height: 1.4;
+                        max-height: 400px;
+                        overflow-y: auto;">
+                        <div style="font-weight: bold; color: #0066cc; margin-bottom: 8px; padding-bottom: 6px; border-bottom: 1px solid #ddd;">
+                            {element_type.upper()} #{element_id}
                         </div>
-                        <!-- ツールチップを子要素として（CSSホバーアプローチ） -->
-                        <div class="bbox-tooltip" style="
-                            position: absolute;
-                            left: {tooltip_left}px;
-                            top: {height};
-                            background: rgba(255, 255, 255, 0.98);
-                            color: #333;
-                            border: 2px solid #ccc;
-                            padding: 12px;
-                            border-radius: 6px;
-                            font-size: 12px;
-                            width: {tooltip_width}px;
-                            max-width: {tooltip_width}px;
-                            word-wrap: break-word;
-                            z-index: 10000;
-                            pointer-events: none;
-                            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
-                            display: none;
-                            line-height: 1.4;
-                            max-height: 400px;
-                            overflow-y: auto;">
-                            <div style="font-weight: bold; color: #0066cc; margin-bottom: 8px; padding-bottom: 6px; border-bottom: 1px solid #ddd;">
-                                {element_type.upper()} #{element_id}
-                            </div>
-                            <div style="font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif; font-size: 11px;">
-                                {tooltip_content}
-                            </div>
+                        <div style="font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif; font-size: 11px;">
+                            {tooltip_content}
                         </div>
                     </div>
-                    """
-                    overlays.append(overlay)
+                </div>
+                """
+                overlays.append(overlay)
 
         # 純粋なCSSホバー機能（Databricksで動作）
         styles = f"""
@@ -573,59 +2102,149 @@ class DocumentRenderer:
         </style>
         """
 
-        return f"""
-        {header_info}
-        {styles}
-        <div id="{container_id}" style="position: relative; display: inline-block; border: 2px solid #333; border-radius: 8px; overflow: visible; background: white;">
-            <img src="{img_data_uri}" 
-                 style="display: block; width: {display_width}px; height: {display_height}px;" 
-                 alt="ページ {page_id + 1}">
-            {''.join(overlays)}
-        </div>
-        """
-
-    def _create_page_elements_list(self, page_id: int, elements: List[Dict]) -> str:
-        """特定のページの要素の詳細リストを作成します。"""
-        # このページの要素をフィルタリング
-        page_elements = []
-
-        for elem in elements:
-            elem_bboxes = []
-            for bbox in elem.get("bbox", []):
-                if bbox.get("page_id", 0) == page_id:
-                    elem_bboxes.append(bbox)
+        return styles, "".join(overlays)
 
-            if elem_bboxes:
-                page_elements.append(elem)
+    def _create_svg_overlay(
+        self,
+        page_elements: List[Dict],
+        container_id: str,
+        scale_factor: float,
+        display_width: int,
+        display_height: int,
+        highlight: frozenset = frozenset(),
+    ) -> Tuple[str, str]:
+        """バウンディングボックスを1つのSVGとして描画し、ツールチップを1つのノードで共有します。
 
-        if not page_elements:
-            return f"<p>ページ {page_id + 1} に要素が見つかりません</p>"
+        各要素のツールチップ内容はJSONとして一度だけ格納され、複数のbboxを持つ要素でも
+        重複しません。色やホバー効果は要素タイプごとのCSSクラスで指定します。
 
-        html_parts = []
+        戻り値:
+            (スタイルHTML, オーバーレイHTML) のタプル
+        """
+        type_classes: Dict[str, str] = {}
+        tooltip_data = []
+        # 要素インデックス -> (ツールチップの位置, CSSクラス, ラベル)
+        element_styles: Dict[int, Tuple[int, str, str]] = {}
 
-        for element in page_elements:
+        for elem_pos, item in enumerate(page_elements):
+            element = item["element"]
             element_id = element.get("id", "N/A")
             element_type = element.get("type", "unknown")
-            color = self._get_element_color(element_type)
+            type_class = type_classes.setdefault(element_type, f"t{len(type_classes)}")
+
+            # ツールチップ内容は要素ごとに一度だけ格納
+            tooltip_data.append(
+                {
+                    "t": f"{element_type.upper()} #{element_id}",
+                    "w": self._calculate_tooltip_width(element, display_width),
+                    "h": self._render_entry_content(item, for_tooltip=True),
+                }
+            )
+            if item["index"] in highlight:
+                # 強調表示する要素はクラスを追加
+                type_class += " h"
+            element_styles[item["index"]] = (elem_pos, type_class, f"{element_type.upper()[:6]}#{element_id}")
+
+        # ページの全bboxをまとめてスケーリングし、無効なボックスの除外とラベル位置の計算を行う
+        table = page_elements[0]["boxes"]
+        boxes = table.scaled(page_elements[0]["rows"][0], page_elements[-1]["rows"][1], scale_factor)
+        shapes = []
+        for owner, x, y, width, height, label_y in zip(
+            table.element[boxes["row"]].tolist(),
+            boxes["x"].tolist(),
+            boxes["y"].tolist(),
+            boxes["width"].tolist(),
+            boxes["height"].tolist(),
+            boxes["label_y"].tolist(),
+        ):
+            elem_pos, type_class, label = element_styles[owner]
+            shapes.append(
+                f'<rect class="b {type_class}" data-e="{elem_pos}" x="{x:.1f}" y="{y:.1f}" '
+                f'width="{width:.1f}" height="{height:.1f}"/>'
+                f'<text class="l {type_class}" x="{x + 2:.1f}" y="{label_y:.1f}">{label}</text>'
+            )
 
-            # このページのためのバウンディングボックス情報を取得
-            bbox_info = "バウンディングボックスなし"
-            bbox_list = element.get("bbox", [])
-            if bbox_list:
-                bbox_details = []
-                for bbox in bbox_list:
-                    if bbox.get("page_id", 0) == page_id:
-                        coord = bbox.get("coord", [])
-                        if len(coord) >= 4:
-                            bbox_details.append(
-                                f"[{coord[0]:.0f}, {coord[1]:.0f}, {coord[2]:.0f}, {coord[3]:.0f}]"
-                            )
-                bbox_info = "; ".join(bbox_details) if bbox_details else "無効なバウンディングボックス"
+        # 強調表示する要素がある場合のみ、赤枠のスタイルとスクロールを追加
+        highlight_style = highlight_script = ""
+        if any(item["index"] in highlight for item in page_elements):
+            highlight_style = (
+                f"\n            #{container_id} rect.b.h {{ stroke: #ff1744 !important; stroke-width: 4; fill-opacity: 0.3; }}"
+            )
+            highlight_script = """
+                var highlighted = svg.querySelector("rect.h");
+                if (highlighted) { highlighted.scrollIntoView({block: "center"}); }"""
+
+        type_styles = "".join(
+            f"#{container_id} .{type_class} {{ stroke: {self._get_element_color(element_type)}; "
+            f"fill: {self._get_element_color(element_type)}; }}\n"
+            for element_type, type_class in type_classes.items()
+        )
 
-            # 要素リスト表示のために共有コンテンツレンダラーを使用
-            display_content = self._render_element_content(element, for_tooltip=False)
+        styles = f"""
+        <style>
+            #{container_id} rect.b {{ fill-opacity: 0.15; stroke-width: 2; cursor: pointer; }}
+            #{container_id} rect.b:hover {{ fill: #ffff00 !important; fill-opacity: 0.3; stroke-width: 3; }}
+            #{container_id} text.l {{ font: bold 9px sans-serif; stroke: white !important; stroke-width: 3px;
+                paint-order: stroke; pointer-events: none; }}
+            #{container_id} .bbox-tooltip {{ position: absolute; display: none; background: rgba(255, 255, 255, 0.98);
+                color: #333; border: 2px solid #ccc; padding: 12px; border-radius: 6px; font-size: 12px;
+                word-wrap: break-word; z-index: 10000; pointer-events: none; box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
+                line-height: 1.4; max-height: 400px; overflow-y: auto; }}
+            #{container_id} .bbox-tooltip-title {{ font-weight: bold; color: #0066cc; margin-bottom: 8px;
+                padding-bottom: 6px; border-bottom: 1px solid #ddd; }}
+            #{container_id} .bbox-tooltip-body {{ font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif; font-size: 11px; }}
+            {type_styles}{highlight_style}
+        </style>
+        """
+
+        # </script> でデータブロックが閉じられないようにエスケープ
+        tooltip_json = json.dumps(tooltip_data, ensure_ascii=False).replace("</", "<\\/")
+
+        overlay = f"""
+            <svg width="{display_width}" height="{display_height}" style="position: absolute; left: 0; top: 0; overflow: visible;">{''.join(shapes)}</svg>
+            <div class="bbox-tooltip"></div>
+            <script type="application/json" class="bbox-data">{tooltip_json}</script>
+            <script>
+            (function () {{
+                var root = document.getElementById("{container_id}");
+                var data = JSON.parse(root.querySelector(".bbox-data").textContent);
+                var tooltip = root.querySelector(".bbox-tooltip");
+                var svg = root.querySelector("svg");
+                svg.addEventListener("mouseover", function (event) {{
+                    var index = event.target.getAttribute("data-e");
+                    if (index === null) {{ return; }}
+                    var item = data[+index];
+                    var box = event.target;
+                    tooltip.innerHTML = '<div class="bbox-tooltip-title">' + item.t + '</div>' +
+                        '<div class="bbox-tooltip-body">' + item.h + '</div>';
+                    tooltip.style.width = item.w + "px";
+                    tooltip.style.left = (box.x.baseVal.value + 10) + "px";
+                    tooltip.style.top = (box.y.baseVal.value + box.height.baseVal.value) + "px";
+                    tooltip.style.display = "block";
+                }});
+                svg.addEventListener("mouseout", function (event) {{
+                    if (event.target.getAttribute("data-e") !== null) {{ tooltip.style.display = "none"; }}
+                }});
+{highlight_script}
+            }})();
+            </script>
+        """
+        return styles, overlay
+
+    def _create_element_card(self, entry: Dict) -> str:
+        """要素リストに表示する1要素分のカードHTMLを作成します。"""
+        element = entry["element"]
+        element_id = element.get("id", "N/A")
+        element_type = element.get("type", "unknown")
+        color = self._get_element_color(element_type)
 
-            element_html = f"""
+        # このページのためのバウンディングボックス情報を取得
+        bbox_info = self._format_bbox_info(entry)
+
+        # 要素リスト表示のために共有コンテンツレンダラーを使用
+        display_content = self._render_entry_content(entry, for_tooltip=False)
+
+        return f"""
             <div style="border-left: 5px solid {color}; 
                        padding: 15px; margin: 15px 0; 
                        background: {color}15; border-radius: 5px;">
@@ -642,47 +2261,261 @@ class DocumentRenderer:
                 </div>
             </div>
             """
-            html_parts.append(element_html)
+
+    def _format_bbox_info(self, entry: Dict) -> str:
+        """要素リストに表示するこのページのバウンディングボックス座標の文字列を返します。"""
+        bbox_details = [
+            f"[{x1:.0f}, {y1:.0f}, {x2:.0f}, {y2:.0f}]"
+            for x1, y1, x2, y2 in entry["boxes"].coords(*entry["rows"]).tolist()
+        ]
+        return "; ".join(bbox_details) if bbox_details else "無効なバウンディングボックス"
+
+    def _create_page_elements_list(self, page_id: int, page_entries: List[Dict]) -> str:
+        """特定のページの要素の詳細リストを作成します。
+
+        element_list_window が設定されている場合は、先頭の要素のみをHTMLとして描画し、
+        残りはスクロールまたは「さらに表示」で読み込む仮想化リストを返します。
+
+        引数:
+            page_id: ページID
+            page_entries: ページインデックスから取得したこのページの要素エントリ
+        """
+        if not page_entries:
+            return f"<p>ページ {page_id + 1} に要素が見つかりません</p>"
+
+        if self.collapse_element_list:
+            # 出力予算のため、要素タイプごとの件数のみを表示
+            type_counts: Dict[str, int] = {}
+            for entry in page_entries:
+                element_type = entry["element"].get("type", "unknown")
+                type_counts[element_type] = type_counts.get(element_type, 0) + 1
+            counts = ", ".join(f"{t}: {c}" for t, c in type_counts.items())
+            return f"""
+        <div style="margin: 20px 0;">
+            <h3 style="color: #333; margin-bottom: 15px;">📋 ページ {page_id + 1} の要素 ({len(page_entries)} アイテム)</h3>
+            <p style="color: #666;">{counts}（出力サイズの上限のため要素リストは省略されました）</p>
+        </div>
+        """
+
+        if self.element_list_window:
+            return self._create_windowed_elements_list(page_id, page_entries)
+
+        html_parts = [self._create_element_card(entry) for entry in page_entries]
 
         return f"""
         <div style="margin: 20px 0;">
-            <h3 style="color: #333; margin-bottom: 15px;">📋 ページ {page_id + 1} の要素 ({len(page_elements)} アイテム)</h3>
+            <h3 style="color: #333; margin-bottom: 15px;">📋 ページ {page_id + 1} の要素 ({len(page_entries)} アイテム)</h3>
             {''.join(html_parts)}
         </div>
         """
 
+    def _create_windowed_elements_list(self, page_id: int, page_entries: List[Dict]) -> str:
+        """要素タイプのフィルタチップを持つ仮想化された要素リストを作成します。
+
+        HTMLとして描画するのは先頭の element_list_window 件のみです。全要素は軽量なレコード
+        （タイプ、ID、座標、カード本文）としてJSONで渡し、残りのカードはブラウザ側で同じ件数ずつ生成します。
+        各要素の本文は出力に1回だけ含めます。描画済みのカードのレコードは本文を持たず、
+        フィルタの適用時はブラウザ側で描画済みのカードを再利用します。
+        """
+        window = self.element_list_window
+        list_id = f"element_list_{page_id}_{id(self)}"
+
+        # タイプごとの件数とチップの表示順（ドキュメント順の初出順）
+        type_slots: Dict[str, int] = {}
+        type_counts: List[int] = []
+        records = []
+        for entry in page_entries:
+            element = entry["element"]
+            element_type = element.get("type", "unknown")
+            slot = type_slots.get(element_type)
+            if slot is None:
+                slot = type_slots[element_type] = len(type_slots)
+                type_counts.append(0)
+            type_counts[slot] += 1
+            records.append([
+                slot,
+                str(element.get("id", "N/A")),
+                self._format_bbox_info(entry),
+                # 先頭のウィンドウはサーバー側で描画したカードを使うため本文を渡さない
+                self._render_entry_content(entry, for_tooltip=False) if len(records) >= window else None,
+            ])
+
+        types = [
+            {
+                "name": element_type,
+                "label": element_type.upper().replace("_", " "),
+                "color": self._get_element_color(element_type),
+            }
+            for element_type in type_slots
+        ]
+
+        chips = "".join(
+            f'<button type="button" class="element-chip" data-slot="{slot}" '
+            f'style="border: 1px solid {info["color"]}; background: #fff; color: #333; '
+            f'border-radius: 12px; padding: 2px 10px; margin: 0 6px 6px 0; font-size: 12px; cursor: pointer;">'
+            f'<span style="color: {info["color"]};">●</span> {info["name"]} ({type_counts[slot]})</button>'
+            for slot, info in enumerate(types)
+        )
+
+        # 先頭のウィンドウのみサーバー側で描画（JavaScriptが無効でも最初の要素は見える）
+        first_cards = "".join(
+            self._create_element_card(entry) for entry in page_entries[:window]
+        )
+        remaining = max(len(page_entries) - window, 0)
+
+        # </script> でデータブロックが閉じられないようにエスケープ
+        list_json = json.dumps(
+            {"window": window, "types": types, "records": records}, ensure_ascii=False
+        ).replace("</", "<\\/")
+
+        return f"""
+        <div id="{list_id}" style="margin: 20px 0;">
+            <h3 style="color: #333; margin-bottom: 15px;">📋 ページ {page_id + 1} の要素 ({len(page_entries)} アイテム)</h3>
+            <div class="element-chips" style="margin-bottom: 6px;">{chips}</div>
+            <div class="element-status" style="font-size: 12px; color: #666;">{min(window, len(page_entries))} / {len(page_entries)} 件を表示中</div>
+            <div class="element-cards">{first_cards}</div>
+            <button type="button" class="element-more" style="display: {'inline-block' if remaining else 'none'}; margin: 10px 0; padding: 6px 14px; cursor: pointer;">さらに表示</button>
+            <script type="application/json" class="element-data">{list_json}</script>
+            <script>
+            (function () {{
+                var root = document.getElementById("{list_id}");
+                var data = JSON.parse(root.querySelector(".element-data").textContent);
+                var cards = root.querySelector(".element-cards");
+                var more = root.querySelector(".element-more");
+                var status = root.querySelector(".element-status");
+                var active = {{}};
+                var matches = null;
+                var shown = Math.min(data.window, data.records.length);
+                // サーバー側で描画した先頭のウィンドウのカード（フィルタの適用時に再利用）
+                var rendered = Array.prototype.slice.call(cards.children);
+
+                function renderCard(index) {{
+                    var record = data.records[index];
+                    if (record[3] === null) {{ return rendered[index]; }}
+                    var type = data.types[record[0]];
+                    var card = document.createElement("div");
+                    card.style.cssText = "border-left: 5px solid " + type.color + "; padding: 15px; margin: 15px 0; " +
+                        "background: " + type.color + "15; border-radius: 5px;";
+                    card.innerHTML =
+                        '<div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 10px;">' +
+                        '<h4 style="margin: 0; color: ' + type.color + '; font-size: 16px;"></h4>' +
+                        '<code style="background: #f5f5f5; padding: 3px 6px; border-radius: 3px; font-size: 10px; max-width: 300px; word-break: break-all;"></code>' +
+                        '</div><div style="font-size: 14px; line-height: 1.4;">' + record[3] + '</div>';
+                    card.querySelector("h4").textContent = type.label + " (ID: " + record[1] + ")";
+                    card.querySelector("code").textContent = record[2];
+                    return card;
+                }}
+
+                function total() {{
+                    return matches === null ? data.records.length : matches.length;
+                }}
+
+                function showMore() {{
+                    var end = Math.min(shown + data.window, total());
+                    var fragment = document.createDocumentFragment();
+                    for (var i = shown; i < end; i++) {{
+                        fragment.appendChild(renderCard(matches === null ? i : matches[i]));
+                    }}
+                    cards.appendChild(fragment);
+                    shown = end;
+                    update();
+                }}
+
+                function update() {{
+                    status.textContent = shown + " / " + total() + " 件を表示中";
+                    more.style.display = shown < total() ? "inline-block" : "none";
+                }}
+
+                function applyFilter() {{
+                    var slots = Object.keys(active);
+                    matches = null;
+                    if (slots.length) {{
+                        matches = [];
+                        for (var i = 0; i < data.records.length; i++) {{
+                            if (active[data.records[i][0]]) {{ matches.push(i); }}
+                        }}
+                    }}
+                    cards.innerHTML = "";
+                    shown = 0;
+                    showMore();
+                }}
+
+                root.querySelector(".element-chips").addEventListener("click", function (event) {{
+                    var chip = event.target.closest ? event.target.closest(".element-chip") : event.target;
+                    if (!chip || chip.getAttribute("data-slot") === null) {{ return; }}
+                    var slot = chip.getAttribute("data-slot");
+                    if (active[slot]) {{
+                        delete active[slot];
+                        chip.style.background = "#fff";
+                    }} else {{
+                        active[slot] = true;
+                        chip.style.background = data.types[+slot].color + "40";
+                    }}
+                    applyFilter();
+                }});
+                more.addEventListener("click", showMore);
+
+                // スクロールで末尾に近づいたら次のウィンドウを自動的に読み込む
+                if (window.IntersectionObserver) {{
+                    new IntersectionObserver(function (observed) {{
+                        if (observed[0].isIntersecting && shown < total()) {{ showMore(); }}
+                    }}, {{ rootMargin: "400px" }}).observe(more);
+                }}
+            }})();
+            </script>
+        </div>
+        """
+
     def _create_summary(
-        self, document: Dict, metadata: Dict, selected_pages: Set[int], total_pages: int
+        self,
+        page_index: Dict[int, Dict[str, Any]],
+        metadata: Dict,
+        selected_page_ids: List[int],
+        total_pages: int,
     ) -> str:
-        """ページ選択情報を含む要約を作成します。"""
-        elements = document.get("elements", [])
-
-        # 選択されたページの要素のみをカウント
-        selected_elements = []
-        for elem in elements:
-            for bbox in elem.get("bbox", []):
-                if bbox.get("page_id", 0) in selected_pages:
-                    selected_elements.append(elem)
-                    break
+        """ページ選択情報を含む要約を作成します。
 
-        # タイプ別にカウント（選択されたページのため）
-        type_counts = {}
-        for elem in selected_elements:
-            elem_type = elem.get("type", "unknown")
-            type_counts[elem_type] = type_counts.get(elem_type, 0) + 1
+        引数:
+            page_index: _get_page_index のページインデックス（ページIDがキー）
+            metadata: ドキュメントのメタデータ
+            selected_page_ids: 選択されたページのID
+            total_pages: ドキュメントの元のページ数
+        """
+        # 選択されたページの要素のみをカウント（インデックスから取得）
+        selected_page_entries = [
+            page_index[page_id] for page_id in selected_page_ids if page_id in page_index
+        ]
+
+        if len(selected_page_entries) == 1:
+            # 単一ページの場合は事前計算済みのタイプ別カウントをそのまま使用
+            page_entry = selected_page_entries[0]
+            selected_element_count = len(page_entry["entries"])
+            type_counts = page_entry["type_counts"]
+        else:
+            # 複数ページにまたがる要素を重複してカウントしないよう、ドキュメント順に集計
+            selected_elements = {}
+            for page_entry in selected_page_entries:
+                for entry in page_entry["entries"]:
+                    selected_elements[entry["index"]] = entry["element"]
+
+            type_counts = {}
+            for elem_idx in sorted(selected_elements):
+                elem_type = selected_elements[elem_idx].get("type", "unknown")
+                type_counts[elem_type] = type_counts.get(elem_type, 0) + 1
+            selected_element_count = len(selected_elements)
 
         type_list = ", ".join([f"{t}: {c}" for t, c in type_counts.items()])
 
         # ページ選択情報を作成
-        if len(selected_pages) == total_pages:
+        if len(selected_page_ids) == total_pages:
             page_info = f"すべての {total_pages} ページ"
         else:
             # 表示のために1ベースに変換
-            page_nums = sorted([p + 1 for p in selected_pages])
+            page_nums = sorted([p + 1 for p in selected_page_ids])
             if len(page_nums) <= 10:
-                page_info = f"ページ {', '.join(map(str, page_nums))} ({len(selected_pages)} of {total_pages})"
+                page_info = f"ページ {', '.join(map(str, page_nums))} ({len(selected_page_ids)} of {total_pages})"
             else:
-                page_info = f"{len(selected_pages)} of {total_pages} ページが選択されました"
+                page_info = f"{len(selected_page_ids)} of {total_pages} ページが選択されました"
 
         doc_id = str(metadata.get('id', 'N/A'))
 
@@ -690,12 +2523,353 @@ class DocumentRenderer:
         <div style="background: #e3f2fd; border: 1px solid #2196f3; border-radius: 8px; padding: 20px;">
             <h3 style="margin: 0 0 10px 0; color: #1976d2;">📄 ドキュメント要約</h3>
             <p style="margin: 8px 0;"><strong>表示中:</strong> {page_info}</p>
-            <p style="margin: 8px 0;"><strong>選択されたページの要素:</strong> {len(selected_elements)}</p>
+            <p style="margin: 8px 0;"><strong>選択されたページの要素:</strong> {selected_element_count}</p>
             <p style="margin: 8px 0;"><strong>要素タイプ:</strong> {type_list if type_list else 'なし'}</p>
             <p style="margin: 8px 0;"><strong>ドキュメントID:</strong> <span style="font-family: monospace; font-size: 0.9em;">{doc_id}</span></p>
         </div>
         """
 
+    def _to_parsed_dict(self, parsed_result: Any) -> Optional[Dict]:
+        """解析結果を辞書に変換します。変換できない場合はNoneを返します。
+
+        VARIANT値、辞書のほか、JSON文字列や parsed_json 列を持つSparkのRowも受け付けます。
+        """
+        if hasattr(parsed_result, "parsed_json"):
+            return json.loads(parsed_result.parsed_json)
+        elif isinstance(parsed_result, str):
+            return json.loads(parsed_result)
+        elif hasattr(parsed_result, "toPython"):
+            return parsed_result.toPython()
+        elif hasattr(parsed_result, "toJson"):
+            return json.loads(parsed_result.toJson())
+        elif isinstance(parsed_result, dict):
+            return parsed_result
+        return None
+
+    def render_options_key(self) -> Tuple:
+        """レンダリング結果に影響するオプションのタプルを返します（キャッシュキー用）。"""
+        return (
+            self.image_format,
+            self.image_quality,
+            self.retina,
+            self.max_display_width,
+            self.image_mode,
+            self.image_export_dir,
+            self.image_base_url,
+            self.overlay_mode,
+            self.element_list_window,
+            self.table_preview_rows,
+            self.tooltip_max_chars,
+            self.image_scale,
+            self.collapse_element_list,
+            self.page_byte_budget,
+            self.output_byte_budget,
+            tuple(sorted((repr(key), tuple(sorted(indices))) for key, indices in self.highlight_elements.items())),
+        )
+
+    def _degraded_renderer(self, level: int) -> "DocumentRenderer":
+        """degradation_levels の先頭 level 段階を適用した設定のレンダラーを返します。
+
+        自身の設定は変更しないため、同じレンダラーを共有する事前レンダリングのスレッドには影響しません。
+        """
+        degraded = self._degraded_renderers.get(level)
+        if degraded is not None:
+            return degraded
+
+        degraded = copy.copy(self)
+        # 設定が異なるため、プレビューとページインデックスのキャッシュは共有しない
+        degraded._table_previews = OrderedDict()
+        degraded._page_indexes = OrderedDict()
+        degraded._page_index_lock = threading.Lock()
+        degraded._degraded_renderers = {}
+        if degraded.image_format not in ("JPEG", "WEBP"):
+            # PNGや元のファイルには品質の設定がないためJPEGで再エンコード
+            degraded.image_format = "JPEG"
+        for overrides, _ in self.degradation_levels[:level]:
+            for name, value in overrides.items():
+                current = getattr(degraded, name)
+                if isinstance(value, bool) or current is None:
+                    setattr(degraded, name, value)
+                else:
+                    setattr(degraded, name, min(current, value))
+
+        self._degraded_renderers[level] = degraded
+        return degraded
+
+    @staticmethod
+    def _has_page_image(page: Dict, page_entries: List[Dict]) -> bool:
+        """注釈付き画像のためにページ画像を読み込むページか（画像URIと有効なbboxを持つ要素がある）を返します。"""
+        return bool(page.get("image_uri")) and any(entry["valid_count"] for entry in page_entries)
+
+    def _start_image_loader(
+        self,
+        pages: List[Dict],
+        selected_pages: List[int],
+        page_index: Dict[int, Dict[str, Any]],
+        document_key: Any,
+    ) -> Optional[PageImageLoader]:
+        """選択ページのうち画像と有効なbboxを持つページの画像の先読みを開始します。
+
+        先読みするページが2ページ未満、または image_workers が1以下の場合はNoneを返します。
+        各ページの画像I/Oとエンコードの所要時間は、スレッド上でもそのページに帰属します。
+        """
+        if self.image_workers <= 1:
+            return None
+
+        targets = []
+        for page_idx in selected_pages:
+            if page_idx >= len(pages):
+                continue
+            page = pages[page_idx]
+            page_id = page.get("id", page_idx)
+            if self._has_page_image(page, page_index.get(page_id, {}).get("entries", [])):
+                targets.append((page_id, page["image_uri"]))
+        if len(targets) < 2:
+            return None
+
+        def load(page_id: int, image_uri: str) -> Dict[str, Any]:
+            with self.timings.scope(document_key, page_id + 1):
+                return self._prepare_page_image(image_uri)
+
+        return PageImageLoader(load, targets, max_workers=min(self.image_workers, len(targets)))
+
+    def _render_page_within_budget(
+        self,
+        page: Dict,
+        page_id: int,
+        page_entries: List[Dict],
+        budget: Optional[int],
+        highlight: frozenset = frozenset(),
+        prepared_image: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, str, int, int]:
+        """注釈付き画像と要素リストを、合計バイト数が budget 以下になるまで劣化させながらレンダリングします。
+
+        ページ画像は一度だけ読み込み（先読み済みの場合は prepared_image を使用）、劣化させた段階では
+        同じ内容を再エンコードします。
+
+        戻り値:
+            (注釈付き画像HTML, 要素リストHTML, 適用した劣化段階の数, 出力バイト数) のタプル。
+            すべての段階を適用しても予算を超える場合は、最後の段階の結果を返します
+        """
+        if prepared_image is None and self._has_page_image(page, page_entries):
+            prepared_image = self._prepare_page_image(page["image_uri"])
+        level = 0
+        renderer = self
+        while True:
+            annotated_html = renderer._create_annotated_image(
+                page, page_entries, highlight, prepared_image
+            )
+            with self.timings.stage("list"):
+                list_html = renderer._create_page_elements_list(page_id, page_entries)
+            size = len(annotated_html.encode("utf-8")) + len(list_html.encode("utf-8"))
+            if budget is None or size <= budget or level == len(self.degradation_levels):
+                return annotated_html, list_html, level, size
+            level += 1
+            renderer = self._degraded_renderer(level)
+            if prepared_image is not None:
+                # 読み込み済みの画像を劣化させた設定で再エンコード（ファイルは読み直さない）
+                prepared_image = renderer._prepare_page_image(page["image_uri"], prepared_image["source"])
+
+    def iter_render_fragments(
+        self,
+        parsed_result: Any,
+        page_selection: Union[str, None] = None,
+        document_key: Any = None,
+    ) -> Iterator[str]:
+        """render_document が表示するHTMLフラグメントを表示順に生成します。
+
+        各ステージの所要時間は self.timings に記録されます。要約とレジェンドのフラグメントは
+        SummaryFragment で、レンダリングの完了後にステージ別所要時間の行を埋め込めます。
+        フラグメントを消費する側（表示処理など）で計測した時間も、生成中はこのドキュメントに帰属します。
+
+        引数:
+            parsed_result: 解析されたドキュメント結果
+            page_selection: ページ選択文字列（render_document と同じ形式）
+            document_key: 所要時間の記録に使うドキュメントのキー（Noneの場合はメタデータのID）
+        """
+        image_loader = None
+        try:
+            # 辞書に変換
+            decode_start = time.perf_counter()
+            parsed_dict = self._to_parsed_dict(parsed_result)
+            decode_seconds = time.perf_counter() - decode_start
+            if parsed_dict is None:
+                yield f"<p style='color: red;'>❌ 結果を変換できませんでした。タイプ: {type(parsed_result)}</p>"
+                return
+
+            # コンポーネントを抽出
+            document = parsed_dict.get("document", {})
+            pages = document.get("pages", [])
+            elements = document.get("elements", [])
+            metadata = parsed_dict.get("metadata", {})
+
+            if document_key is None:
+                document_key = metadata.get("id", "document")
+            self.timings.record("decode", decode_seconds, document_key)
+            highlight = self.highlight_elements.get(document_key, frozenset())
+
+            if not elements:
+                yield "<p style='color: red;'>❌ ドキュメントに要素が見つかりません</p>"
+                return
+
+            with self.timings.scope(document_key):
+                # 全ステージで共有するページ→要素のインデックスを一度だけ構築（同じドキュメントでは再利用）
+                page_index = self._get_page_index(elements)
+
+                # ページ選択を解析（要素の述語はページインデックスで判定）
+                total_pages = self._total_page_count(document)
+                selected_pages = self._parse_page_selection(
+                    page_selection, total_pages, pages, page_index
+                )
+
+                # タイトル
+                yield "<h1>🔍 AI 解析ドキュメント結果</h1>"
+
+                # 要約HTMLを作成
+                summary_html = self._create_summary(
+                    page_index,
+                    metadata,
+                    [pages[page_idx].get("id", page_idx) for page_idx in selected_pages],
+                    total_pages,
+                )
+
+                # カラーレジェンドHTMLを作成
+                legend_items = []
+                for elem_type, color in self.element_colors.items():
+                    if elem_type != "default":
+                        legend_items.append(
+                            f"""
+                            <span style="display: inline-block; margin: 5px;">
+                                <span style="display: inline-block; width: 15px; height: 15px;
+                                            background: {color}; border: 1px solid #999; margin-right: 5px;"></span>
+                                {elem_type.replace('_', ' ').title()}
+                            </span>
+                        """
+                        )
+
+                legend_html = f"""
+                <div style="background: #f9f9f9; padding: 20px; border-radius: 8px; border: 1px solid #ddd;">
+                    <strong>🎨 要素の色:</strong><br>
+                    {''.join(legend_items)}
+                </div>
+                """
+
+                # 要約とレジェンドを横に表示（要約の下にステージ別所要時間の行。レンダリングの完了後に埋め込む）
+                combined_html = SummaryFragment(
+                    f"""
+                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 15px 0;">
+                    <div>
+                        {summary_html}
+                        <div style="font-size: 11px; color: #555; margin-top: 6px;">{SummaryFragment.placeholder}</div>
+                    </div>
+                    {legend_html}
+                </div>
+                """,
+                    document_key,
+                )
+
+                yield combined_html
+
+                # セルの出力予算の消費量と、劣化させた・省略したページ
+                emitted_bytes = len(combined_html.encode("utf-8"))
+                degraded_pages: List[int] = []
+                omitted_pages: List[int] = []
+
+                # 選択された要素で注釈付き画像を表示
+                if pages:
+                    yield "<h2>�️ 注釈付き画像と要素</h2>"
+
+                    # 複数ページでは画像の読み込み・縮小・エンコードを表示順に先読みし、
+                    # ファイルごとの待ち時間を重ねる（HTMLの組み立てと出力予算の判定は表示順に1ページずつ）
+                    image_loader = self._start_image_loader(pages, selected_pages, page_index, document_key)
+                    for page_idx in selected_pages:
+                        if page_idx < len(pages):
+                            page = pages[page_idx]
+                            page_id = page.get("id", page_idx)
+                            page_entries = page_index.get(page_id, {}).get("entries", [])
+
+                            # セルの出力予算を使い切った後のページはレンダリングせずに省略
+                            if omitted_pages:
+                                if image_loader:
+                                    image_loader.shutdown()
+                                    image_loader = None
+                                omitted_pages.append(page_id + 1)
+                                continue
+
+                            # このページに使える出力バイト数（ページの予算とセルの残りの予算の小さい方）
+                            page_budget = self.page_byte_budget
+                            if self.output_byte_budget is not None:
+                                remaining = self.output_byte_budget - emitted_bytes
+                                page_budget = remaining if page_budget is None else min(page_budget, remaining)
+
+                            # 注釈付き画像と要素リスト（このページの画像I/O・エンコード・オーバーレイ・リストを計測）
+                            with self.timings.scope(document_key, page_id + 1):
+                                annotated_html, list_html, level, page_bytes = self._render_page_within_budget(
+                                    page, page_id, page_entries, page_budget, highlight,
+                                    image_loader.get(page_id) if image_loader else None,
+                                )
+
+                            if self.output_byte_budget is not None and emitted_bytes + page_bytes > self.output_byte_budget:
+                                # 劣化させてもセルの出力予算に収まらない
+                                omitted_pages.append(page_id + 1)
+                                continue
+                            emitted_bytes += page_bytes
+
+                            if level:
+                                degraded_pages.append(page_id + 1)
+                                steps = "、".join(description for _, description in self.degradation_levels[:level])
+                                over = "（上限を超えています）" if page_bytes > page_budget else ""
+                                yield f"""
+                                <div style="background: #fff3cd; border: 1px solid #ffc107; color: #856404; padding: 8px 12px; border-radius: 5px; margin: 10px 0; font-size: 12px;">
+                                    📉 ページ {page_id + 1}: 出力サイズの上限 {page_budget / 1024:.0f} KB に収めるため{steps}
+                                    （出力 {page_bytes / 1024:.0f} KB）{over}
+                                </div>
+                                """
+
+                            highlighted = [entry["element"] for entry in page_entries if entry["index"] in highlight]
+                            if highlighted:
+                                labels = "、".join(
+                                    f"{element.get('type', 'unknown').upper()} #{element.get('id', 'N/A')}"
+                                    for element in highlighted
+                                )
+                                yield f"""
+                                <div style="background: #ffebee; border: 1px solid #ff1744; color: #b71c1c; padding: 8px 12px; border-radius: 5px; margin: 10px 0; font-size: 12px;">
+                                    🔎 強調表示: {labels}
+                                </div>
+                                """
+
+                            yield f"<div style='margin: 20px 0;'>{annotated_html}</div>"
+
+                            # 画像のすぐ後にこのページの要素
+                            yield list_html
+
+                if degraded_pages or omitted_pages:
+                    # 出力予算によって劣化・省略したページのレポート
+                    report = []
+                    if degraded_pages:
+                        report.append(f"ページ {', '.join(map(str, degraded_pages))} の画像や要素リストを劣化させました")
+                    if omitted_pages:
+                        report.append(
+                            f"{len(omitted_pages)} ページ（ページ {omitted_pages[0]} 以降）は省略しました。"
+                            "page_selection で表示するページを絞り込んでください"
+                        )
+                    yield f"""
+                    <div style="background: #fff3cd; border: 1px solid #ffc107; color: #856404; padding: 15px; border-radius: 5px; margin: 10px 0;">
+                        <strong>📉 出力サイズの上限:</strong>
+                        {'。'.join(report)}（出力 {emitted_bytes / 1024 / 1024:.1f} MB）
+                    </div>
+                    """
+
+        except Exception as e:
+            yield f"<p style='color: red;'>❌ エラー: {str(e)}</p>"
+            import traceback
+
+            yield f"<pre>{traceback.format_exc()}</pre>"
+        finally:
+            # 途中で省略・中断した場合も先読みのスレッドを停止
+            if image_loader:
+                image_loader.shutdown()
+
     def render_document(
         self, parsed_result: Any, page_selection: Union[str, None] = None
     ) -> None:
@@ -709,110 +2883,685 @@ class DocumentRenderer:
                 - "1-5": ページ 1 から 5 までを表示 (含む)
                 - "1,3,5": 特定のページを表示
                 - "1-3,7,10-12": 混合形式
+                - "10-"、"-3": ページ 10 から最後まで、最後の 3 ページ
+                - "type=table"、"has:figure"、"text:合計": 要素タイプや内容を含むページ
+        """
+        since = len(self.timings)
+        summary = summary_handle = None
+        for fragment in self.iter_render_fragments(parsed_result, page_selection):
+            # 表示時間はフラグメントを生成中のドキュメントに帰属する
+            with self.timings.stage("display"):
+                if isinstance(fragment, SummaryFragment):
+                    summary = fragment
+                    summary_handle = display(HTML(fragment), display_id=True)
+                else:
+                    display(HTML(fragment))
+
+        if summary_handle is not None:
+            # 要約の出力を、このレンダリングのステージ別所要時間を埋め込んだ静的なHTMLで置き換える
+            timing_row = self.timings.format_row(summary.document_key, since=since)
+            summary_handle.update(HTML(summary.with_timings(timing_row)))
+
+
+class RenderedPageCache:
+    """レンダリング済みページHTMLフラグメントを保持するメモリ上限付きLRUキャッシュ。
+
+    キーは (ドキュメント, ページ, レンダリングオプション) のタプルで、
+    保持しているフラグメントの合計バイト数が max_bytes を超えると古いものから破棄します。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Tuple[List[str], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Optional[List[str]]:
+        """キャッシュされたフラグメントを返します。存在しない場合はNoneを返します。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key: Tuple) -> bool:
+        # ヒット/ミスのカウンタには影響しない存在確認
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: Tuple, fragments: List[str]) -> None:
+        """フラグメントをキャッシュに追加し、上限を超えた分を古い順に破棄します。"""
+        size = sum(sys.getsizeof(fragment) for fragment in fragments)
+        if size > self.max_bytes:
+            # 単独で上限を超えるエントリはキャッシュしない
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (fragments, size)
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def stats(self) -> Dict[str, int]:
+        """ヒット数、ミス数、エントリ数、使用バイト数を返します。"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
+
+
+class DocumentRegistry:
+    """解析結果を生のJSONのまま保持し、選択されたときにだけデコードするレジストリ。
+
+    登録時に一度だけデコードして小さなヘッダー（パス、ページ数、要素数、エラー情報）を抽出し、
+    デコード済みの辞書は破棄します。get() でデコードしたドキュメントは max_decoded 件まで
+    LRUで保持されます。生のJSONはzlibで圧縮してメモリ上に保持するか、spill_dir を指定した
+    場合はローカルファイルに書き出され、メモリにはファイルパスのみが残ります。
+
+    source を指定すると、iter_headers() で走査したときに結果を1件ずつ取得して登録します。
+    ストリーム（toLocalIterator() など）の各行は1回だけ取得され、元の行は保持しないため、
+    ビューアや検索など複数の利用者がこのレジストリから何度でも先頭から読み直せます。
+
+    引数:
+        max_decoded: 同時にメモリ上に保持するデコード済みドキュメントの最大数
+        spill_dir: 生のJSONを書き出すローカルディレクトリ（Noneの場合はメモリ上に保持）
+        compress: メモリ上に保持する生のJSONをzlibで圧縮するかどうか
+        source: 未取得の解析結果のイテレータ（ストリーミングモード）
+    """
+
+    def __init__(
+        self,
+        max_decoded: int = 4,
+        spill_dir: Optional[str] = None,
+        compress: bool = True,
+        source: Optional[Iterable] = None,
+    ):
+        self.max_decoded = max_decoded
+        self.spill_dir = spill_dir
+        self.compress = compress
+        self._headers: List[Dict[str, Any]] = []
+        self._payloads: List[Tuple[str, Any]] = []
+        self._decoded: "OrderedDict[int, Dict]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._source = iter(source) if source is not None else None
+        self._source_lock = threading.Lock()
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._headers)
+
+    def add(self, result: Any) -> Dict[str, Any]:
+        """解析結果を登録し、抽出したヘッダーを返します。
+
+        引数:
+            result: parsed_json 列を持つRow、JSON文字列、辞書、またはVARIANT値
         """
+        path = getattr(result, "path", None) if not isinstance(result, dict) else None
+
+        # 生のJSONを取り出す（Row/文字列の場合）。それ以外は元のオブジェクトを保持
+        if hasattr(result, "parsed_json"):
+            raw_json = result.parsed_json
+        elif isinstance(result, str):
+            raw_json = result
+        else:
+            raw_json = None
+
+        header = {"path": path, "page_count": 0, "element_count": 0, "is_error": False, "message": None}
         try:
-            # 辞書に変換
-            if hasattr(parsed_result, "toPython"):
-                parsed_dict = parsed_result.toPython()
-            elif hasattr(parsed_result, "toJson"):
-                parsed_dict = json.loads(parsed_result.toJson())
-            elif isinstance(parsed_result, dict):
-                parsed_dict = parsed_result
+            if raw_json is not None:
+                parsed_dict = json.loads(raw_json)
+            elif hasattr(result, "toPython"):
+                parsed_dict = result.toPython()
+            elif hasattr(result, "toJson"):
+                parsed_dict = json.loads(result.toJson())
+            elif isinstance(result, dict):
+                parsed_dict = result
+            else:
+                parsed_dict = None
+        except ValueError as e:
+            parsed_dict = None
+            header.update(is_error=True, message=f"JSONをデコードできません: {e}")
+
+        if parsed_dict is None:
+            if not header["is_error"]:
+                header.update(is_error=True, message=f"未知のタイプ: {type(result)}")
+        elif parsed_dict.get("type") == "error":
+            header.update(
+                is_error=True,
+                message=parsed_dict.get("message", parsed_dict.get("error", "未知のエラー")),
+            )
+        else:
+            document = parsed_dict.get("document", {})
+            header["page_count"] = len(document.get("pages", []))
+            header["element_count"] = len(document.get("elements", []))
+
+        with self._lock:
+            header["index"] = len(self._headers)
+            if header["is_error"]:
+                # エラー結果は本体を保持しない
+                payload = ("none", None)
+            elif raw_json is not None and self.spill_dir:
+                spill_path = os.path.join(self.spill_dir, f"{header['index']}.json")
+                with open(spill_path, "w", encoding="utf-8") as f:
+                    f.write(raw_json)
+                payload = ("file", spill_path)
+            elif raw_json is not None and self.compress:
+                payload = ("zlib", zlib.compress(raw_json.encode("utf-8"), 1))
+            elif raw_json is not None:
+                payload = ("json", raw_json)
+            else:
+                # 辞書やVARIANT値は既にデコード済みのため、変換後の辞書をそのまま保持
+                payload = ("dict", parsed_dict)
+            self._headers.append(header)
+            self._payloads.append(payload)
+        return header
+
+    def payload(self, index: int) -> Tuple[str, Any]:
+        """指定されたドキュメントの保持形式と内容（圧縮したJSON、書き出したファイルのパスなど）を返します。
+
+        ワーカープロセスに渡し、payload_json() で生のJSONに戻せます。
+        """
+        with self._lock:
+            return self._payloads[index]
+
+    def raw_json(self, index: int) -> Optional[str]:
+        """指定されたドキュメントの生のJSON文字列を返します（デコードはしません）。"""
+        return self.payload_json(self.payload(index))
+
+    @staticmethod
+    def payload_json(payload: Tuple[str, Any]) -> Optional[str]:
+        """payload() の戻り値を生のJSON文字列に戻します。"""
+        kind, payload = payload
+        if kind == "none":
+            return None
+        elif kind == "dict":
+            return json.dumps(payload, ensure_ascii=False)
+        elif kind == "file":
+            with open(payload, "r", encoding="utf-8") as f:
+                return f.read()
+        elif kind == "zlib":
+            return zlib.decompress(payload).decode("utf-8")
+        return payload
+
+    def header(self, index: int) -> Dict[str, Any]:
+        """指定されたドキュメントのヘッダーを返します。"""
+        with self._lock:
+            return self._headers[index]
+
+    def headers(self) -> List[Dict[str, Any]]:
+        """登録済みの全ドキュメントのヘッダーを返します。"""
+        with self._lock:
+            return list(self._headers)
+
+    @property
+    def pending(self) -> bool:
+        """source にまだ取得していない結果が残っているかどうか。"""
+        return self._source is not None
+
+    def iter_headers(self) -> Iterator[Dict[str, Any]]:
+        """登録済みのヘッダーを先頭から返し、続けて source の残りを1件ずつ取得・登録しながら返します。
+
+        複数のスレッドから同時に走査でき、source の各結果は最初に到達した走査が1回だけ取得します。
+        """
+        index = 0
+        while True:
+            if index >= len(self):
+                with self._source_lock:
+                    if index >= len(self):
+                        if self._source is None:
+                            return
+                        try:
+                            result = next(self._source)
+                        except StopIteration:
+                            self._source = None
+                            return
+                        self.add(result)
+            yield self.header(index)
+            index += 1
+
+    def get(self, index: int) -> Optional[Dict]:
+        """指定されたドキュメントをデコードして返します（LRUでキャッシュ）。"""
+        with self._lock:
+            parsed_dict = self._decoded.get(index)
+            if parsed_dict is not None:
+                self._decoded.move_to_end(index)
+                return parsed_dict
+            kind, payload = self._payloads[index]
+
+        if kind == "none":
+            return None
+        elif kind == "dict":
+            return payload
+        elif kind == "file":
+            with open(payload, "r", encoding="utf-8") as f:
+                parsed_dict = json.load(f)
+        elif kind == "zlib":
+            parsed_dict = json.loads(zlib.decompress(payload))
+        else:
+            parsed_dict = json.loads(payload)
+
+        with self._lock:
+            self._decoded[index] = parsed_dict
+            while len(self._decoded) > self.max_decoded:
+                self._decoded.popitem(last=False)
+        return parsed_dict
+
+
+class DocumentSearchIndex:
+    """全ドキュメントの要素の content と description に対する全文検索用の転置インデックス。
+
+    テキストはNFKC正規化と小文字化を行い、HTMLタグを除いて、空白を1つにまとめたうえでCJK文字の
+    前後の空白（改行で分割された語など）を取り除きます。分かち書きのないCJKテキストにも
+    請求書番号のような英数字の一部分にも一致するよう、正規化したテキストの文字バイグラム
+    （2文字のコードポイントを1つの整数にしたもの）を索引語とし、ドキュメントごとにNumPyで
+    まとめて生成します。検索はクエリのバイグラムのポスティングリストを短い順に積集合し、
+    残った候補だけを部分文字列として照合します。
+
+    引数:
+        parsed_results: 単一の解析結果、解析結果のリスト、DocumentRegistry、または解析結果のイテレータ。
+            DocumentRegistry 以外はこのインデックスのレジストリに登録され、registry で参照できます
+        max_decoded_docs: レジストリが同時にメモリ上に保持するデコード済みドキュメントの最大数
+        spill_dir: 指定した場合、生のJSONをこのローカルディレクトリに書き出してメモリを節約します
+    """
+
+    # CJK文字（ひらがな・カタカナ、CJK統合漢字、ハングル、全角記号）の前後の空白。
+    # 空白を1つにまとめた後に適用し、リテラルの空白から照合を始めるため走査が速い
+    cjk_space_pattern = re.compile(
+        r" (?:(?<=[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\uff01-\uff60] )"
+        r"|(?=[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af\uff01-\uff60]))"
+    )
+    tag_pattern = re.compile(r"<[^>]+>")
+
+    def __init__(
+        self,
+        parsed_results: Any,
+        max_decoded_docs: int = 4,
+        spill_dir: Optional[str] = None,
+    ):
+        start = time.perf_counter()
+        if isinstance(parsed_results, DocumentRegistry):
+            self.registry = parsed_results
+        else:
+            self.registry = DocumentRegistry(max_decoded=max_decoded_docs, spill_dir=spill_dir)
+            if isinstance(parsed_results, list) or hasattr(parsed_results, "__next__"):
+                for result in parsed_results:
+                    self.registry.add(result)
             else:
-                display(
-                    HTML(
-                        f"<p style='color: red;'>❌ 結果を変換できませんでした。タイプ: {type(parsed_result)}</p>"
+                self.registry.add(parsed_results)
+
+        # 要素スロットごとの列（スロット = インデックス対象の1要素）
+        documents: List[int] = []
+        element_indices: List[int] = []
+        # スロットごとの (要素ID, タイプ, ((page_id, 座標), ...))
+        self._elements: List[Tuple[Any, str, Tuple[Tuple[int, Tuple[float, ...]], ...]]] = []
+        self._texts: List[str] = []
+        # ドキュメントごとの (索引語, スロット) の配列。最後にまとめてポスティングリストに変換
+        gram_chunks: List[np.ndarray] = []
+        slot_chunks: List[np.ndarray] = []
+
+        for header in self.registry.iter_headers():
+            if header["is_error"]:
+                continue
+            parsed_dict = self.registry.get(header["index"]) or {}
+            first_slot = len(self._texts)
+            for elem_idx, element in enumerate(parsed_dict.get("document", {}).get("elements", [])):
+                text = self.normalize(
+                    " ".join(
+                        str(element.get(field))
+                        for field in ("content", "description")
+                        if element.get(field)
+                    )
+                )
+                if not text:
+                    continue
+                documents.append(header["index"])
+                element_indices.append(elem_idx)
+                self._texts.append(text)
+                self._elements.append(
+                    (
+                        element.get("id", "N/A"),
+                        element.get("type", "unknown"),
+                        tuple(
+                            (bbox.get("page_id", 0), tuple(bbox.get("coord", [])))
+                            for bbox in element.get("bbox", []) or []
+                        ),
                     )
                 )
-                return
 
-            # コンポーネントを抽出
-            document = parsed_dict.get("document", {})
-            pages = document.get("pages", [])
-            elements = document.get("elements", [])
-            metadata = parsed_dict.get("metadata", {})
+            if len(self._texts) > first_slot:
+                grams, slots = self._document_grams(self._texts[first_slot:])
+                gram_chunks.append(grams)
+                slot_chunks.append(slots + first_slot)
+
+        # 索引語で安定ソートして分割すると、各ポスティングリストはスロット順のソート済み配列になる
+        # （すべてのポスティングリストは1つの配列のビューを共有）
+        self._postings: Dict[int, np.ndarray] = {}
+        if gram_chunks:
+            gram_array = np.concatenate(gram_chunks)
+            order = np.argsort(gram_array, kind="stable")
+            gram_array = gram_array[order]
+            slot_array = np.concatenate(slot_chunks)[order]
+            starts = np.flatnonzero(gram_array[1:] != gram_array[:-1]) + 1
+            self._postings = dict(
+                zip(gram_array[np.concatenate(([0], starts))].tolist(), np.split(slot_array, starts))
+            )
+        self._documents = np.asarray(documents, dtype=np.int32)
+        self._element_indices = np.asarray(element_indices, dtype=np.int32)
+        self.build_seconds = time.perf_counter() - start
+
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        """検索用にテキストを正規化します（インデックスとクエリで共通）。"""
+        text = unicodedata.normalize("NFKC", cls.tag_pattern.sub(" ", text)).lower()
+        return cls.cjk_space_pattern.sub("", " ".join(text.split()))
+
+    @staticmethod
+    def _codes(text: str) -> np.ndarray:
+        """テキストのコードポイントの配列を返します。"""
+        return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+
+    @staticmethod
+    def _sorted_unique(values: np.ndarray) -> np.ndarray:
+        """整数の配列をソートして重複を除きます（大きな配列では np.unique より速い）。"""
+        values = np.sort(values)
+        return values[np.concatenate(([True], values[1:] != values[:-1]))] if len(values) else values
+
+    @classmethod
+    def gram_ids(cls, text: str) -> np.ndarray:
+        """正規化したテキストの文字バイグラムを重複なしの整数の配列で返します。"""
+        codes = cls._codes(text)
+        return cls._sorted_unique((codes[:-1] << 21) | codes[1:])
+
+    @classmethod
+    def _document_grams(cls, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """1ドキュメント分の正規化したテキストから、要素内で重複のない (索引語, 要素の位置) の配列を返します。
+
+        テキストを改行（正規化後のテキストには現れない）で連結して一度にコードポイントに変換し、
+        改行をまたぐバイグラムを除きます。結果は索引語、要素の位置の順にソートされています。
+        """
+        codes = cls._codes("\n".join(texts))
+        positions = np.repeat(
+            np.arange(len(texts), dtype=np.int64), [len(text) + 1 for text in texts]
+        )[: len(codes)]
+        keep = (codes[:-1] != 10) & (codes[1:] != 10)
+        grams = ((codes[:-1] << 21) | codes[1:])[keep]
+        # 索引語（42ビット）と要素の位置（21ビット）を1つのキーにして、重複の除去とソートを同時に行う
+        keys = cls._sorted_unique((grams << 21) | positions[:-1][keep])
+        return keys >> 21, (keys & ((1 << 21) - 1)).astype(np.int32)
+
+    def __len__(self) -> int:
+        """インデックス対象の要素数。"""
+        return len(self._texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """インデックスの規模と構築時間を返します。"""
+        return {
+            "documents": len(set(self._documents.tolist())),
+            "elements": len(self._texts),
+            "terms": len(self._postings),
+            "postings_bytes": sum(slots.nbytes for slots in self._postings.values()),
+            "build_seconds": self.build_seconds,
+        }
+
+    def _candidate_slots(self, query: str) -> np.ndarray:
+        """クエリのバイグラムをすべて含む要素スロットを返します（照合前の候補）。"""
+        grams = self.gram_ids(query).tolist()
+        if not grams:
+            # 1文字のクエリはバイグラムがないため全要素が候補
+            return np.arange(len(self._texts), dtype=np.int32)
+        lists = [self._postings.get(gram) for gram in grams]
+        if any(slots is None for slots in lists):
+            return np.empty(0, dtype=np.int32)
+        lists.sort(key=len)
+        candidates = lists[0]
+        for slots in lists[1:]:
+            candidates = np.intersect1d(candidates, slots, assume_unique=True)
+            if not len(candidates):
+                break
+        return candidates
+
+    def search(self, query: str, limit: Optional[int] = 100, snippet_chars: int = 30) -> List[Dict[str, Any]]:
+        """クエリを含む要素を検索し、要素が現れるページごとのヒットを返します。
+
+        引数:
+            query: 検索文字列（インデックスと同じ正規化を行い、部分文字列として照合します）
+            limit: 返すヒットの最大数（Noneで無制限）
+            snippet_chars: スニペットに含める一致箇所の前後の文字数
+
+        戻り値:
+            ドキュメント、ページ、要素の順に並んだヒットのリスト。各ヒットは "document"
+            （レジストリのドキュメントインデックス）、"path"、"page"（1始まり）、"element_id"、
+            "element_index"、"type"、"bbox"（そのページのbboxの座標のリスト）、"snippet"、"match"
+            （スニペット内の一致箇所の (開始, 終了)）を持ちます
+        """
+        needle = self.normalize(query)
+        if not needle:
+            return []
+
+        hits: List[Dict[str, Any]] = []
+        for slot in self._candidate_slots(needle).tolist():
+            text = self._texts[slot]
+            position = text.find(needle)
+            if position < 0:
+                continue
+            doc_idx = int(self._documents[slot])
+            element_id, element_type, bboxes = self._elements[slot]
+            snippet_start = max(position - snippet_chars, 0)
+            snippet = text[snippet_start : position + len(needle) + snippet_chars]
+            match = (position - snippet_start, position - snippet_start + len(needle))
+
+            # bboxをページごとにまとめ、ページごとのヒットにする（bboxのない要素はページなし）
+            pages: Dict[int, List[List[float]]] = {}
+            for page_id, coord in bboxes:
+                pages.setdefault(page_id, []).append(list(coord))
+            for page_id, coords in sorted(pages.items()) or [(None, [])]:
+                hits.append(
+                    {
+                        "document": doc_idx,
+                        "path": self.registry.header(doc_idx).get("path"),
+                        "page": None if page_id is None else page_id + 1,
+                        "element_id": element_id,
+                        "element_index": int(self._element_indices[slot]),
+                        "type": element_type,
+                        "bbox": coords,
+                        "snippet": snippet,
+                        "match": match,
+                    }
+                )
+                if limit is not None and len(hits) >= limit:
+                    return hits
+        return hits
+
+
+class PagePrefetcher:
+    """隣接ページのHTMLフラグメントをバックグラウンドで事前にレンダリングします。
+
+    レンダリング結果は RenderedPageCache に格納され、ナビゲーション時にキャッシュヒットとなります。
+    prefetch() が呼ばれるたびに、新しい対象に含まれない未着手のジョブはキャンセルされます。
+
+    引数:
+        render_fn: (doc_idx, page_num) を受け取り、HTMLフラグメントのリストを返す関数
+        cache: 結果を格納するキャッシュ
+        key_fn: (doc_idx, page_num) からキャッシュキーを作る関数
+        max_workers: バックグラウンドスレッド数
+    """
 
-            if not elements:
-                display(
-                    HTML("<p style='color: red;'>❌ ドキュメントに要素が見つかりません</p>")
+    def __init__(
+        self,
+        render_fn: Callable[[Any, int], List[str]],
+        cache: RenderedPageCache,
+        key_fn: Callable[[Any, int], Tuple],
+        max_workers: int = 2,
+    ):
+        self.render_fn = render_fn
+        self.cache = cache
+        self.key_fn = key_fn
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="page-prefetch"
+        )
+        self._futures: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, targets: List[Tuple[Any, int]]) -> None:
+        """指定された (doc_idx, page_num) を事前レンダリングし、それ以外の未着手ジョブを取り消します。"""
+        keys = {self.key_fn(doc_idx, page_num): (doc_idx, page_num) for doc_idx, page_num in targets}
+
+        with self._lock:
+            # ユーザーが別の場所へ移動した場合、不要になったジョブをキャンセル
+            for key in list(self._futures):
+                if key not in keys:
+                    self._futures.pop(key).cancel()
+
+            for key, (doc_idx, page_num) in keys.items():
+                if key in self._futures or key in self.cache:
+                    continue
+                self._futures[key] = self._executor.submit(
+                    self._render_into_cache, key, doc_idx, page_num
                 )
-                return
 
-            # ページ選択を解析
-            selected_pages = self._parse_page_selection(page_selection, len(pages))
+    def _render_into_cache(self, key: Tuple, doc_idx: Any, page_num: int) -> List[str]:
+        fragments = self.render_fn(doc_idx, page_num)
+        self.cache.put(key, fragments)
+        return fragments
 
-            # タイトルを表示
-            display(HTML("<h1>🔍 AI 解析ドキュメント結果</h1>"))
-
-            # 要約HTMLを作成
-            summary_html = self._create_summary(
-                document, metadata, selected_pages, len(pages)
-            )
+    def wait(self, doc_idx: Any, page_num: int) -> Optional[List[str]]:
+        """実行中の事前レンダリングがあれば完了を待って結果を返します。なければNoneを返します。"""
+        with self._lock:
+            future = self._futures.pop(self.key_fn(doc_idx, page_num), None)
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
 
-            # カラーレジェンドHTMLを作成
-            legend_items = []
-            for elem_type, color in self.element_colors.items():
-                if elem_type != "default":
-                    legend_items.append(
-                        f"""
-                        <span style="display: inline-block; margin: 5px;">
-                            <span style="display: inline-block; width: 15px; height: 15px;
-                                        background: {color}; border: 1px solid #999; margin-right: 5px;"></span>
-                            {elem_type.replace('_', ' ').title()}
-                        </span>
-                    """
-                    )
+    def shutdown(self) -> None:
+        """未着手のジョブをキャンセルし、スレッドプールを停止します。"""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._executor.shutdown(wait=False)
 
-            legend_html = f"""
-            <div style="background: #f9f9f9; padding: 20px; border-radius: 8px; border: 1px solid #ddd;">
-                <strong>🎨 要素の色:</strong><br>
-                {''.join(legend_items)}
-            </div>
-            """
 
-            # 要約とレジェンドを横に表示
-            combined_html = f"""
-            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 15px 0;">
-                {summary_html}
-                {legend_html}
-            </div>
-            """
+class NavigationController:
+    """インタラクティブビューアのナビゲーション状態を管理するステートマシン。
 
-            display(HTML(combined_html))
+    ウィジェットの値をプログラムから同期する間に発生する変更通知（observe）を抑制し、
+    スライダーの連続した変更をデバウンスして、1回の論理的なナビゲーションにつき
+    レンダリングが1回だけ行われることを保証します。
 
-            # 選択された要素で注釈付き画像を表示
-            if pages:
-                display(HTML("<h2>�️ 注釈付き画像と要素</h2>"))
+    引数:
+        render_fn: (doc_idx, page_num) を受け取り、ページを表示する関数
+        sync_fn: (doc_idx, page_num) を受け取り、ウィジェットの値とラベルを更新する関数
+        debounce_seconds: デバウンス対象の操作を確定するまでの待機時間（秒）
+        close_fn: close() で呼ばれる後片付けの関数（事前レンダリングのスレッドプールの停止など）
+    """
 
-                # 表示のために選択されたページをソート
-                sorted_selected = sorted(selected_pages)
+    def __init__(
+        self,
+        render_fn: Callable[[Any, int], None],
+        sync_fn: Callable[[Any, int], None],
+        debounce_seconds: float = 0.15,
+        close_fn: Optional[Callable[[], None]] = None,
+    ):
+        self.render_fn = render_fn
+        self.sync_fn = sync_fn
+        self.debounce_seconds = debounce_seconds
+        self.close_fn = close_fn
+        self.doc_idx = None
+        self.page_num = None
+        self.render_count = 0
+        self._rendered = None
+        self._syncing = False
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def navigate(self, doc_idx: Any, page_num: int, debounce: bool = False) -> None:
+        """指定されたドキュメントとページに移動します。
 
-                for page_idx in sorted_selected:
-                    if page_idx < len(pages):
-                        page = pages[page_idx]
+        引数:
+            doc_idx: 移動先のドキュメントインデックス
+            page_num: 移動先のページ番号（1始まり）
+            debounce: Trueの場合、debounce_seconds の間に次の操作がなければ確定します
+        """
+        with self._lock:
+            # ウィジェット同期中に発生した変更通知は自身の更新なので無視
+            if self._syncing:
+                return
 
-                        # 注釈付き画像を表示
-                        annotated_html = self._create_annotated_image(page, elements)
-                        display(
-                            HTML(f"<div style='margin: 20px 0;'>{annotated_html}</div>")
-                        )
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
 
-                        # 画像のすぐ後にこのページの要素を表示
-                        page_id = page.get("id", page_idx)
-                        page_elements_html = self._create_page_elements_list(
-                            page_id, elements
-                        )
-                        display(HTML(page_elements_html))
+            if debounce and self.debounce_seconds > 0:
+                self._timer = threading.Timer(
+                    self.debounce_seconds, self._commit, args=(doc_idx, page_num)
+                )
+                self._timer.daemon = True
+                self._timer.start()
+                return
 
-        except Exception as e:
-            display(HTML(f"<p style='color: red;'>❌ エラー: {str(e)}</p>"))
-            import traceback
+            self._commit(doc_idx, page_num)
+
+    @contextmanager
+    def suppressed(self):
+        """ブロック内で発生したウィジェットの変更通知を無視します。"""
+        with self._lock:
+            previous = self._syncing
+            self._syncing = True
+            try:
+                yield
+            finally:
+                self._syncing = previous
+
+    def _commit(self, doc_idx: Any, page_num: int) -> None:
+        """状態を確定し、ウィジェットを同期して、必要な場合のみレンダリングします。"""
+        with self._lock:
+            self._timer = None
+            self.doc_idx = doc_idx
+            self.page_num = page_num
+
+            self._syncing = True
+            try:
+                self.sync_fn(doc_idx, page_num)
+            finally:
+                self._syncing = False
+
+            # 同じページが既に表示されている場合は再レンダリングしない
+            if self._rendered == (doc_idx, page_num):
+                return
+            self._rendered = (doc_idx, page_num)
+            self.render_count += 1
+            self.render_fn(doc_idx, page_num)
 
-            display(HTML(f"<pre>{traceback.format_exc()}</pre>"))
+    def close(self) -> None:
+        """保留中のデバウンスを取り消し、ビューアのバックグラウンド処理を停止します。"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if self.close_fn is not None:
+            self.close_fn()
 
 
 # 簡単な使用関数
-def render_ai_parse_output(parsed_result, page_selection=None):
+def render_ai_parse_output(parsed_result, page_selection=None, **renderer_options):
     """ページ選択を持つai_parse_document出力をレンダリングする簡単な関数。
 
     引数:
@@ -823,20 +3572,554 @@ def render_ai_parse_output(parsed_result, page_selection=None):
             - "1-5": ページ 1 から 5 までを表示
             - "1,3,5": 特定のページを表示
             - "1-3,7,10-12": 混合形式
+        renderer_options: DocumentRendererに渡すオプション（image_format、image_quality など）
     """
-    renderer = DocumentRenderer()
+    renderer = DocumentRenderer(**renderer_options)
     renderer.render_document(parsed_result, page_selection)
 
 
-def render_ai_parse_output_interactive(parsed_results):
+def render_ai_parse_output_client(parsed_result, page_selection=None, **renderer_options):
+    """ページ切り替えをブラウザ側のJavaScriptで行うビューアで ai_parse_document 出力を表示します。
+
+    ドキュメントごとに1つのコンパクトなJSONペイロード（ページ、スケーリング済みbbox配列、
+    要素コンテンツ）とページ画像を一度だけ出力し、ページ切り替え、bboxの描画、ツールチップは
+    すべてブラウザ側で行います。ページ切り替えにカーネルの処理は不要なため、
+    クラスターがビジー状態でも操作できます。
+
+    引数:
+        parsed_result: 解析されたドキュメント結果
+        page_selection: ペイロードに含めるページの選択文字列（Noneですべてのページ）
+        renderer_options: DocumentRendererに渡すオプション（image_format、image_mode など）
+    """
+    renderer = DocumentRenderer(**renderer_options)
+    parsed_dict = renderer._to_parsed_dict(parsed_result)
+    if parsed_dict is None:
+        display(HTML(f"<p style='color: red;'>❌ 結果を変換できませんでした。タイプ: {type(parsed_result)}</p>"))
+        return
+
+    document = parsed_dict.get("document", {})
+    pages = document.get("pages", [])
+    elements = document.get("elements", [])
+    if not elements or not pages:
+        display(HTML("<p style='color: red;'>❌ ドキュメントに要素が見つかりません</p>"))
+        return
+
+    page_index = renderer._get_page_index(elements)
+    selected_pages = renderer._parse_page_selection(
+        page_selection, renderer._total_page_count(document), pages, page_index
+    )
+
+    # 要素は複数ページに現れても一度だけ格納し、ページからはインデックスで参照する
+    element_slots: Dict[int, int] = {}
+    element_payload = []
+    page_payload = []
+
+    def build_page(page_renderer, page, page_id, entries, prepared_image):
+        """1ページ分のペイロードと、このページで初めて現れる要素のペイロードを作成します。
+
+        戻り値:
+            (ページのペイロード, 追加する (要素インデックス, 要素のペイロード) のリスト, JSONのバイト数) のタプル
+        """
+        geometry = prepared_image["geometry"]
+        encoded_image = prepared_image["encoded"]
+        new_slots: Dict[int, int] = {}
+        new_elements = []
+
+        page_elements = []
+        for entry in entries:
+            element = entry["element"]
+            slot = element_slots.get(entry["index"], new_slots.get(entry["index"]))
+            if slot is None:
+                slot = new_slots[entry["index"]] = len(element_payload) + len(new_elements)
+                element_type = element.get("type", "unknown")
+                new_elements.append(
+                    (
+                        entry["index"],
+                        {
+                            "type": element_type,
+                            "id": element.get("id", "N/A"),
+                            "color": page_renderer._get_element_color(element_type),
+                            "tip": page_renderer._render_entry_content(entry, for_tooltip=True),
+                            "tipWidth": page_renderer._calculate_tooltip_width(
+                                element, geometry["display_width"]
+                            ),
+                            "body": page_renderer._render_entry_content(entry, for_tooltip=False),
+                        },
+                    )
+                )
+
+            page_elements.append([slot, page_renderer._format_bbox_info(entry)])
+
+        boxes = []
+        if entries:
+            # ページの全bboxをまとめてスケーリングし、無効なボックスを除外
+            table = entries[0]["boxes"]
+            scaled = table.scaled(entries[0]["rows"][0], entries[-1]["rows"][1], geometry["scale_factor"])
+            slots = {**element_slots, **new_slots}
+            boxes = [
+                [x, y, width, height, slots[owner]]
+                for owner, x, y, width, height in zip(
+                    table.element[scaled["row"]].tolist(),
+                    scaled["x"].round(1).tolist(),
+                    scaled["y"].round(1).tolist(),
+                    scaled["width"].round(1).tolist(),
+                    scaled["height"].round(1).tolist(),
+                )
+            ]
+
+        record = {
+            "label": page_id + 1,
+            # 画像がないページは空のsrcを出力せず、ブラウザ側でプレースホルダーを表示
+            "src": encoded_image["src"] if encoded_image else None,
+            "uri": page.get("image_uri") or "",
+            "w": geometry["display_width"],
+            "h": geometry["display_height"],
+            "boxes": boxes,
+            "elements": page_elements,
+        }
+        size = len(
+            json.dumps([record, [payload for _, payload in new_elements]], ensure_ascii=False).encode("utf-8")
+        )
+        return record, new_elements, size
+
+    # ページごとのペイロードは出力予算の判定のため表示順に1ページずつ組み立て、
+    # 画像の読み込み・縮小・エンコードだけをスレッドプールで先読みする
+    document_key = parsed_dict.get("metadata", {}).get("id")
+    image_loader = renderer._start_image_loader(pages, selected_pages, page_index, document_key)
+    emitted_bytes = 0
+    degraded_pages = []
+    omitted_pages = []
+    try:
+        for page_idx in selected_pages:
+            page = pages[page_idx]
+            page_id = page.get("id", page_idx)
+            entries = page_index.get(page_id, {}).get("entries", [])
+
+            # セルの出力予算を使い切った後のページはペイロードに含めずに省略
+            if omitted_pages:
+                if image_loader:
+                    image_loader.shutdown()
+                    image_loader = None
+                omitted_pages.append(page_id + 1)
+                continue
+
+            # このページに使える出力バイト数（ページの予算とセルの残りの予算の小さい方）
+            page_budget = renderer.page_byte_budget
+            if renderer.output_byte_budget is not None:
+                remaining = renderer.output_byte_budget - emitted_bytes
+                page_budget = remaining if page_budget is None else min(page_budget, remaining)
+
+            # 画像を一度だけ読み込み、寸法の取得と縮小・再エンコードを行う（先読み済みの場合はその結果を使用）
+            prepared_image = image_loader.get(page_id) if image_loader else None
+            if prepared_image is None:
+                prepared_image = renderer._prepare_page_image(page.get("image_uri", ""))
+
+            # 予算を超える場合は劣化段階を順に適用し、読み込み済みの画像を再エンコード
+            level = 0
+            page_renderer = renderer
+            while True:
+                record, new_elements, page_bytes = build_page(page_renderer, page, page_id, entries, prepared_image)
+                if page_budget is None or page_bytes <= page_budget or level == len(renderer.degradation_levels):
+                    break
+                level += 1
+                page_renderer = renderer._degraded_renderer(level)
+                if prepared_image["source"] is not None:
+                    prepared_image = page_renderer._prepare_page_image(page["image_uri"], prepared_image["source"])
+
+            if renderer.output_byte_budget is not None and emitted_bytes + page_bytes > renderer.output_byte_budget:
+                # 劣化させてもセルの出力予算に収まらない
+                omitted_pages.append(page_id + 1)
+                continue
+            emitted_bytes += page_bytes
+            if level:
+                degraded_pages.append(page_id + 1)
+
+            for element_index, payload in new_elements:
+                element_slots[element_index] = len(element_payload)
+                element_payload.append(payload)
+            page_payload.append(record)
+    finally:
+        # 途中で省略・中断した場合も先読みのスレッドを停止
+        if image_loader:
+            image_loader.shutdown()
+
+    if not page_payload:
+        display(
+            HTML(
+                "<p style='color: red;'>❌ 出力サイズの上限に収まるページがありません。"
+                "output_byte_budget を増やすか page_selection でページを絞り込んでください</p>"
+            )
+        )
+        return
+
+    budget_report = ""
+    if degraded_pages or omitted_pages:
+        # 出力予算によって劣化・省略したページのレポート
+        report = []
+        if degraded_pages:
+            report.append(f"ページ {', '.join(map(str, degraded_pages))} の画像や要素を劣化させました")
+        if omitted_pages:
+            report.append(
+                f"{len(omitted_pages)} ページ（ページ {omitted_pages[0]} 以降）は省略しました。"
+                "page_selection で表示するページを絞り込んでください"
+            )
+        budget_report = f"""
+            <div style="background: #fff3cd; border: 1px solid #ffc107; color: #856404; padding: 15px; border-radius: 5px; margin: 10px 0;">
+                <strong>📉 出力サイズの上限:</strong>
+                {'。'.join(report)}（出力 {emitted_bytes / 1024 / 1024:.1f} MB）
+            </div>
+            """
+
+    container_id = f"client_viewer_{id(renderer)}"
+    # </script> でデータブロックが閉じられないようにエスケープ
+    payload_json = json.dumps(
+        {"pages": page_payload, "elements": element_payload}, ensure_ascii=False
+    ).replace("</", "<\\/")
+
+    display(
+        HTML(f"""
+        {budget_report}
+        <div id="{container_id}" tabindex="0">
+            <style>
+                #{container_id} .viewer-nav {{ display: flex; gap: 10px; align-items: center; margin: 10px 0; }}
+                #{container_id} .viewer-nav button {{ background: #2196f3; color: white; border: none; border-radius: 4px;
+                    padding: 6px 14px; cursor: pointer; }}
+                #{container_id} .viewer-nav button:disabled {{ background: #bbb; cursor: default; }}
+                #{container_id} .viewer-page {{ position: relative; display: inline-block; border: 2px solid #333;
+                    border-radius: 8px; overflow: visible; background: white; }}
+                #{container_id} .viewer-missing {{ box-sizing: border-box; background: #f8d7da; color: #721c24;
+                    padding: 15px; border-radius: 6px; font-size: 13px; word-break: break-all; }}
+                #{container_id} rect.b {{ fill-opacity: 0.15; stroke-width: 2; cursor: pointer; }}
+                #{container_id} rect.b:hover {{ fill: #ffff00 !important; fill-opacity: 0.3; stroke-width: 3; }}
+                #{container_id} text.l {{ font: bold 9px sans-serif; stroke: white; stroke-width: 3px;
+                    paint-order: stroke; pointer-events: none; }}
+                #{container_id} .bbox-tooltip {{ position: absolute; display: none; background: rgba(255, 255, 255, 0.98);
+                    color: #333; border: 2px solid #ccc; padding: 12px; border-radius: 6px; font-size: 12px;
+                    word-wrap: break-word; z-index: 10000; pointer-events: none; box-shadow: 0 4px 12px rgba(0, 0, 0, 0.15);
+                    line-height: 1.4; max-height: 400px; overflow-y: auto; }}
+                #{container_id} .bbox-tooltip-title {{ font-weight: bold; color: #0066cc; margin-bottom: 8px;
+                    padding-bottom: 6px; border-bottom: 1px solid #ddd; }}
+                #{container_id} .bbox-tooltip-body {{ font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif; font-size: 11px; }}
+            </style>
+            <div class="viewer-nav">
+                <button class="viewer-prev">◀ 前へ</button>
+                <select class="viewer-select"></select>
+                <button class="viewer-next">次 ▶</button>
+                <span class="viewer-label"></span>
+            </div>
+            <div class="viewer-page">
+                <img style="display: block;">
+                <div class="viewer-missing" style="display: none;"></div>
+                <svg style="position: absolute; left: 0; top: 0; overflow: visible;"></svg>
+                <div class="bbox-tooltip"></div>
+            </div>
+            <div class="viewer-list" style="margin: 20px 0;"></div>
+            <script type="application/json" class="viewer-data">{payload_json}</script>
+            <script>
+            (function () {{
+                var root = document.getElementById("{container_id}");
+                var data = JSON.parse(root.querySelector(".viewer-data").textContent);
+                var img = root.querySelector(".viewer-page img");
+                var missing = root.querySelector(".viewer-missing");
+                var svg = root.querySelector(".viewer-page svg");
+                var tooltip = root.querySelector(".bbox-tooltip");
+                var list = root.querySelector(".viewer-list");
+                var select = root.querySelector(".viewer-select");
+                var prev = root.querySelector(".viewer-prev");
+                var next = root.querySelector(".viewer-next");
+                var label = root.querySelector(".viewer-label");
+                var SVG_NS = "http://www.w3.org/2000/svg";
+                var current = 0;
+
+                data.pages.forEach(function (page, i) {{
+                    var option = document.createElement("option");
+                    option.value = i;
+                    option.textContent = "ページ " + page.label;
+                    select.appendChild(option);
+                }});
+
+                function show(n) {{
+                    current = Math.max(0, Math.min(n, data.pages.length - 1));
+                    var page = data.pages[current];
+                    var image = page.src ? img : missing;
+                    if (page.src) {{
+                        img.src = page.src;
+                        img.style.display = "block";
+                        missing.style.display = "none";
+                    }} else {{
+                        // 画像を読み込めなかったページはbboxをプレースホルダーの上に描画
+                        img.removeAttribute("src");
+                        img.style.display = "none";
+                        missing.textContent = page.uri ? "画像を読み込めませんでした: " + page.uri : "このページには画像がありません";
+                        missing.style.display = "block";
+                    }}
+                    image.style.width = page.w + "px";
+                    image.style.height = page.h + "px";
+                    svg.setAttribute("width", page.w);
+                    svg.setAttribute("height", page.h);
+                    tooltip.style.display = "none";
+
+                    // bboxを描画
+                    var fragment = document.createDocumentFragment();
+                    page.boxes.forEach(function (box) {{
+                        var element = data.elements[box[4]];
+                        var rect = document.createElementNS(SVG_NS, "rect");
+                        rect.setAttribute("class", "b");
+                        rect.setAttribute("data-e", box[4]);
+                        rect.setAttribute("x", box[0]);
+                        rect.setAttribute("y", box[1]);
+                        rect.setAttribute("width", box[2]);
+                        rect.setAttribute("height", box[3]);
+                        rect.setAttribute("stroke", element.color);
+                        rect.setAttribute("fill", element.color);
+                        fragment.appendChild(rect);
+
+                        // 可能な場合はボックスの上にラベルを配置
+                        var text = document.createElementNS(SVG_NS, "text");
+                        text.setAttribute("class", "l");
+                        text.setAttribute("x", box[0] + 2);
+                        text.setAttribute("y", box[1] >= 14 ? box[1] - 4 : box[1] + 11);
+                        text.setAttribute("fill", element.color);
+                        text.textContent = element.type.toUpperCase().slice(0, 6) + "#" + element.id;
+                        fragment.appendChild(text);
+                    }});
+                    svg.textContent = "";
+                    svg.appendChild(fragment);
+
+                    // このページの要素リスト
+                    list.innerHTML = '<h3 style="color: #333; margin-bottom: 15px;">📋 ページ ' + page.label +
+                        " の要素 (" + page.elements.length + " アイテム)</h3>" +
+                        page.elements.map(function (item) {{
+                            var element = data.elements[item[0]];
+                            return '<div style="border-left: 5px solid ' + element.color + '; padding: 15px; margin: 15px 0; background: ' +
+                                element.color + '15; border-radius: 5px;">' +
+                                '<div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 10px;">' +
+                                '<h4 style="margin: 0; color: ' + element.color + '; font-size: 16px;">' +
+                                element.type.toUpperCase().replace(/_/g, " ") + " (ID: " + element.id + ")</h4>" +
+                                '<code style="background: #f5f5f5; padding: 3px 6px; border-radius: 3px; font-size: 10px; max-width: 300px; word-break: break-all;">' +
+                                item[1] + "</code></div>" +
+                                '<div style="font-size: 14px; line-height: 1.4;">' + element.body + "</div></div>";
+                        }}).join("");
+
+                    select.value = current;
+                    prev.disabled = current === 0;
+                    next.disabled = current === data.pages.length - 1;
+                    label.textContent = (current + 1) + " / " + data.pages.length + " ページ";
+                }}
+
+                svg.addEventListener("mouseover", function (event) {{
+                    var index = event.target.getAttribute("data-e");
+                    if (index === null) {{ return; }}
+                    var element = data.elements[+index];
+                    var box = event.target;
+                    tooltip.innerHTML = '<div class="bbox-tooltip-title">' + element.type.toUpperCase() + " #" + element.id +
+                        '</div><div class="bbox-tooltip-body">' + element.tip + "</div>";
+                    tooltip.style.width = element.tipWidth + "px";
+                    tooltip.style.left = (box.x.baseVal.value + 10) + "px";
+                    tooltip.style.top = (box.y.baseVal.value + box.height.baseVal.value) + "px";
+                    tooltip.style.display = "block";
+                }});
+                svg.addEventListener("mouseout", function (event) {{
+                    if (event.target.getAttribute("data-e") !== null) {{ tooltip.style.display = "none"; }}
+                }});
+                prev.addEventListener("click", function () {{ show(current - 1); }});
+                next.addEventListener("click", function () {{ show(current + 1); }});
+                select.addEventListener("change", function () {{ show(+select.value); }});
+                root.addEventListener("keydown", function (event) {{
+                    if (event.key === "ArrowLeft") {{ show(current - 1); }}
+                    if (event.key === "ArrowRight") {{ show(current + 1); }}
+                }});
+
+                show(0);
+            }})();
+            </script>
+        </div>
+        """)
+    )
+
+
+def _format_bucket(low: int, high: Optional[int]) -> str:
+    """ヒストグラムの区間のラベル。"""
+    if high is None:
+        return f"{low}+"
+    return str(low) if low == high else f"{low}-{high}"
+
+
+def _histogram_html(buckets: List[Tuple[int, Optional[int]]], counts: List[int], unit: str, color: str) -> str:
+    """区間ごとの件数を横棒グラフのHTMLにします。"""
+    peak = max(counts) if counts and max(counts) else 1
+    rows = "".join(
+        f"<tr><td style='padding: 2px 8px; text-align: right; white-space: nowrap;'>{_format_bucket(low, high)} {unit}</td>"
+        f"<td style='padding: 2px 8px; width: 100%;'><div style='background: {color}; height: 12px; "
+        f"width: {count / peak * 100:.1f}%; min-width: {1 if count else 0}px;'></div></td>"
+        f"<td style='padding: 2px 8px; text-align: right;'>{count:,}</td></tr>"
+        for (low, high), count in zip(buckets, counts)
+    )
+    return f"<table style='border-collapse: collapse; font-size: 12px; width: 100%;'>{rows}</table>"
+
+
+def render_batch_dashboard(statistics: Dict[str, Any]) -> None:
+    """compute_batch_statistics の集計結果をバッチ統計ダッシュボードとして表示します。
+
+    引数:
+        statistics: compute_batch_statistics の戻り値
+    """
+    documents = statistics["documents"]
+    pages = statistics["pages"]
+    element_colors = DocumentRenderer().element_colors
+    panel = "background: #f0f0f0; padding: 15px; border-radius: 5px; margin: 10px 0;"
+
+    def number(value, digits=0):
+        return "-" if value is None else f"{value:,.{digits}f}"
+
+    def distribution(source, name, unit):
+        p50, p90 = source.get(f"{name[:-1]}_percentiles") or (None, None)
+        return (
+            f"最小 {number(source.get(f'min_{name}'))} / 平均 {number(source.get(f'avg_{name}'), 1)} / "
+            f"中央値 {number(p50)} / 90% {number(p90)} / 最大 {number(source.get(f'max_{name}'))} {unit}"
+        )
+
+    successful = documents["documents"] - documents["error_documents"]
+    cards = [
+        ("ドキュメント", number(documents['documents']), f"成功 {successful:,} / エラー {documents['error_documents']:,}"),
+        ("ページ", number(pages['pages']), f"要素のないページ {number(pages['empty_pages'])}"),
+        ("要素", number(documents['elements']), f"要素のないドキュメント {documents['documents_without_elements']:,}"),
+    ]
+    # テーブルと図は要素タイプ別の集計から抜き出して強調
+    type_rows = {row["type"]: row for row in statistics["types"]}
+    for elem_type, label in (("table", "テーブル"), ("figure", "図")):
+        row = type_rows.get(elem_type, {"elements": 0, "documents": 0})
+        cards.append((label, f"{row['elements']:,}", f"{row['documents']:,} ドキュメントに出現"))
+    cards_html = "".join(
+        f"<div style='background: white; border: 1px solid #ddd; border-radius: 6px; padding: 10px 16px; min-width: 140px;'>"
+        f"<div style='color: #666; font-size: 12px;'>{label}</div>"
+        f"<div style='font-size: 22px; font-weight: bold;'>{value}</div>"
+        f"<div style='color: #666; font-size: 11px;'>{note}</div></div>"
+        for label, value, note in cards
+    )
+
+    total_elements = sum(row["elements"] for row in statistics["types"]) or 1
+    type_table = "".join(
+        f"<tr><td style='padding: 3px 8px;'><span style='color: {element_colors.get(row['type'], element_colors['default'])};'>●</span> "
+        f"{html_lib.escape(str(row['type']))}</td>"
+        f"<td style='padding: 3px 8px; text-align: right;'>{row['elements']:,}</td>"
+        f"<td style='padding: 3px 8px; width: 40%;'><div style='background: {element_colors.get(row['type'], element_colors['default'])}; "
+        f"height: 10px; width: {row['elements'] / total_elements * 100:.1f}%;'></div></td>"
+        f"<td style='padding: 3px 8px; text-align: right;'>{row['elements'] / total_elements * 100:.1f}%</td>"
+        f"<td style='padding: 3px 8px; text-align: right;'>{row['documents']:,}</td></tr>"
+        for row in statistics["types"]
+    )
+
+    scope_labels = {"document": "ドキュメント", "page": "ページ"}
+    error_table = "".join(
+        f"<tr><td style='padding: 3px 8px;'>{scope_labels.get(row['scope'], row['scope'])}</td>"
+        f"<td style='padding: 3px 8px;'>{html_lib.escape(str(row['message']))}</td>"
+        f"<td style='padding: 3px 8px; text-align: right;'>{row['occurrences']:,}</td>"
+        f"<td style='padding: 3px 8px; text-align: right;'>{row['documents']:,}</td>"
+        f"<td style='padding: 3px 8px; font-size: 11px; color: #555;'>"
+        f"{'<br>'.join(html_lib.escape(os.path.basename(path or '')) for path in row['sample_paths'])}</td></tr>"
+        for row in statistics["errors"]
+    )
+    errors_html = (
+        f"""
+        <div style='background: #fff3cd; border: 1px solid #ffc107; padding: 10px 15px; margin: 10px 0; border-radius: 5px;'>
+            <strong>⚠️ エラー（メッセージ別、件数の多い順）</strong>
+            <table style='border-collapse: collapse; font-size: 12px; margin-top: 6px;'>
+                <tr><th style='text-align: left; padding: 3px 8px;'>単位</th><th style='text-align: left; padding: 3px 8px;'>メッセージ</th>
+                    <th style='padding: 3px 8px;'>件数</th><th style='padding: 3px 8px;'>ドキュメント</th><th style='text-align: left; padding: 3px 8px;'>例</th></tr>
+                {error_table}
+            </table>
+        </div>
+        """
+        if statistics["errors"]
+        else ""
+    )
+
+    empty_samples = pages.get("empty_page_samples") or []
+    empty_html = (
+        "<div style='font-size: 12px; color: #555; margin-top: 8px;'><strong>要素のないページの例:</strong> "
+        + "、".join(
+            f"{html_lib.escape(os.path.basename(sample['path'] or ''))} p.{sample['page']}" for sample in empty_samples
+        )
+        + ("…" if (pages["empty_pages"] or 0) > len(empty_samples) else "")
+        + "</div>"
+        if empty_samples
+        else ""
+    )
+
+    display(
+        HTML(
+            f"""
+        <div style='{panel}'>
+            <strong>📊 バッチ統計</strong>
+            <span style='color: #666; font-size: 12px;'>（Sparkで集計: {statistics['seconds']:.1f}s）</span>
+            <div style='display: flex; flex-wrap: wrap; gap: 10px; margin-top: 10px;'>{cards_html}</div>
+        </div>
+        <div style='display: flex; flex-wrap: wrap; gap: 10px;'>
+            <div style='{panel} flex: 1; min-width: 320px;'>
+                <strong>📄 ドキュメントあたりのページ数</strong>
+                <div style='font-size: 12px; color: #555; margin: 4px 0 8px 0;'>{distribution(documents, "pages", "ページ")}</div>
+                {_histogram_html(statistics["page_buckets"], documents["page_histogram"], "ページ", "#45B7D1")}
+            </div>
+            <div style='{panel} flex: 1; min-width: 320px;'>
+                <strong>🧩 ページあたりの要素数</strong>
+                <div style='font-size: 12px; color: #555; margin: 4px 0 8px 0;'>{distribution(pages, "elements", "要素")}</div>
+                {_histogram_html(statistics["element_buckets"], pages["element_histogram"], "要素", "#4ECDC4")}
+                {empty_html}
+            </div>
+        </div>
+        <div style='{panel}'>
+            <strong>🏷️ 要素タイプの分布</strong>
+            <table style='border-collapse: collapse; font-size: 12px; margin-top: 6px; width: 100%;'>
+                <tr><th style='text-align: left; padding: 3px 8px;'>タイプ</th><th style='padding: 3px 8px;'>要素数</th>
+                    <th></th><th style='padding: 3px 8px;'>割合</th><th style='padding: 3px 8px;'>ドキュメント</th></tr>
+                {type_table}
+            </table>
+        </div>
+        {errors_html}
+        """
+        )
+    )
+
+
+def render_ai_parse_output_interactive(
+    parsed_results,
+    cache_max_bytes=64 * 1024 * 1024,
+    debounce_seconds=0.15,
+    prefetch_workers=2,
+    max_decoded_docs=4,
+    spill_dir=None,
+    page_filter=None,
+    start_document=None,
+    start_page=None,
+    **renderer_options,
+):
     """ページナビゲーションボタン、スライダー、ドロップダウンを持つインタラクティブレンダラー。
 
     引数:
-        parsed_results: 単一の解析されたドキュメント結果または解析結果のリスト
+        parsed_results: 単一の解析されたドキュメント結果、解析結果のリスト、DocumentRegistry、
+            または解析結果のイテレータ（spark.sql(...).toLocalIterator() など）。
+            イテレータ（または source を持つ DocumentRegistry）の場合は最初のドキュメントをすぐに表示し、
+            残りをバックグラウンドでレジストリに読み込みます
+        cache_max_bytes: レンダリング済みページHTMLキャッシュの上限バイト数
+        debounce_seconds: スライダー操作を確定するまでの待機時間（秒）
+        prefetch_workers: 隣接ページを事前レンダリングするスレッド数（0で無効）
+        max_decoded_docs: 同時にメモリ上に保持するデコード済みドキュメントの最大数
+        spill_dir: 指定した場合、生のJSONをこのローカルディレクトリに書き出してメモリを節約します
+        page_filter: ページ選択文字列（"type=table"、"text:合計"、"10-" など PageSelection の形式）。
+            指定するとページのドロップダウンと前後の移動を一致するページに限定します。
+            ビューアの「絞り込み」欄からも変更できます
+        start_document: 最初に表示するドキュメントのインデックス（Noneの場合は最初の成功したドキュメント）
+        start_page: 最初に表示するページ番号（1始まり。Noneの場合は絞り込みに一致する最初のページ）
+        renderer_options: DocumentRendererに渡すオプション（image_format、image_quality など）。
+            timings に StageTimings を渡すと、解析SQLや収集の所要時間と合わせて表示されます
+
+    戻り値:
+        ビューアのNavigationController（render_count でレンダリング回数を確認でき、
+        close() で事前レンダリングのスレッドプールを停止します）
     """
     try:
         import ipywidgets as widgets
-        from IPython.display import clear_output
     except ImportError:
         display(
             HTML(
@@ -845,63 +4128,114 @@ def render_ai_parse_output_interactive(parsed_results):
         )
         return
 
-    # 結果のリストを処理
-    if isinstance(parsed_results, list):
-        # 成功した結果とエラー結果を分ける
-        successful = []
-        errors = []
+    # ページ間で共有するレンダラーと、レンダリング済みページのLRUキャッシュ
+    renderer = DocumentRenderer(**renderer_options)
+    page_cache = RenderedPageCache(max_bytes=cache_max_bytes)
 
-        for idx, result in enumerate(parsed_results):
-            # 最初に辞書に変換
-            if hasattr(result, "toPython"):
-                result_dict = result.toPython()
-            elif hasattr(result, "toJson"):
-                result_dict = json.loads(result.toJson())
-            elif isinstance(result, dict):
-                result_dict = result
-            else:
-                errors.append((idx, f"未知のタイプ: {type(result)}"))
-                continue
+    # イテレータ（spark.sql(...).toLocalIterator() など）と未取得の結果が残るレジストリは
+    # ストリーミングモードで処理
+    if isinstance(parsed_results, DocumentRegistry):
+        is_streaming = parsed_results.pending
+    else:
+        is_streaming = not isinstance(parsed_results, (list, dict)) and hasattr(parsed_results, "__next__")
 
-            # エラーかどうかを確認
-            if result_dict.get('type') == 'error':
-                errors.append((idx, result_dict.get('message', result_dict.get('error', '未知のエラー'))))
-            else:
-                successful.append((idx, result))
+    # 結果は生のJSONのままレジストリに保持し、選択されたドキュメントだけをデコードする
+    if isinstance(parsed_results, DocumentRegistry):
+        registry = parsed_results
+    else:
+        registry = DocumentRegistry(
+            max_decoded=max_decoded_docs,
+            spill_dir=spill_dir,
+            source=parsed_results if is_streaming else None,
+        )
 
-        # 要約を表示
-        display(HTML(f"""
+    # 成功した結果とエラー結果を分ける（ストリーミング時はバックグラウンドで追加される）
+    successful_docs = []
+    doc_positions = {}
+    errors = []
+    docs_lock = threading.RLock()
+    stream_state = {"done": not is_streaming}
+
+    def track_header(header):
+        """ヘッダーを成功/エラーに分類します。成功した場合はTrueを返します。"""
+        with docs_lock:
+            if header["is_error"]:
+                errors.append((header["index"], header["message"]))
+                return False
+            doc_positions[header["index"]] = len(successful_docs)
+            successful_docs.append((header["index"], header))
+            return True
+
+    def classify_result(result):
+        """結果をレジストリに登録して分類します。成功した場合はTrueを返します。"""
+        return track_header(registry.add(result))
+
+    def document_option_label(idx, header):
+        path = header.get("path")
+        if path:
+            return f"ドキュメント {idx}: {os.path.basename(path)}"
+        return f"ドキュメント {idx}"
+
+    def batch_summary_html():
+        """バッチ結果の要約とエラー一覧のHTMLを作成します。"""
+        with docs_lock:
+            status = "" if stream_state["done"] else " (読み込み中...)"
+            summary_html = f"""
             <div style='background: #f0f0f0; padding: 15px; border-radius: 5px; margin: 10px 0;'>
-                <strong>📊 バッチ結果:</strong> {len(successful)} 成功, {len(errors)} エラー
+                <strong>📊 バッチ結果:</strong> {len(successful_docs)} 成功, {len(errors)} エラー{status}
             </div>
-        """))
-
-        # エラーがあれば表示
-        if errors:
-            error_html = "<div style='background: #fff3cd; border: 1px solid #ffc107; padding: 10px; margin: 10px 0; border-radius: 5px;'>"
-            error_html += "<strong>⚠️ エラーが発生しました:</strong><ul>"
-            for idx, err_msg in errors:
-                error_html += f"<li>ドキュメント {idx}: {err_msg}</li>"
-            error_html += "</ul></div>"
-            display(HTML(error_html))
-
-        if not successful:
-            display(HTML("<p style='color: red;'>❌ 表示する成功した結果がありません</p>"))
-            return
+            """
+
+            # エラーがあれば表示
+            if errors:
+                error_html = "<div style='background: #fff3cd; border: 1px solid #ffc107; padding: 10px; margin: 10px 0; border-radius: 5px;'>"
+                error_html += "<strong>⚠️ エラーが発生しました:</strong><ul>"
+                for idx, err_msg in errors:
+                    error_html += f"<li>ドキュメント {idx}: {err_msg}</li>"
+                error_html += "</ul></div>"
+                summary_html += error_html
+            return summary_html
+
+    is_batch = is_streaming or isinstance(parsed_results, (list, DocumentRegistry))
+
+    if is_streaming:
+        # 最初の成功したドキュメントが届くまで読み進め、残りは表示開始後に読み込む
+        stream_iter = registry.iter_headers()
+        for header in stream_iter:
+            if track_header(header):
+                break
+        else:
+            stream_state["done"] = True
+        has_multiple_docs = True
+    elif is_batch:
+        if isinstance(parsed_results, DocumentRegistry):
+            for header in registry.headers():
+                track_header(header)
+        else:
+            for result in parsed_results:
+                classify_result(result)
 
         # 複数のドキュメント - ドキュメントセレクタを作成
-        has_multiple_docs = len(successful) > 1
-        successful_docs = successful  # 後で使用するために保存
+        has_multiple_docs = len(successful_docs) > 1
     else:
         has_multiple_docs = False
-        successful_docs = [(0, parsed_results)]
+        classify_result(parsed_results)
+
+    if is_batch:
+        # 要約を表示（ストリーミング時は読み込みに合わせて更新）
+        batch_summary = widgets.HTML(value=batch_summary_html())
+        display(batch_summary)
+
+    if not successful_docs:
+        display(HTML("<p style='color: red;'>❌ 表示する成功した結果がありません</p>"))
+        return
 
     # 出力エリアとドキュメントドロップダウン（必要に応じて）
     output_area = widgets.Output()
 
     if has_multiple_docs:
         doc_dropdown = widgets.Dropdown(
-            options=[(f"ドキュメント {idx}", idx) for idx, _ in successful_docs],
+            options=[(document_option_label(idx, header), idx) for idx, header in successful_docs],
             value=successful_docs[0][0],
             description="ドキュメント:",
             style={"description_width": "70px"},
@@ -910,26 +4244,64 @@ def render_ai_parse_output_interactive(parsed_results):
         doc_label = widgets.Label(value=f"1 of {len(successful_docs)} ドキュメント")
 
     # 現在の状態を保存
-    current_state = {"doc_idx": successful_docs[0][0], "page_num": 1}
+    initial_doc = start_document if start_document in doc_positions else successful_docs[0][0]
+    current_state = {"doc_idx": initial_doc, "page_num": 1, "filter": None}
+    filter_state = {"text": (page_filter or "").strip()}
+    # (ドキュメント, 絞り込み文字列) -> 一致するページ番号（1始まり）のリスト
+    filter_matches: Dict[Tuple[Any, str], List[int]] = {}
 
     def get_current_document():
         """現在選択されているドキュメントとそのページを取得します。"""
-        for idx, doc in successful_docs:
-            if idx == current_state["doc_idx"]:
-                # 辞書に変換
-                if hasattr(doc, "toPython"):
-                    parsed_dict = doc.toPython()
-                elif hasattr(doc, "toJson"):
-                    parsed_dict = json.loads(doc.toJson())
-                elif isinstance(doc, dict):
-                    parsed_dict = doc
-                else:
-                    return None, []
+        return get_document(current_state["doc_idx"])
+
+    def get_document(doc_idx):
+        """指定されたドキュメント（辞書）とそのページを取得します。"""
+        if doc_idx not in doc_positions:
+            return None, []
+
+        # 選択された時点でデコード（レジストリがLRUで保持）
+        parsed_dict = registry.get(doc_idx)
+        if parsed_dict is None:
+            return None, []
+
+        document = parsed_dict.get("document", {})
+        pages = document.get("pages", [])
+        return parsed_dict, pages
+
+    def matching_pages(doc_idx):
+        """絞り込みに一致するページ番号（1始まり）のリストを返します。絞り込みがない場合はNone。"""
+        page_filter = filter_state["text"]
+        if not page_filter:
+            return None
+        key = (doc_idx, page_filter)
+        if key not in filter_matches:
+            parsed_dict, pages = get_document(doc_idx)
+            document = (parsed_dict or {}).get("document", {})
+            page_index = renderer._get_page_index(document.get("elements", []))
+            filter_matches[key] = [
+                page_idx + 1
+                for page_idx in renderer._parse_page_selection(
+                    page_filter, renderer._total_page_count(document), pages, page_index
+                )
+            ]
+        return filter_matches[key]
 
-                document = parsed_dict.get("document", {})
-                pages = document.get("pages", [])
-                return doc, pages
-        return None, []
+    def page_number(pages, page_num):
+        """ナビゲーションの位置（1始まり）のページの、ドキュメント上のページ番号（1始まり）。
+
+        query_mode="pages" で絞り込んだ結果では、位置とページ番号が一致しません。
+        """
+        return pages[page_num - 1].get("id", page_num - 1) + 1
+
+    def page_label_text(doc_idx, page_num):
+        parsed_dict, pages = get_document(doc_idx)
+        total_pages = renderer._total_page_count((parsed_dict or {}).get("document", {}))
+        return f"ページ {page_number(pages, page_num)} of {total_pages}"
+
+    def first_page(doc_idx):
+        """ドキュメントを開いたときに表示するページ（絞り込みに一致する最初のページ）。"""
+        matches = matching_pages(doc_idx)
+        return matches[0] if matches else 1
 
     # 初期ドキュメントとページを取得
     parsed_result, pages = get_current_document()
@@ -954,7 +4326,7 @@ def render_ai_parse_output_interactive(parsed_results):
     )
 
     page_dropdown = widgets.Dropdown(
-        options=[(f"ページ {i+1}", i + 1) for i in range(len(pages))],
+        options=[(f"ページ {page_number(pages, i)}", i) for i in range(1, len(pages) + 1)],
         value=1,
         description="移動:",
         style={"description_width": "50px"},
@@ -971,76 +4343,179 @@ def render_ai_parse_output_interactive(parsed_results):
         layout=widgets.Layout(width="300px"),
     )
 
-    page_label = widgets.Label(value=f"ページ 1 of {len(pages)}")
-
-    def update_page_controls(pages):
-        """ドキュメントが変更されたときにページコントロールを更新します。"""
-        page_dropdown.options = [(f"ページ {i+1}", i + 1) for i in range(len(pages))]
-        page_slider.max = len(pages)
-        page_slider.value = 1
-        page_dropdown.value = 1
-        current_state["page_num"] = 1
+    page_label = widgets.Label(value=page_label_text(current_state["doc_idx"], 1))
+    cache_label = widgets.Label(value="")
+    timing_label = widgets.HTML(value="")
+    filter_input = widgets.Text(
+        value=filter_state["text"],
+        placeholder="例: type=table, text:合計, 10-",
+        description="絞り込み:",
+        continuous_update=False,
+        style={"description_width": "70px"},
+        layout=widgets.Layout(width="360px"),
+    )
 
-    def update_page(page_num):
-        """特定のページに更新し、すべてのコントロールを更新します。"""
+    def sync_controls(doc_idx, page_num):
+        """ナビゲーション状態に合わせてすべてのコントロールを更新します。"""
+        doc_changed = current_state["doc_idx"] != doc_idx
+        filter_changed = current_state["filter"] != filter_state["text"]
+        current_state["doc_idx"] = doc_idx
         current_state["page_num"] = page_num
+        current_state["filter"] = filter_state["text"]
+
+        _, pages = get_current_document()
+        matches = matching_pages(doc_idx)
+
+        # ドキュメントか絞り込みが変更された場合はページコントロールを作り直す
+        # （絞り込み中は一致するページと現在のページのみをドロップダウンに表示）
+        if doc_changed or filter_changed or (matches and page_num not in matches):
+            page_numbers = sorted(set(matches) | {page_num}) if matches else range(1, len(pages) + 1)
+            page_dropdown.options = [(f"ページ {page_number(pages, i)}", i) for i in page_numbers]
+            page_slider.max = len(pages)
 
-        # 現在のドキュメントを取得
-        parsed_result, pages = get_current_document()
+        if has_multiple_docs:
+            doc_dropdown.value = doc_idx
+            doc_label.value = f"{doc_positions[doc_idx] + 1} of {len(successful_docs)} ドキュメント"
 
         # すべてのウィジェットを更新
         page_slider.value = page_num
         page_dropdown.value = page_num
-        page_label.value = f"ページ {page_num} of {len(pages)}"
+        page_label.value = page_label_text(doc_idx, page_num)
+        if matches is not None:
+            page_label.value += f"（一致 {len(matches)} ページ）" if matches else "（一致するページなし）"
 
         # ボタンの状態を更新
-        prev_button.disabled = page_num == 1
-        next_button.disabled = page_num == len(pages)
+        prev_button.disabled = adjacent_page(doc_idx, page_num, -1) is None
+        next_button.disabled = adjacent_page(doc_idx, page_num, 1) is None
+
+    def adjacent_page(doc_idx, page_num, step):
+        """前後に移動するページ番号を返します。絞り込み中は一致するページだけを辿ります。"""
+        matches = matching_pages(doc_idx)
+        if matches:
+            if step > 0:
+                position = bisect.bisect_right(matches, page_num)
+            else:
+                position = bisect.bisect_left(matches, page_num) - 1
+            return matches[position] if 0 <= position < len(matches) else None
+        _, pages = get_document(doc_idx)
+        neighbour = page_num + step
+        return neighbour if 1 <= neighbour <= len(pages) else None
+
+    def page_cache_key(doc_idx, page_num):
+        return (doc_idx, page_num, renderer.render_options_key())
+
+    def render_fragments(doc_idx, page_num):
+        """指定されたページのHTMLフラグメントをレンダリングします（表示はしません）。"""
+        with renderer.timings.stage("decode", doc_idx, page_num):
+            parsed_result, pages = get_document(doc_idx)
+        return list(
+            renderer.iter_render_fragments(
+                parsed_result, page_selection=str(page_number(pages, page_num)), document_key=doc_idx
+            )
+        )
+
+    prefetcher = (
+        PagePrefetcher(
+            render_fragments, page_cache, page_cache_key, max_workers=prefetch_workers
+        )
+        if prefetch_workers > 0
+        else None
+    )
+
+    def prefetch_neighbours(doc_idx, page_num):
+        """前後のページ（絞り込み中は一致するページ）と、次のドキュメントの最初のページを事前レンダリングします。"""
+        targets = [
+            (doc_idx, neighbour)
+            for neighbour in (adjacent_page(doc_idx, page_num, 1), adjacent_page(doc_idx, page_num, -1))
+            if neighbour is not None
+        ]
+        with docs_lock:
+            doc_position = doc_positions[doc_idx]
+            next_doc = successful_docs[doc_position + 1][0] if doc_position + 1 < len(successful_docs) else None
+        if next_doc is not None:
+            targets.append((next_doc, first_page(next_doc)))
+        prefetcher.prefetch(targets)
+
+    def render_page(doc_idx, page_num):
+        """特定のページをレンダリングして表示します。"""
+        # キャッシュ済みのフラグメントがあれば再利用し、事前レンダリング中であれば完了を待ち、
+        # どちらもなければレンダリングして保存
+        since = len(renderer.timings)
+        cache_key = page_cache_key(doc_idx, page_num)
+        fragments = page_cache.get(cache_key)
+        if fragments is None and prefetcher is not None:
+            fragments = prefetcher.wait(doc_idx, page_num)
+        if fragments is None:
+            fragments = render_fragments(doc_idx, page_num)
+            page_cache.put(cache_key, fragments)
+
+        stats = page_cache.stats()
+        cache_label.value = (
+            f"キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']} "
+            f"({stats['bytes'] / (1024 * 1024):.1f} MB)"
+        )
+
+        # ページを表示（デバウンス時はタイマースレッドから呼ばれるため、
+        # コンテキストマネージャではなく出力ウィジェットを直接更新）
+        with renderer.timings.stage("display", doc_idx, page_num):
+            output_area.outputs = ()
+            for fragment in fragments:
+                output_area.append_display_data(HTML(fragment))
+
+        # この操作で計測したステージ別所要時間（キャッシュヒット時は表示のみ）
+        timing_label.value = (
+            f"<span style='font-size: 11px; color: #555;'>"
+            f"{renderer.timings.format_row(doc_idx, page_num, since=since)}</span>"
+        )
+
+        # 表示中に次に移動しそうなページを準備
+        if prefetcher is not None:
+            prefetch_neighbours(doc_idx, page_num)
 
-        # ページをレンダリング
-        with output_area:
-            clear_output(wait=True)
-            renderer = DocumentRenderer()
-            renderer.render_document(parsed_result, page_selection=str(page_num))
+    navigation = NavigationController(
+        render_page,
+        sync_controls,
+        debounce_seconds=debounce_seconds,
+        close_fn=prefetcher.shutdown if prefetcher is not None else None,
+    )
 
     def on_prev_click(_):
-        if current_state["page_num"] > 1:
-            update_page(current_state["page_num"] - 1)
+        page_num = adjacent_page(navigation.doc_idx, navigation.page_num, -1)
+        if page_num is not None:
+            navigation.navigate(navigation.doc_idx, page_num)
 
     def on_next_click(_):
-        _, pages = get_current_document()
-        if current_state["page_num"] < len(pages):
-            update_page(current_state["page_num"] + 1)
+        page_num = adjacent_page(navigation.doc_idx, navigation.page_num, 1)
+        if page_num is not None:
+            navigation.navigate(navigation.doc_idx, page_num)
 
     def on_slider_change(change):
-        update_page(change["new"])
+        # スライダーのドラッグやキー操作は連続するためデバウンスする
+        navigation.navigate(navigation.doc_idx, change["new"], debounce=True)
 
     def on_page_dropdown_change(change):
-        update_page(change["new"])
+        navigation.navigate(navigation.doc_idx, change["new"])
 
     def on_doc_dropdown_change(change):
-        """ドキュメント選択の変更を処理します。"""
-        current_state["doc_idx"] = change["new"]
-
-        # 新しいドキュメントのページを取得
-        _, pages = get_current_document()
-
-        # 新しいドキュメントのためにページコントロールを更新
-        update_page_controls(pages)
-
-        # ドキュメントラベルを更新
-        if has_multiple_docs:
-            doc_idx_position = next(i for i, (idx, _) in enumerate(successful_docs) if idx == change["new"])
-            doc_label.value = f"{doc_idx_position + 1} of {len(successful_docs)} ドキュメント"
-
-        # 新しいドキュメントの最初のページをレンダリング
-        update_page(1)
+        """ドキュメント選択の変更を処理します。新しいドキュメントの最初のページに移動します。"""
+        navigation.navigate(change["new"], first_page(change["new"]))
+
+    def on_filter_change(change):
+        """絞り込みの変更を処理します。現在のページが一致しない場合は最初の一致ページに移動します。"""
+        filter_state["text"] = change["new"].strip()
+        matches = matching_pages(navigation.doc_idx)
+        page_num = navigation.page_num
+        if matches and page_num not in matches:
+            page_num = matches[0]
+        # 同じページのままでもコントロールは同期される
+        navigation.navigate(navigation.doc_idx, page_num)
 
     # イベントハンドラを接続
     prev_button.on_click(on_prev_click)
     next_button.on_click(on_next_click)
     page_slider.observe(on_slider_change, names="value")
     page_dropdown.observe(on_page_dropdown_change, names="value")
+    filter_input.observe(on_filter_change, names="value")
 
     if has_multiple_docs:
         doc_dropdown.observe(on_doc_dropdown_change, names="value")
@@ -1065,11 +4540,12 @@ def render_ai_parse_output_interactive(parsed_results):
                 widgets.Label(value="  "),  # スペーサー
                 page_dropdown,
                 page_label,
+                cache_label,
             ]
         )
 
         # ドキュメントセレクタの上にウィジェットを表示
-        display(widgets.VBox([doc_row, page_nav_row, output_area]))
+        display(widgets.VBox([doc_row, page_nav_row, filter_input, timing_label, output_area]))
     else:
         # ページナビゲーションのみ: [前へ] [スライダー] [次] | [ドロップダウン] [ラベル]
         nav_row = widgets.HBox(
@@ -1080,18 +4556,786 @@ def render_ai_parse_output_interactive(parsed_results):
                 widgets.Label(value="  "),  # スペーサー
                 page_dropdown,
                 page_label,
+                cache_label,
             ]
         )
 
         # ウィジェットを表示
-        display(widgets.VBox([nav_row, output_area]))
+        display(widgets.VBox([nav_row, filter_input, timing_label, output_area]))
 
     # 初期レンダリングをトリガー
-    update_page(1)
+    initial_page = first_page(initial_doc)
+    if start_page is not None and initial_doc == start_document:
+        # ドキュメント上のページ番号をナビゲーションの位置に変換（ページがなければ次のページ）
+        page_numbers = [page_number(pages, page_num) for page_num in range(1, len(pages) + 1)]
+        initial_page = min(bisect.bisect_left(page_numbers, int(start_page)) + 1, len(pages))
+    navigation.navigate(initial_doc, initial_page)
+
+    if not stream_state["done"]:
+        def consume_stream():
+            """残りの結果をバックグラウンドで読み込み、ドキュメントセレクタに追加します。"""
+            last_update = 0.0
+            try:
+                for header in stream_iter:
+                    track_header(header)
+                    # ウィジェットの更新は間引く
+                    if time.monotonic() - last_update >= 0.5:
+                        refresh_document_selector()
+                        last_update = time.monotonic()
+            except Exception as e:
+                with docs_lock:
+                    errors.append(("ストリーム", f"読み込みが中断されました: {e}"))
+            finally:
+                stream_state["done"] = True
+                refresh_document_selector()
+
+        def refresh_document_selector():
+            with docs_lock:
+                options = [(document_option_label(idx, header), idx) for idx, header in successful_docs]
+                doc_count = len(successful_docs)
+            # オプションの差し替えで発生する変更通知は無視
+            with navigation.suppressed():
+                doc_dropdown.options = options
+                doc_dropdown.value = navigation.doc_idx
+            doc_label.value = f"{doc_positions[navigation.doc_idx] + 1} of {doc_count} ドキュメント"
+            batch_summary.value = batch_summary_html()
+
+        threading.Thread(target=consume_stream, name="parse-result-stream", daemon=True).start()
+
+    return navigation
+
+
+def _search_hit_label(hit: Dict[str, Any]) -> str:
+    """検索ヒットの1行の説明（ドキュメント、ページ、要素、スニペット）を作成します。"""
+    document = f"ドキュメント {hit['document']}"
+    if hit["path"]:
+        document += f" ({os.path.basename(hit['path'])})"
+    page = f"p.{hit['page']}" if hit["page"] is not None else "ページなし"
+    return f"{document} {page} {str(hit['type']).upper()}#{hit['element_id']}: {hit['snippet']}"
+
+
+def render_ai_parse_search(parsed_results, query="", limit=50, **viewer_options):
+    """全ドキュメントの要素を全文検索し、選択したヒットをビューアで強調表示して開きます。
+
+    引数:
+        parsed_results: DocumentSearchIndex、または DocumentSearchIndex に渡せる解析結果
+            （単一の結果、リスト、DocumentRegistry、イテレータ）
+        query: 最初に検索する文字列（空の場合は入力を待ちます）
+        limit: 表示するヒットの最大数
+        viewer_options: ヒットを開くときに render_ai_parse_output_interactive に渡すオプション
+
+    戻り値:
+        検索に使用した DocumentSearchIndex（search() で直接検索できます）
+    """
+    index = parsed_results if isinstance(parsed_results, DocumentSearchIndex) else DocumentSearchIndex(parsed_results)
+    stats = index.stats()
+    index_info = (
+        f"{stats['documents']} ドキュメント・{stats['elements']} 要素"
+        f"（索引語 {stats['terms']}、構築 {stats['build_seconds']:.2f}s）"
+    )
+
+    def search(text):
+        start = time.perf_counter()
+        hits = index.search(text, limit=limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        more = "以上" if limit is not None and len(hits) >= limit else ""
+        status = f"🔎 '{text}': {len(hits)} 件{more}（{elapsed_ms:.1f} ms、{index_info}）"
+        return hits, status
+
+    try:
+        import ipywidgets as widgets
+    except ImportError:
+        # ウィジェットがない場合はヒットの一覧のみを表示
+        hits, status = search(query) if query else ([], f"🔎 {index_info}")
+        rows = "".join(
+            "<tr><td style='padding: 4px 8px;'>"
+            + html_lib.escape(_search_hit_label({**hit, "snippet": ""}))
+            + "</td><td style='padding: 4px 8px;'>"
+            + html_lib.escape(hit["snippet"][: hit["match"][0]])
+            + "<mark>"
+            + html_lib.escape(hit["snippet"][hit["match"][0] : hit["match"][1]])
+            + "</mark>"
+            + html_lib.escape(hit["snippet"][hit["match"][1] :])
+            + "</td></tr>"
+            for hit in hits
+        )
+        display(HTML(f"<p>{html_lib.escape(status)}</p><table style='font-size: 12px;'>{rows}</table>"))
+        return index
+
+    query_input = widgets.Text(
+        value=query,
+        placeholder="例: 請求金額、INV-2024",
+        description="検索:",
+        continuous_update=False,
+        style={"description_width": "50px"},
+        layout=widgets.Layout(width="400px"),
+    )
+    status_label = widgets.Label(value=f"🔎 {index_info}")
+    results_select = widgets.Select(options=[], rows=10, layout=widgets.Layout(width="100%"))
+    viewer_output = widgets.Output()
+    state = {"hits": [], "viewer": None}
+
+    def on_query_change(change):
+        text = change["new"].strip()
+        hits, status = search(text) if text else ([], f"🔎 {index_info}")
+        state["hits"] = hits
+        status_label.value = status
+        results_select.options = [(_search_hit_label(hit), position) for position, hit in enumerate(hits)]
+        results_select.value = None
+
+    def on_result_select(change):
+        if change["new"] is None:
+            return
+        hit = state["hits"][change["new"]]
+        # 前のビューアの事前レンダリングのスレッドプールを停止してから置き換える
+        if state["viewer"] is not None:
+            state["viewer"].close()
+        # ヒットしたドキュメントとページでビューアを開き、要素のbboxを強調表示
+        with viewer_output:
+            viewer_output.clear_output(wait=True)
+            state["viewer"] = render_ai_parse_output_interactive(
+                index.registry,
+                start_document=hit["document"],
+                start_page=hit["page"],
+                highlight_elements={hit["document"]: [hit["element_index"]]},
+                **viewer_options,
+            )
+
+    query_input.observe(on_query_change, names="value")
+    results_select.observe(on_result_select, names="value")
+
+    display(widgets.VBox([query_input, status_label, results_select, viewer_output]))
+    if query:
+        on_query_change({"new": query})
+    return index
+
+
+class _FunctionByValue:
+    """関数をcloudpickleで値として（定義ごと）pickleするラッパー。
+
+    spawn で起動したワーカープロセスはノートブックのセルで定義された関数をインポートできないため、
+    関数と参照するクラスをまとめて渡します。ワーカーでは元の関数として復元されます。
+    """
+
+    def __init__(self, fn: Callable):
+        try:
+            import cloudpickle
+        except ImportError:
+            from pyspark import cloudpickle
+        self.data = cloudpickle.dumps(fn)
+
+    def __reduce__(self):
+        return (pickle.loads, (self.data,))
+
+
+def _export_document_html(task: Tuple) -> Dict[str, Any]:
+    """1つのドキュメントを静的HTMLファイルに書き出します（プロセスプールのワーカーで実行）。"""
+    doc_idx, name, output_path, page_selection, renderer_options, payload = task
+    start = time.perf_counter()
+
+    raw_json = DocumentRegistry.payload_json(payload)
+
+    renderer = DocumentRenderer(**renderer_options)
+    fragments = [
+        # 要約にはこのドキュメントのステージ別所要時間の行を静的に埋め込む
+        fragment.with_timings(renderer.timings.format_row(fragment.document_key))
+        if isinstance(fragment, SummaryFragment)
+        else fragment
+        for fragment in list(renderer.iter_render_fragments(raw_json, page_selection))
+    ]
+    html = f"""<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>{html_lib.escape(name)}</title></head>
+<body style="font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif;">
+<p><a href="index.html">← 一覧に戻る</a></p>
+{''.join(fragments)}
+</body>
+</html>
+"""
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    return {
+        "index": doc_idx,
+        "name": name,
+        "file": os.path.basename(output_path),
+        "bytes": len(html.encode("utf-8")),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def export_batch_html(
+    parsed_results, output_dir, page_selection=None, max_workers=None, **renderer_options
+):
+    """バッチ内の全ドキュメントを静的HTMLファイルとして書き出し、一覧ページを作成します。
+
+    ドキュメントはプロセスプールに分散してレンダリングされます。
+
+    引数:
+        parsed_results: 解析結果のリスト、イテレータ、またはDocumentRegistry
+        output_dir: 出力先ディレクトリ（UCボリュームまたはローカルディレクトリ）
+        page_selection: 各ドキュメントで書き出すページの選択文字列（Noneですべてのページ）
+        max_workers: ワーカープロセス数（Noneの場合はCPUコア数）
+        renderer_options: DocumentRendererに渡すオプション（image_format、image_quality など）。
+            image_mode を指定しない場合、ページ画像は output_dir/images に書き出されます
+
+    戻り値:
+        ドキュメントごとの書き出し結果（ファイル名、バイト数、所要時間）のリスト
+    """
+    if isinstance(parsed_results, DocumentRegistry):
+        registry = parsed_results
+    else:
+        registry = DocumentRegistry(max_decoded=0)
+        for result in parsed_results:
+            registry.add(result)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # ページ画像は images/ に一度だけ書き出し、HTMLからは相対パスで参照する
+    # （所要時間の記録はワーカープロセスごとに行われるため、StageTimings は渡さない）
+    renderer_options = dict(renderer_options)
+    renderer_options.pop("timings", None)
+    # 静的HTMLファイルにはセル出力の上限がないため、出力予算による劣化は行わない
+    renderer_options.setdefault("output_byte_budget", None)
+    if renderer_options.setdefault("image_mode", "external") == "external":
+        renderer_options.setdefault("image_export_dir", os.path.join(output_dir, "images"))
+        renderer_options.setdefault("image_base_url", "images")
+
+    tasks = []
+    errors = []
+    for header in registry.iter_headers():
+        doc_idx = header["index"]
+        if header["is_error"]:
+            errors.append((doc_idx, header["message"]))
+            continue
+        name = os.path.basename(header["path"]) if header.get("path") else f"document_{doc_idx}"
+        output_path = os.path.join(
+            output_dir, f"{doc_idx:05d}_{re.sub(r'[^0-9A-Za-z._-]', '_', name)}.html"
+        )
+        # ワーカーには圧縮したJSON（または書き出したファイルのパス）をそのまま渡し、展開はワーカーで行う
+        tasks.append(
+            (doc_idx, name, output_path, page_selection, renderer_options, registry.payload(doc_idx))
+        )
+
+    max_workers = max_workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    exported = []
+
+    # カーネルにはビューアの読み込みや事前レンダリングのスレッドが動いている場合があり、forkすると
+    # それらが保持するロックを引き継いでデッドロックしうるため、ワーカーは spawn で起動する
+    export_fn = _FunctionByValue(_export_document_html)
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [executor.submit(export_fn, task) for task in tasks]
+        for future, task in zip(futures, tasks):
+            try:
+                exported.append(future.result())
+            except Exception as e:
+                errors.append((task[0], f"書き出しに失敗しました: {e}"))
+
+    total_seconds = time.perf_counter() - start
+
+    # 一覧ページを作成
+    rows = "".join(
+        f"""
+        <tr>
+            <td style="padding: 6px; border-bottom: 1px solid #ddd;">{item['index']}</td>
+            <td style="padding: 6px; border-bottom: 1px solid #ddd;"><a href="{html_lib.escape(item['file'])}">{html_lib.escape(item['name'])}</a></td>
+            <td style="padding: 6px; border-bottom: 1px solid #ddd; text-align: right;">{item['bytes'] / 1024:.1f} KB</td>
+            <td style="padding: 6px; border-bottom: 1px solid #ddd; text-align: right;">{item['seconds']:.2f} 秒</td>
+        </tr>"""
+        for item in exported
+    )
+    error_items = "".join(f"<li>ドキュメント {idx}: {html_lib.escape(str(msg))}</li>" for idx, msg in errors)
+    index_html = f"""<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="utf-8"><title>AI 解析ドキュメント結果一覧</title></head>
+<body style="font-family: 'Segoe UI', 'Helvetica Neue', Arial, sans-serif;">
+<h1>🔍 AI 解析ドキュメント結果一覧</h1>
+<p>{len(exported)} ドキュメント | {max_workers} ワーカー | 合計 {total_seconds:.2f} 秒</p>
+<table style="border-collapse: collapse;">
+    <tr><th style="text-align: left; padding: 6px;">#</th><th style="text-align: left; padding: 6px;">ドキュメント</th>
+        <th style="text-align: right; padding: 6px;">サイズ</th><th style="text-align: right; padding: 6px;">所要時間</th></tr>
+    {rows}
+</table>
+{f"<h2>⚠️ エラー</h2><ul>{error_items}</ul>" if errors else ""}
+</body>
+</html>
+"""
+    with open(os.path.join(output_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(index_html)
+
+    display(
+        HTML(f"""
+        <div style='background: #f0f0f0; padding: 15px; border-radius: 5px; margin: 10px 0;'>
+            <strong>📦 HTMLエクスポート:</strong> {len(exported)} ドキュメント, {len(errors)} エラー
+            ({max_workers} ワーカー, {total_seconds:.2f} 秒) → {os.path.join(output_dir, 'index.html')}
+        </div>
+        """)
+    )
+    return exported
+
+
+def benchmark_element_rendering(
+    table_rows=2000, text_chars=200_000, pages=20, repeat=3, **renderer_options
+):
+    """要素コンテンツのレンダリングについて、従来の方式とフラグメントストアを使う方式を比較します。
+
+    大きなテキスト要素とテーブル要素をそれぞれ pages ページに跨がる1つの要素として用意し、
+    各ページでツールチップと要素リストの両方を描画した場合の所要時間を計測します。
+    従来の方式は描画のたびに4回の str.replace によるスタイル適用と6段階のエスケープを行い、
+    新しい方式は要素ごとに1回だけ単一走査のスタイル適用・エスケープで描画した結果を再利用します。
+    両方の方式が同じコンテンツを描画するよう、新しい方式でもテーブルのプレビューは無効にします
+    （table_preview_rows を renderer_options で指定した場合はその値を使用）。
+
+    引数:
+        table_rows: 合成テーブルの行数
+        text_chars: 合成テキストの文字数
+        pages: 要素を描画するページ数（ページ移動や再レンダリングの回数に相当）
+        repeat: 計測の繰り返し回数（最短時間を採用）
+        renderer_options: DocumentRendererに渡すオプション
+
+    戻り値:
+        要素タイプごとの従来方式・新方式の所要時間（秒）と速度比を持つ辞書
+    """
+
+    def legacy_style(table_html, for_tooltip):
+        # 従来のタグごとの置換（比較用）
+        for tag, styled in DocumentRenderer.table_tag_styles[for_tooltip].items():
+            if tag in table_html:
+                table_html = table_html.replace(tag, styled)
+        return table_html
+
+    def legacy_escape(text):
+        # 従来の6段階の置換チェーン（比較用）
+        return (
+            text.replace("&", "&amp;")
+            .replace("<", "&lt;")
+            .replace(">", "&gt;")
+            .replace('"', "&quot;")
+            .replace("'", "&#39;")
+            .replace("\n", "<br>")
+        )
+
+    def legacy_render(element, for_tooltip):
+        # 従来の _render_element_content（テーブル全体にスタイルを適用し、テキストは毎回エスケープ）
+        content = element["content"]
+        if element["type"] == "table":
+            return legacy_style(content, for_tooltip)
+        if for_tooltip:
+            return legacy_escape(content[:500] + "..." if len(content) > 500 else content)
+        return content
+
+    header = "<thead><tr>" + "".join(f"<th>列{c}</th>" for c in range(6)) + "</tr></thead>"
+    body = "".join(
+        "<tr>" + "".join(f"<td>値 {r}-{c} &amp; \"引用\"</td>" for c in range(6)) + "</tr>"
+        for r in range(table_rows)
+    )
+    text = ("解析されたテキスト <b>&</b> 'quote'\n" * (text_chars // 30 + 1))[:text_chars]
+    elements = {
+        "table": {"id": 0, "type": "table", "content": f"<table>{header}<tbody>{body}</tbody></table>"},
+        "text": {"id": 1, "type": "text", "content": text},
+    }
+
+    results = {}
+    for name, element in elements.items():
+        legacy_seconds = new_seconds = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(pages):
+                legacy_render(element, True)
+                legacy_render(element, False)
+            legacy_seconds = min(legacy_seconds, time.perf_counter() - start)
+
+            # 計測ごとに新しいレンダラーとインデックスを使い、初回の描画コストも含める
+            renderer = DocumentRenderer(**{"table_preview_rows": None, **renderer_options})
+            element_copy = dict(element, bbox=[{"page_id": p, "coord": [0, 0, 10, 10]} for p in range(pages)])
+            start = time.perf_counter()
+            page_index = renderer._get_page_index([element_copy])
+            for page_id in range(pages):
+                for entry in page_index[page_id]["entries"]:
+                    renderer._render_entry_content(entry, for_tooltip=True)
+                    renderer._render_entry_content(entry, for_tooltip=False)
+            new_seconds = min(new_seconds, time.perf_counter() - start)
+
+        results[name] = {
+            "legacy_seconds": legacy_seconds,
+            "new_seconds": new_seconds,
+            "speedup": legacy_seconds / new_seconds if new_seconds else float("inf"),
+        }
+
+    rows = "".join(
+        f"<tr><td style='padding: 4px 10px;'>{name}</td>"
+        f"<td style='padding: 4px 10px; text-align: right;'>{r['legacy_seconds'] * 1000:.1f} ms</td>"
+        f"<td style='padding: 4px 10px; text-align: right;'>{r['new_seconds'] * 1000:.1f} ms</td>"
+        f"<td style='padding: 4px 10px; text-align: right;'>×{r['speedup']:.1f}</td></tr>"
+        for name, r in results.items()
+    )
+    display(
+        HTML(f"""
+        <div style='background: #f0f0f0; padding: 15px; border-radius: 5px; margin: 10px 0;'>
+            <strong>⏱️ 要素コンテンツのレンダリング</strong> ({pages} ページ, テーブル {table_rows} 行, テキスト {text_chars} 文字)
+            <table style="border-collapse: collapse; margin-top: 8px;">
+                <tr><th style="text-align: left; padding: 4px 10px;">要素</th><th style="padding: 4px 10px;">従来</th>
+                    <th style="padding: 4px 10px;">フラグメントストア</th><th style="padding: 4px 10px;">速度比</th></tr>
+                {rows}
+            </table>
+        </div>
+        """)
+    )
+    return results
+
+# COMMAND ----------
+
+# DBTITLE 1,ベンチマーク関数のロード
+# 合成ドキュメントによるレンダラーのベンチマーク（Sparkやワークスペースなしで実行可能）
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from IPython.display import HTML, display
+from PIL import Image, ImageDraw
+
+# 合成ドキュメントの既定の要素タイプ構成（比率）
+DEFAULT_ELEMENT_TYPE_MIX = {
+    "text": 0.55,
+    "section_header": 0.1,
+    "table": 0.1,
+    "figure": 0.07,
+    "caption": 0.06,
+    "list": 0.04,
+    "page_header": 0.04,
+    "page_footer": 0.04,
+}
+
+_SYNTHETIC_WORDS = (
+    "解析 ドキュメント 要素 売上 前年比 合計 第1四半期 地域 製品 予算 実績 注記 "
+    "revenue margin forecast table figure summary region product total note"
+).split()
+
+
+def generate_synthetic_parse_result(
+    pages: int = 10,
+    elements_per_page: int = 40,
+    type_mix: Optional[Dict[str, float]] = None,
+    table_rows: int = 20,
+    table_columns: int = 5,
+    multi_bbox_ratio: float = 0.1,
+    image_dir: Optional[str] = None,
+    image_size: Tuple[int, int] = (1700, 2200),
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """ai_parse_document v2.0 の出力と同じ構造を持つ合成ドキュメントを生成します。
+
+    要素はページ上に上から順に配置され、multi_bbox_ratio の割合の要素は次のページにも
+    bboxを持ちます（ページをまたぐ段落やテーブル）。image_dir を指定した場合は、要素の
+    位置に矩形を描いたページ画像を書き出し、image_uri から参照します。
+
+    引数:
+        pages: ページ数
+        elements_per_page: 1ページあたりの要素数
+        type_mix: 要素タイプごとの比率（Noneの場合は DEFAULT_ELEMENT_TYPE_MIX）
+        table_rows: テーブル要素の行数
+        table_columns: テーブル要素の列数
+        multi_bbox_ratio: 次のページにもbboxを持つ要素の割合
+        image_dir: ページ画像の書き出し先（Noneの場合は画像を生成しない）
+        image_size: ページ画像の (幅, 高さ)（px）
+        seed: 乱数シード（同じ引数からは同じドキュメントを生成）
+
+    戻り値:
+        "document"（"pages" と "elements"）と "metadata" を持つ辞書
+    """
+    rng = random.Random(seed)
+    type_mix = type_mix or DEFAULT_ELEMENT_TYPE_MIX
+    element_types = list(type_mix)
+    weights = [type_mix[t] for t in element_types]
+    page_width, page_height = image_size
+    margin = int(page_width * 0.06)
+    slot_height = (page_height - 2 * margin) / max(elements_per_page, 1)
+
+    def words(count):
+        return " ".join(rng.choice(_SYNTHETIC_WORDS) for _ in range(count))
+
+    def table_html():
+        header = "".join(f"<th>{words(1)}</th>" for _ in range(table_columns))
+        rows = "".join(
+            "<tr>" + "".join(f"<td>{rng.randint(0, 99999):,}</td>" for _ in range(table_columns)) + "</tr>"
+            for _ in range(table_rows)
+        )
+        return f"<table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>"
+
+    elements = []
+    page_list = []
+    for page_id in range(pages):
+        page_list.append({"id": page_id, "image_uri": None})
+        for slot in range(elements_per_page):
+            element_type = rng.choices(element_types, weights)[0]
+            x1 = margin + rng.randint(0, margin)
+            y1 = margin + slot * slot_height
+            x2 = page_width - margin - rng.randint(0, margin)
+            y2 = y1 + slot_height * rng.uniform(0.6, 0.95)
+            bbox = [{"coord": [float(x1), round(y1, 1), float(x2), round(y2, 1)], "page_id": page_id}]
+
+            # ページをまたぐ要素は次のページの先頭にもbboxを持つ
+            if page_id + 1 < pages and rng.random() < multi_bbox_ratio:
+                bbox.append(
+                    {"coord": [float(x1), float(margin), float(x2), round(margin + slot_height * 0.8, 1)],
+                     "page_id": page_id + 1}
+                )
+
+            element = {"id": len(elements), "type": element_type, "bbox": bbox}
+            if element_type == "table":
+                element["content"] = table_html()
+            elif element_type == "figure":
+                element["content"] = ""
+                element["description"] = words(rng.randint(10, 30))
+            elif element_type == "text":
+                element["content"] = words(rng.randint(20, 120))
+            else:
+                element["content"] = words(rng.randint(2, 10))
+            elements.append(element)
+
+    if image_dir:
+        os.makedirs(image_dir, exist_ok=True)
+        for page in page_list:
+            image = Image.new("RGB", image_size, (255, 255, 255))
+            draw = ImageDraw.Draw(image)
+            for element in elements:
+                for bbox in element["bbox"]:
+                    if bbox["page_id"] == page["id"]:
+                        draw.rectangle(bbox["coord"], fill=(225, 225, 225), outline=(160, 160, 160))
+            page["image_uri"] = os.path.join(image_dir, f"page_{page['id']:04d}.png")
+            image.save(page["image_uri"])
+
+    return {
+        "document": {"pages": page_list, "elements": elements},
+        "metadata": {"id": f"synthetic-{seed}", "version": "2.0"},
+    }
+
+
+def run_renderer_benchmarks(
+    output_path: Optional[str] = None,
+    label: Optional[str] = None,
+    repeat: int = 5,
+    document_options: Optional[Dict[str, Any]] = None,
+    show: bool = True,
+    **renderer_options,
+) -> Dict[str, Any]:
+    """合成ドキュメントを使ってレンダラーの各ステージの所要時間と出力バイト数を計測します。
+
+    表示は行わずにHTMLフラグメントを生成するだけなので、ノートブックの外でも
+    （display をスタブにした状態で）実行できます。各ベンチマークは repeat 回実行し、
+    最短時間と中央値を記録します。
+
+    ベンチマーク:
+        page_selection: ページ選択文字列の解析（1000ページのドキュメントに対して）
+        annotated_image: 全ページの注釈付き画像HTML（画像の縮小・再エンコードを含む）
+        element_list: 全ページの要素リストHTML
+        full_document: render_document が表示するドキュメント全体のHTML
+        page_navigation: インタラクティブビューアと同様に1ページずつ順にレンダリング
+
+    引数:
+        output_path: 結果を保存するJSONファイルのパス（Noneの場合は保存しない）
+        label: 結果に記録するラベル（バージョン名など）
+        repeat: 各ベンチマークの実行回数
+        document_options: generate_synthetic_parse_result に渡すオプション
+        show: 結果の表をノートブックに表示するかどうか
+        renderer_options: DocumentRendererに渡すオプション
+
+    戻り値:
+        実行環境、ドキュメント構成、ベンチマークごとの結果を持つ辞書
+    """
+    document_options = dict(document_options or {})
+
+    with tempfile.TemporaryDirectory(prefix="renderer-benchmark-") as temp_dir:
+        document_options.setdefault("image_dir", temp_dir)
+        parsed = generate_synthetic_parse_result(**document_options)
+        pages = parsed["document"]["pages"]
+        elements = parsed["document"]["elements"]
+        page_ids = [page["id"] for page in pages]
+
+        def measure(run: Callable[[Any], Union[str, List[str]]], setup: Callable[[], Any]) -> Dict[str, Any]:
+            # setup は計測に含めず、毎回新しいレンダラーで実行（キャッシュの効かない初回の描画を計測）
+            seconds = []
+            output_bytes = 0
+            for _ in range(repeat):
+                state = setup()
+                start = time.perf_counter()
+                output = run(state)
+                seconds.append(time.perf_counter() - start)
+                if isinstance(output, list):
+                    output = "".join(output)
+                output_bytes = len(output.encode("utf-8")) if output else 0
+            return {
+                "seconds": min(seconds),
+                "median_seconds": statistics.median(seconds),
+                "runs": repeat,
+                "bytes": output_bytes,
+            }
+
+        def new_renderer():
+            return DocumentRenderer(**renderer_options)
+
+        def new_indexed_renderer():
+            renderer = new_renderer()
+            return renderer, renderer._build_page_index(elements)
+
+        selections = ["all", "3", "1-5", "1,3,5", "1-3,7,10-12", "1-1000", ",".join(str(p) for p in range(1, 1001, 3))]
+
+        benchmarks = {
+            "page_selection": measure(
+                lambda renderer: [
+                    str(len(renderer._parse_page_selection(selection, 1000))) for selection in selections
+                ],
+                new_renderer,
+            ),
+            "annotated_image": measure(
+                lambda state: [
+                    state[0]._create_annotated_image(page, state[1].get(page["id"], {}).get("entries", []))
+                    for page in pages
+                ],
+                new_indexed_renderer,
+            ),
+            "element_list": measure(
+                lambda state: [
+                    state[0]._create_page_elements_list(page_id, state[1].get(page_id, {}).get("entries", []))
+                    for page_id in page_ids
+                ],
+                new_indexed_renderer,
+            ),
+            "full_document": measure(
+                lambda renderer: list(renderer.iter_render_fragments(parsed)), new_renderer
+            ),
+            "page_navigation": measure(
+                lambda renderer: [
+                    fragment
+                    for page_num in range(1, len(pages) + 1)
+                    for fragment in renderer.iter_render_fragments(parsed, page_selection=str(page_num))
+                ],
+                new_renderer,
+            ),
+        }
+
+    document_options.pop("image_dir", None)
+    results = {
+        "label": label,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "document": {**document_options, "pages": len(pages), "elements": len(elements)},
+        "renderer_options": renderer_options,
+        "benchmarks": benchmarks,
+    }
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+
+    if show:
+        rows = "".join(
+            f"<tr><td style='padding: 4px 10px;'>{name}</td>"
+            f"<td style='padding: 4px 10px; text-align: right;'>{r['seconds'] * 1000:.1f} ms</td>"
+            f"<td style='padding: 4px 10px; text-align: right;'>{r['median_seconds'] * 1000:.1f} ms</td>"
+            f"<td style='padding: 4px 10px; text-align: right;'>{r['bytes'] / 1024:.1f} KB</td></tr>"
+            for name, r in benchmarks.items()
+        )
+        display(
+            HTML(f"""
+            <div style='background: #f0f0f0; padding: 15px; border-radius: 5px; margin: 10px 0;'>
+                <strong>⏱️ レンダラーのベンチマーク</strong> {label or ''}
+                ({len(pages)} ページ, {len(elements)} 要素, {repeat} 回)
+                <table style="border-collapse: collapse; margin-top: 8px;">
+                    <tr><th style="text-align: left; padding: 4px 10px;">ベンチマーク</th><th style="padding: 4px 10px;">最短</th>
+                        <th style="padding: 4px 10px;">中央値</th><th style="padding: 4px 10px;">出力</th></tr>
+                    {rows}
+                </table>
+            </div>
+            """)
+        )
+    return results
+
+
+def compare_benchmark_results(
+    baseline: Union[str, Dict[str, Any]],
+    current: Union[str, Dict[str, Any]],
+    threshold: float = 1.1,
+    show: bool = True,
+) -> Dict[str, Dict[str, Any]]:
+    """2つのベンチマーク結果（JSONファイルのパスまたは辞書）を比較します。
+
+    引数:
+        baseline: 比較元の結果
+        current: 比較対象の結果
+        threshold: 最短時間の比（current / baseline）がこれを超えたベンチマークを退行とみなす
+        show: 比較結果の表をノートブックに表示するかどうか
+
+    戻り値:
+        ベンチマークごとの時間の比、バイト数の比、退行かどうかを持つ辞書
+    """
+
+    def load(results):
+        if isinstance(results, str):
+            with open(results, encoding="utf-8") as f:
+                return json.load(f)
+        return results
+
+    baseline, current = load(baseline), load(current)
+    comparison = {}
+    for name, current_result in current["benchmarks"].items():
+        baseline_result = baseline["benchmarks"].get(name)
+        if baseline_result is None:
+            continue
+        time_ratio = current_result["seconds"] / baseline_result["seconds"] if baseline_result["seconds"] else float("inf")
+        bytes_ratio = current_result["bytes"] / baseline_result["bytes"] if baseline_result["bytes"] else float("inf")
+        comparison[name] = {
+            "time_ratio": time_ratio,
+            "bytes_ratio": bytes_ratio,
+            "regression": time_ratio > threshold,
+        }
+
+    if show:
+        rows = "".join(
+            f"<tr><td style='padding: 4px 10px;'>{'⚠️ ' if r['regression'] else ''}{name}</td>"
+            f"<td style='padding: 4px 10px; text-align: right;'>×{r['time_ratio']:.2f}</td>"
+            f"<td style='padding: 4px 10px; text-align: right;'>×{r['bytes_ratio']:.2f}</td></tr>"
+            for name, r in comparison.items()
+        )
+        display(
+            HTML(f"""
+            <div style='background: #f0f0f0; padding: 15px; border-radius: 5px; margin: 10px 0;'>
+                <strong>📈 ベンチマークの比較:</strong> {baseline.get('label') or '比較元'} → {current.get('label') or '比較対象'}
+                <table style="border-collapse: collapse; margin-top: 8px;">
+                    <tr><th style="text-align: left; padding: 4px 10px;">ベンチマーク</th>
+                        <th style="padding: 4px 10px;">時間</th><th style="padding: 4px 10px;">出力</th></tr>
+                    {rows}
+                </table>
+            </div>
+            """)
+        )
+    return comparison
+
+# COMMAND ----------
 
+# DBTITLE 1,バッチ統計ダッシュボード
+# バッチ統計（Sparkで集計し、集計結果のみをドライバに取得）
+if batch_statistics == "on" or (batch_statistics == "auto" and parse_cache_path):
+    with pipeline_timings.stage("statistics"):
+        batch_stats = compute_batch_statistics(spark, batch_source_sql)
+    render_batch_dashboard(batch_stats)
 
 # COMMAND ----------
 
 # DBTITLE 1,デバッグの可視化結果
 # デバッグ可視化結果
-render_ai_parse_output_interactive(parsed_results)
+if ingestion_mode == "stream" and not isinstance(parsed_results, DocumentRegistry):
+    # ストリームは共有のレジストリに登録しながら読み込み、元の行は保持しない。
+    # 後続のセル（検索や書き出し）は parsed_results としてこのレジストリを再利用する
+    parsed_results = DocumentRegistry(source=parsed_results)
+navigation = render_ai_parse_output_interactive(parsed_results, timings=pipeline_timings)
@@ -0,0 +1,50 @@
+"""ノートブックの関数定義セルを読み込み、テストから利用できるようにします。"""
+
+import os
+
+import IPython.display
+import pytest
+
+NOTEBOOK_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ai-parse-document-debug.py")
+
+# Sparkやdbutilsを使わずに定義だけを読み込めるセル
+FUNCTION_CELLS = [
+    "# DBTITLE 1,解析ヘルパー関数のロード",
+    "# DBTITLE 1,デバッガー関数のロード",
+    "# DBTITLE 1,ベンチマーク関数のロード",
+]
+
+
+def load_notebook_cells(titles=FUNCTION_CELLS):
+    """ノートブックの指定したセルを1つの名前空間で実行し、その名前空間を返します。
+
+    ノートブックと同じく __main__ で定義されたものとして扱われるため、ワーカープロセスに渡す関数は
+    インポートではなく値として（cloudpickleで）渡されます。
+    """
+    with open(NOTEBOOK_PATH, encoding="utf-8") as f:
+        source = f.read()
+    namespace = {"__name__": "__main__"}
+    for title in titles:
+        start = source.index(title)
+        end = source.find("\n# COMMAND ----------", start)
+        cell = source[start : end if end >= 0 else None]
+        exec(compile(cell, NOTEBOOK_PATH, "exec"), namespace)
+    return namespace
+
+
+@pytest.fixture(scope="session")
+def notebook():
+    return load_notebook_cells()
+
+
+@pytest.fixture
+def displayed(notebook, monkeypatch):
+    """display() に渡されたHTMLを記録します。"""
+    outputs = []
+
+    def fake_display(obj, *args, **kwargs):
+        outputs.append(getattr(obj, "data", obj))
+
+    monkeypatch.setitem(notebook, "display", fake_display)
+    monkeypatch.setattr(IPython.display, "display", fake_display)
+    return outputs
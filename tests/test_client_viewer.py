@@ -0,0 +1,107 @@
+"""ブラウザ側でページを切り替えるビューアのテスト。"""
+
+import json
+import re
+
+
+def client_payload(html):
+    return json.loads(re.search(r'class="viewer-data">(.*?)</script>', html, re.S).group(1))
+
+
+def test_elements_without_content_use_fallback(notebook, displayed):
+    document = {
+        "document": {
+            "pages": [{"id": 0, "image_uri": None}],
+            "elements": [
+                {"id": 0, "type": "text", "content": "本文", "bbox": [{"coord": [10, 10, 200, 50], "page_id": 0}]},
+                {"id": 1, "type": "figure", "content": "", "bbox": [{"coord": [10, 60, 200, 90], "page_id": 0}]},
+                {"id": 2, "type": "text", "content": "  \n ", "bbox": [{"coord": [10, 100, 200, 130], "page_id": 0}]},
+            ],
+        },
+        "metadata": {"id": "client-doc"},
+    }
+    notebook["render_ai_parse_output_client"](document)
+
+    bodies = [element["body"] for element in client_payload(displayed[-1])["elements"]]
+    assert bodies == ["本文", "<em>コンテンツなし</em>", "<em>コンテンツなし</em>"]
+
+
+def test_pages_without_image_emit_no_empty_src(notebook, displayed):
+    document = {
+        "document": {
+            "pages": [{"id": 0, "image_uri": "/missing/page_0.png"}, {"id": 1, "image_uri": None}],
+            "elements": [
+                {"id": page_id, "type": "text", "content": "本文", "bbox": [{"coord": [10, 10, 200, 50], "page_id": page_id}]}
+                for page_id in range(2)
+            ],
+        },
+        "metadata": {"id": "client-doc"},
+    }
+    notebook["render_ai_parse_output_client"](document)
+    html = displayed[-1]
+
+    pages = client_payload(html)["pages"]
+    assert [page["src"] for page in pages] == [None, None]
+    assert [page["uri"] for page in pages] == ["/missing/page_0.png", ""]
+    assert 'src=""' not in html
+    # 矢印キーでページを切り替えられるよう、ビューア自体がフォーカスを受け取れる
+    assert re.search(r'<div id="client_viewer_\d+" tabindex="0">', html)
+
+
+def make_image_document(tmp_path, page_count):
+    """ノイズ画像（JPEGで圧縮しにくい）のページを page_count ページ持つドキュメント。"""
+    import numpy as np
+    from PIL import Image
+
+    pages = []
+    for page_id in range(page_count):
+        image_path = str(tmp_path / f"page_{page_id}.png")
+        pixels = np.random.default_rng(page_id).integers(0, 256, (1000, 800, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(image_path)
+        pages.append({"id": page_id, "image_uri": image_path})
+    return {
+        "document": {
+            "pages": pages,
+            "elements": [
+                {"id": page_id, "type": "text", "content": "本文", "bbox": [{"coord": [10, 10, 200, 50], "page_id": page_id}]}
+                for page_id in range(page_count)
+            ],
+        },
+        "metadata": {"id": "client-doc"},
+    }
+
+
+def test_output_budget_degrades_and_omits_pages(notebook, displayed, tmp_path):
+    document = make_image_document(tmp_path, 4)
+    notebook["render_ai_parse_output_client"](document)
+    full_page = max(len(page["src"]) for page in client_payload(displayed[-1])["pages"])
+
+    # 劣化なしでは1ページも収まらず、劣化させると2ページ分に収まる予算
+    notebook["render_ai_parse_output_client"](document, output_byte_budget=int(full_page * 0.9))
+    html = displayed[-1]
+    pages = client_payload(html)["pages"]
+
+    assert 1 <= len(pages) < 4
+    assert all(len(page["src"]) < full_page for page in pages)
+    assert "📉 出力サイズの上限" in html
+    assert "の画像や要素を劣化させました" in html
+    assert f"（ページ {len(pages) + 1} 以降）は省略しました" in html
+
+
+def test_page_images_are_loaded_in_parallel(notebook, displayed, tmp_path, monkeypatch):
+    import threading
+
+    renderer_class = notebook["DocumentRenderer"]
+    prepare = renderer_class._prepare_page_image
+    threads = []
+
+    def recording_prepare(self, image_uri, source=None):
+        threads.append(threading.current_thread().name)
+        return prepare(self, image_uri, source)
+
+    monkeypatch.setattr(renderer_class, "_prepare_page_image", recording_prepare)
+    notebook["render_ai_parse_output_client"](make_image_document(tmp_path, 3), image_workers=3)
+
+    assert len(threads) == 3
+    assert all(name.startswith("page-image") for name in threads)
+    assert len(client_payload(displayed[-1])["pages"]) == 3
@@ -0,0 +1,36 @@
+"""要素リストのテスト。"""
+
+import json
+import re
+
+
+def make_entries(renderer, count):
+    table = "<table>" + "".join(f"<tr><td>row {i}</td></tr>" for i in range(30)) + "</table>"
+    elements = [
+        {"id": i, "type": "table" if i % 2 else "text", "content": table if i % 2 else f"text {i}",
+         "bbox": [{"coord": [10, 10 + i, 200, 50 + i], "page_id": 0}]}
+        for i in range(count)
+    ]
+    return renderer._get_page_index(elements)[0]["entries"]
+
+
+def test_default_renders_every_card_without_script(notebook):
+    renderer = notebook["DocumentRenderer"]()
+    html = renderer._create_page_elements_list(0, make_entries(renderer, 300))
+
+    assert renderer.element_list_window is None
+    assert "<script" not in html
+    assert "text 298" in html
+    assert html.count("… 他 20 行") == 150
+
+
+def test_windowed_list_includes_each_card_body_once(notebook):
+    renderer = notebook["DocumentRenderer"](element_list_window=4)
+    html = renderer._create_page_elements_list(0, make_entries(renderer, 10))
+
+    records = json.loads(
+        re.search(r'class="element-data">(.*?)</script>', html, re.S).group(1).replace("<\\/", "</")
+    )["records"]
+    assert [record[3] is None for record in records] == [True] * 4 + [False] * 6
+    # 5つのテーブルのプレビューは描画済みのカードとレコードのどちらか一方にだけ含まれる
+    assert html.count("row 0</td>") + html.count("row 0<\\/td>") == 5
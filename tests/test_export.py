@@ -0,0 +1,41 @@
+"""バッチのHTML書き出しのテスト。"""
+
+import json
+
+
+def test_export_decodes_documents_in_workers_only(notebook, tmp_path, monkeypatch):
+    registry = notebook["DocumentRegistry"](max_decoded=0)
+    for seed in range(3):
+        registry.add(json.dumps(notebook["generate_synthetic_parse_result"](pages=1, elements_per_page=3, seed=seed)))
+
+    # 親プロセスではドキュメントのJSONを展開しない（ワーカーはspawnした別プロセスで展開する）
+    payload_json = notebook["DocumentRegistry"].payload_json
+    parent_calls = []
+
+    def counting_payload_json(payload):
+        parent_calls.append(payload[0])
+        return payload_json(payload)
+
+    monkeypatch.setattr(notebook["DocumentRegistry"], "payload_json", staticmethod(counting_payload_json))
+    monkeypatch.setitem(notebook, "display", lambda *args, **kwargs: None)
+
+    exported = notebook["export_batch_html"](registry, str(tmp_path), max_workers=2)
+
+    assert [item["index"] for item in exported] == [0, 1, 2]
+    assert all((tmp_path / item["file"]).exists() for item in exported)
+    assert parent_calls == []
+
+
+def test_export_escapes_document_names(notebook, tmp_path, monkeypatch):
+    class Row:
+        path = "/Volumes/in/<b>&co.pdf"
+        parsed_json = json.dumps(notebook["generate_synthetic_parse_result"](pages=1, elements_per_page=2))
+
+    monkeypatch.setitem(notebook, "display", lambda *args, **kwargs: None)
+    [item] = notebook["export_batch_html"]([Row()], str(tmp_path), max_workers=1)
+
+    index_html = (tmp_path / "index.html").read_text(encoding="utf-8")
+    document_html = (tmp_path / item["file"]).read_text(encoding="utf-8")
+    assert "&lt;b&gt;&amp;co.pdf</a>" in index_html
+    assert "<title>&lt;b&gt;&amp;co.pdf</title>" in document_html
+    assert "<b>&co" not in index_html + document_html
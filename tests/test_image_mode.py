@@ -0,0 +1,39 @@
+"""ページ画像の出力モードのテスト。"""
+
+from PIL import Image
+
+
+def encode_page(renderer, tmp_path):
+    image_path = str(tmp_path / "page_0.png")
+    Image.new("RGB", (400, 500), (255, 255, 255)).save(image_path)
+    return renderer._prepare_page_image(image_path)["encoded"]
+
+
+def test_inline_is_the_default(notebook, tmp_path):
+    encoded = encode_page(notebook["DocumentRenderer"](), tmp_path)
+    assert encoded["src"].startswith("data:image/jpeg;base64,")
+    assert not encoded["external"]
+
+
+def test_external_without_base_url_stays_inline(notebook, tmp_path, capsys):
+    export_dir = str(tmp_path / "images")
+    renderer = notebook["DocumentRenderer"](image_mode="external", image_export_dir=export_dir)
+    encoded = encode_page(renderer, tmp_path)
+
+    # 書き出し先のファイルパスをsrcにしない（ブラウザから取得できない）
+    assert renderer.image_mode == "inline"
+    assert encoded["src"].startswith("data:")
+    assert "image_base_url" in capsys.readouterr().out
+
+
+def test_external_uses_explicit_base_url(notebook, tmp_path):
+    export_dir = tmp_path / "images"
+    renderer = notebook["DocumentRenderer"](
+        image_mode="external", image_export_dir=str(export_dir), image_base_url="https://files.example.com/pages/"
+    )
+    encoded = encode_page(renderer, tmp_path)
+
+    assert encoded["external"]
+    file_name = encoded["src"].rsplit("/", 1)[1]
+    assert encoded["src"] == f"https://files.example.com/pages/{file_name}"
+    assert (export_dir / file_name).exists()
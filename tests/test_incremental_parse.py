@@ -0,0 +1,92 @@
+"""解析結果キャッシュ（incremental_parse）のテスト。ai_parse_document はスタブに置き換えます。"""
+
+import os
+import time
+
+import pytest
+
+pyspark = pytest.importorskip("pyspark")
+
+
+@pytest.fixture(scope="module")
+def spark():
+    from pyspark.sql import SparkSession
+
+    try:
+        session = (
+            SparkSession.builder.master("local[1]")
+            .appName("incremental-parse-test")
+            .config("spark.ui.enabled", "false")
+            .config("spark.sql.shuffle.partitions", "1")
+            .getOrCreate()
+        )
+    except Exception as e:
+        pytest.skip(f"ローカルのSparkSessionを起動できません: {e}")
+    yield session
+    session.stop()
+
+
+def stub_parser(calls):
+    """解析したファイルのパスを記録し、内容をそのまま parsed_json として返すスタブ。"""
+
+    def parse(files_df):
+        from pyspark.sql import functions as F
+
+        calls.append(sorted(os.path.basename(row.path) for row in files_df.select("path").collect()))
+        return files_df.select(
+            "path", "length", "modificationTime", F.col("content").cast("string").alias("parsed_json")
+        )
+
+    return parse
+
+
+def write_file(directory, name, text):
+    path = directory / name
+    path.write_text(text)
+    return path
+
+
+def parse_results(notebook, spark, input_dir, cache_dir, calls, options=None):
+    df = notebook["incremental_parse"](
+        spark,
+        str(input_dir / "*.pdf"),
+        str(cache_dir),
+        options or {"version": "2.0"},
+        parse_fn=stub_parser(calls),
+        cache_format="parquet",
+    )
+    return {os.path.basename(row.path): row.parsed_json for row in df.collect()}
+
+
+def test_only_new_or_changed_files_are_parsed(notebook, spark, tmp_path):
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    cache_dir = tmp_path / "parse_cache"
+    write_file(input_dir, "a.pdf", "a-1")
+    changed = write_file(input_dir, "b.pdf", "b-1")
+    calls = []
+
+    assert parse_results(notebook, spark, input_dir, cache_dir, calls) == {"a.pdf": "a-1", "b.pdf": "b-1"}
+    assert calls == [["a.pdf", "b.pdf"]]
+
+    # 変更のないファイルはキャッシュから返し、解析しない
+    assert parse_results(notebook, spark, input_dir, cache_dir, calls) == {"a.pdf": "a-1", "b.pdf": "b-1"}
+    assert calls == [["a.pdf", "b.pdf"]]
+
+    # 変更されたファイルと新しいファイルだけを解析する
+    changed.write_text("b-2 changed")
+    os.utime(changed, (time.time() + 10, time.time() + 10))
+    write_file(input_dir, "c.pdf", "c-1")
+    results = parse_results(notebook, spark, input_dir, cache_dir, calls)
+    assert results == {"a.pdf": "a-1", "b.pdf": "b-2 changed", "c.pdf": "c-1"}
+    assert calls[1:] == [["b.pdf", "c.pdf"]]
+
+    # 解析オプションが変わった場合はすべて解析し直す
+    parse_results(notebook, spark, input_dir, cache_dir, calls, options={"version": "2.0", "descriptionElementTypes": "*"})
+    assert calls[2:] == [["a.pdf", "b.pdf", "c.pdf"]]
+
+
+def test_parser_options_are_escaped_in_sql(notebook, spark):
+    options = {"imageOutputPath": "/Volumes/o'brien/x", "note": "back\\slash"}
+    row = spark.sql(f"SELECT {notebook['build_parser_options_sql'](options)} AS options").collect()[0]
+    assert row.options == options
@@ -0,0 +1,68 @@
+"""出力予算による劣化段階のテスト。"""
+
+from PIL import Image
+
+
+def make_document(tmp_path, text_length=2000, table_rows=20):
+    image_path = str(tmp_path / "page_0.png")
+    Image.new("RGB", (800, 1000), (255, 255, 255)).save(image_path)
+    table = "<table>" + "".join(f"<tr><td>row {i}</td></tr>" for i in range(table_rows)) + "</table>"
+    return {
+        "document": {
+            "pages": [{"id": 0, "image_uri": image_path}],
+            "elements": [
+                {"id": 0, "type": "text", "content": "x" * text_length,
+                 "bbox": [{"coord": [10, 10, 400, 100], "page_id": 0}]},
+                {"id": 1, "type": "table", "content": table,
+                 "bbox": [{"coord": [10, 200, 400, 600], "page_id": 0}]},
+            ],
+        },
+        "metadata": {"id": "budget-doc"},
+    }
+
+
+def render_page(renderer, document, budget):
+    elements = document["document"]["elements"]
+    page = document["document"]["pages"][0]
+    entries = renderer._get_page_index(elements)[0]["entries"]
+    return renderer._render_page_within_budget(page, 0, entries, budget)
+
+
+def test_degradation_truncates_tooltips_and_table_previews(notebook, tmp_path):
+    document = make_document(tmp_path)
+    renderer = notebook["DocumentRenderer"](overlay_mode="css")
+
+    # 劣化なしのレンダリングで要素ごとのフラグメントをキャッシュさせる
+    annotated_html, list_html, level, _ = render_page(renderer, document, None)
+    assert level == 0
+    assert "x" * 500 + "..." in annotated_html
+    assert "… 他 10 行" in annotated_html
+
+    # ツールチップとプレビューを切り詰める段階まで劣化させる
+    truncate_level = next(
+        i + 1 for i, (overrides, _) in enumerate(renderer.degradation_levels) if "tooltip_max_chars" in overrides
+    )
+    degraded = renderer._degraded_renderer(truncate_level)
+    entries = renderer._get_page_index(document["document"]["elements"])[0]["entries"]
+    tooltip = degraded._render_entry_content(entries[0], for_tooltip=True)
+    assert tooltip == "x" * 150 + "..."
+    table_list = degraded._render_entry_content(entries[1])
+    assert table_list.count("<tr>") == 3
+    assert "… 他 17 行" in table_list
+
+    # 劣化なしのレンダラーのキャッシュは変わらない
+    assert renderer._render_entry_content(entries[0], for_tooltip=True) == "x" * 500 + "..."
+
+
+def test_budget_applies_truncation_to_rendered_page(notebook, tmp_path):
+    document = make_document(tmp_path)
+    renderer = notebook["DocumentRenderer"](overlay_mode="css")
+    render_page(renderer, document, None)
+
+    annotated_html, list_html, level, _ = render_page(renderer, document, 1)
+    assert level == len(renderer.degradation_levels)
+    assert "x" * 151 not in annotated_html
+    assert "x" * 150 + "..." in annotated_html
+    # ツールチップのテーブルのプレビューも切り詰められる（要素リストは最後の段階で省略）
+    assert "… 他 17 行" in annotated_html
+    assert "省略されました" in list_html
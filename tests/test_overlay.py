@@ -0,0 +1,14 @@
+"""バウンディングボックスのオーバーレイのテスト。"""
+
+
+def test_default_overlay_uses_css_hover_without_script(notebook, tmp_path):
+    document = notebook["generate_synthetic_parse_result"](pages=1, elements_per_page=3, image_dir=str(tmp_path))
+    renderer = notebook["DocumentRenderer"]()
+    page = document["document"]["pages"][0]
+    entries = renderer._get_page_index(document["document"]["elements"])[0]["entries"]
+    html = renderer._create_annotated_image(page, entries)
+
+    assert renderer.overlay_mode == "css"
+    assert ":hover" in html
+    assert "<svg" not in html
+    assert "<script" not in html
@@ -0,0 +1,71 @@
+"""ページ選択のテスト。"""
+
+import re
+
+SELECTION = "1-3,7,10-12"
+
+
+def make_document(page_ids, total_pages):
+    """ページIDが page_ids のページだけを持つドキュメント（query_mode="pages" の結果と同じ形）。"""
+    elements = [
+        {"id": page_id, "type": "text", "content": f"page {page_id + 1}",
+         "bbox": [{"coord": [10, 10, 200, 50], "page_id": page_id}]}
+        for page_id in page_ids
+    ]
+    return {
+        "document": {
+            "pages": [{"id": page_id, "image_uri": None} for page_id in page_ids],
+            "elements": elements,
+            "page_count": total_pages,
+        },
+        "metadata": {"id": "pushdown-doc"},
+    }
+
+
+def rendered_pages(html):
+    return [int(number) for number in re.findall(r"📋 ページ (\d+) の要素", html)]
+
+
+def test_pushed_down_document_renders_all_selected_pages(notebook):
+    # Spark側で "1-3,7,10-12" に絞り込んだ12ページのドキュメント
+    document = make_document([0, 1, 2, 6, 9, 10, 11], total_pages=12)
+    renderer = notebook["DocumentRenderer"]()
+    html = "".join(renderer.iter_render_fragments(document, SELECTION))
+
+    assert rendered_pages(html) == [1, 2, 3, 7, 10, 11, 12]
+    assert "ページ 1, 2, 3, 7, 10, 11, 12 (7 of 12)" in html
+    assert "選択されたページの要素:</strong> 7" in html
+
+
+def test_pushed_down_single_page_counts_its_elements(notebook):
+    document = make_document([6], total_pages=12)
+    renderer = notebook["DocumentRenderer"]()
+    html = "".join(renderer.iter_render_fragments(document, "7"))
+
+    assert rendered_pages(html) == [7]
+    assert "選択されたページの要素:</strong> 1" in html
+
+
+def test_last_pages_use_original_page_count(notebook):
+    document = make_document([9, 10, 11], total_pages=12)
+    renderer = notebook["DocumentRenderer"]()
+    assert renderer._parse_page_selection("-2", 12, document["document"]["pages"]) == [1, 2]
+
+
+def test_full_document_selection_is_unchanged(notebook):
+    document = make_document(list(range(12)), total_pages=12)
+    del document["document"]["page_count"]
+    renderer = notebook["DocumentRenderer"]()
+    html = "".join(renderer.iter_render_fragments(document, SELECTION))
+
+    assert rendered_pages(html) == [1, 2, 3, 7, 10, 11, 12]
+    assert "(7 of 12)" in html
+
+
+def test_last_zero_pages_is_rejected(notebook, capsys):
+    selection = notebook["PageSelection"]("-0")
+    assert selection.ranges == []
+    assert "ページ選択 '-0' が無効です" in capsys.readouterr().out
+
+    selection = notebook["PageSelection"]("--3,2")
+    assert selection.ranges == [(2, 2)]
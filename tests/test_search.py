@@ -0,0 +1,41 @@
+"""全文検索ビューのテスト。"""
+
+import json
+
+
+def find_widgets(widget, class_name):
+    found = [widget] if type(widget).__name__ == class_name else []
+    for child in getattr(widget, "children", ()):
+        found.extend(find_widgets(child, class_name))
+    return found
+
+
+def test_opening_another_hit_shuts_down_previous_viewer(notebook, displayed, monkeypatch):
+    documents = [
+        json.dumps(notebook["generate_synthetic_parse_result"](pages=3, elements_per_page=4, seed=seed))
+        for seed in range(2)
+    ]
+    query = notebook["generate_synthetic_parse_result"](pages=1, elements_per_page=1, seed=0)
+    query = query["document"]["elements"][0]["content"][:6]
+
+    viewers = []
+    render_viewer = notebook["render_ai_parse_output_interactive"]
+
+    def recording_viewer(*args, **kwargs):
+        viewers.append(render_viewer(*args, **kwargs))
+        return viewers[-1]
+
+    monkeypatch.setitem(notebook, "render_ai_parse_output_interactive", recording_viewer)
+    notebook["render_ai_parse_search"](documents, query=query, prefetch_workers=1)
+    search_box = next(output for output in displayed if hasattr(output, "children"))
+    results = find_widgets(search_box, "Select")[0]
+    assert len(results.options) >= 2
+
+    results.value = results.options[0][1]
+    results.value = results.options[1][1]
+
+    assert len(viewers) == 2
+    previous_prefetcher = viewers[0].close_fn.__self__
+    assert previous_prefetcher._executor._shutdown
+    assert not viewers[1].close_fn.__self__._executor._shutdown
+    viewers[1].close()
@@ -0,0 +1,38 @@
+"""ステージ別所要時間の表示のテスト。"""
+
+
+class FakeHandle:
+    def __init__(self, outputs, position):
+        self.outputs = outputs
+        self.position = position
+
+    def update(self, obj):
+        self.outputs[self.position] = obj.data
+
+
+def test_render_document_updates_summary_output_with_static_timings(notebook, monkeypatch):
+    outputs = []
+
+    def fake_display(obj, display_id=None):
+        outputs.append(obj.data)
+        return FakeHandle(outputs, len(outputs) - 1) if display_id else None
+
+    monkeypatch.setitem(notebook, "display", fake_display)
+    document = notebook["generate_synthetic_parse_result"](pages=2, elements_per_page=3)
+    notebook["DocumentRenderer"]().render_document(document)
+
+    summary = next(output for output in outputs if "ドキュメント要約" in output)
+    assert "⏱️ デコード" in summary
+    # 別の出力からスクリプトで書き換える要素は残っていない
+    assert "stage_timings_" not in "".join(outputs)
+    assert "計測中" not in summary
+
+
+def test_cached_fragments_carry_no_timings(notebook):
+    document = notebook["generate_synthetic_parse_result"](pages=2, elements_per_page=3)
+    fragments = list(notebook["DocumentRenderer"]().iter_render_fragments(document, "1"))
+
+    summary = next(fragment for fragment in fragments if isinstance(fragment, notebook["SummaryFragment"]))
+    assert "⏱️" not in summary
+    assert "⏱️ デコード" in summary.with_timings("⏱️ デコード <strong>0.01s</strong>")
+    assert "stage_timings_" not in "".join(fragments)
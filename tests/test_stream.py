@@ -0,0 +1,52 @@
+"""ストリーミングモードの解析結果のテスト。"""
+
+import json
+
+
+def make_rows(notebook, count, fetched):
+    documents = [
+        json.dumps(notebook["generate_synthetic_parse_result"](pages=2, elements_per_page=3, seed=seed))
+        for seed in range(count)
+    ]
+
+    def rows():
+        for document in documents:
+            fetched.append(document)
+            yield document
+
+    return documents, rows()
+
+
+def test_registry_replays_stream_without_keeping_rows(notebook):
+    fetched = []
+    documents, rows = make_rows(notebook, 3, fetched)
+    timings = notebook["StageTimings"]()
+    registry = notebook["DocumentRegistry"](source=timings.iter_timed(rows, "collect"))
+
+    assert registry.pending
+    first = next(registry.iter_headers())
+    assert first["index"] == 0 and len(fetched) == 1
+
+    assert [header["index"] for header in registry.iter_headers()] == [0, 1, 2]
+    assert [header["index"] for header in registry.iter_headers()] == [0, 1, 2]
+    assert not registry.pending
+    # 元のイテレータの各行は1回だけ取得・計測され、レジストリには圧縮したJSONだけが残る
+    assert fetched == documents
+    assert [rec["document"] for rec in timings.to_records()] == [0, 1, 2]
+    assert all(kind == "zlib" for kind, _ in registry._payloads)
+    assert [registry.raw_json(i) for i in range(3)] == documents
+
+
+def test_viewer_streams_into_registry_that_later_cells_reuse(notebook, displayed):
+    fetched = []
+    documents, rows = make_rows(notebook, 3, fetched)
+    registry = notebook["DocumentRegistry"](source=rows)
+
+    navigation = notebook["render_ai_parse_output_interactive"](registry, prefetch_workers=0)
+    index = notebook["DocumentSearchIndex"](registry)
+
+    assert navigation.doc_idx == 0
+    assert index.registry is registry
+    assert len(registry) == 3
+    assert fetched == documents
+    assert len(registry._decoded) <= registry.max_decoded
@@ -0,0 +1,65 @@
+"""テーブルのプレビューのテスト。"""
+
+
+def make_table(rows, upper=False):
+    table = "<table><tr><th>番号</th><th>値</th></tr>" + "".join(
+        f"<tr><td>row {i}</td><td>{i * 10}</td></tr>" for i in range(rows)
+    ) + "</table>"
+    return table.upper() if upper else table
+
+
+def table_element(content):
+    return {"id": 0, "type": "table", "content": content}
+
+
+def test_large_table_output_keeps_only_preview(notebook):
+    content = make_table(3000)
+    renderer = notebook["DocumentRenderer"]()
+    html = renderer._render_element_content(table_element(content), for_tooltip=False)
+
+    assert "row 2999" not in html
+    assert html.count("<tr>") == renderer.table_preview_rows
+    assert "… 他 2991 行" in html
+    assert len(html) < 5000
+
+
+def test_large_table_links_external_file(notebook, tmp_path):
+    content = make_table(3000)
+    renderer = notebook["DocumentRenderer"](
+        image_mode="external", image_export_dir=str(tmp_path), image_base_url="images"
+    )
+    html = renderer._render_element_content(table_element(content), for_tooltip=False)
+
+    assert "row 2999" not in html
+    [exported] = list(tmp_path.iterdir())
+    assert f'href="images/{exported.name}"' in html
+    assert "row 2999" in exported.read_text(encoding="utf-8")
+
+
+def test_preview_counts_uppercase_rows(notebook):
+    preview = notebook["DocumentRenderer"]()._get_table_preview(make_table(3000, upper=True))
+    assert preview["truncated"]
+    assert preview["row_count"] == 3001
+    assert preview["column_count"] == 2
+    assert preview["preview"].lower().endswith("</table>")
+
+
+def test_preview_does_not_count_nested_rows(notebook):
+    nested = "<table><tr><td>a</td></tr><tr><td>b</td></tr></table>"
+    content = "<table>" + "".join(f"<tr><td>{i}</td><td>{nested}</td></tr>" for i in range(5000)) + "</table>"
+    preview = notebook["DocumentRenderer"]()._get_table_preview(content)
+
+    assert preview["row_count"] == 5000
+    assert preview["preview"].endswith("</td></tr></table>")
+
+
+def test_preview_off_renders_whole_table_without_parsing(notebook, monkeypatch):
+    content = make_table(3000)
+    renderer = notebook["DocumentRenderer"](table_preview_rows=None)
+
+    def fail(_content):
+        raise AssertionError("プレビューを無効にしている場合はテーブルを解析しない")
+
+    monkeypatch.setattr(renderer, "_get_table_preview", fail)
+    html = renderer._render_element_content(table_element(content), for_tooltip=False)
+    assert renderer._style_table_html(content, for_tooltip=False) in html